@@ -1,6 +1,8 @@
-from django.db import models, connection
+from django.db import models, connection, transaction
 from django.db.models import Max
+from django.utils.translation import gettext_lazy as _
 from user.models import User, Institution
+from device.product_cache import ProductCache
 from django.core.exceptions import ValidationError
 
 class State(models.Model):
@@ -17,7 +19,46 @@ class State(models.Model):
 
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            ProductCache.update_states(self.institution, [self.snapshot_uuid])
+
+    @classmethod
+    def bulk_change(cls, institution, user, state, snapshot_uuids):
+        """Move every evidence in ``snapshot_uuids`` to ``state``.
+
+        The state is validated once, the previous states are read in one
+        query and the State and DeviceLog rows are inserted together in
+        one transaction. Returns the previous state of each uuid (None
+        when it had none).
+        """
+        cls(institution=institution, state=state).clean()
+
+        uuids = list(dict.fromkeys(snapshot_uuids))
+        previous = dict.fromkeys(uuids)
+        for uuid, prev in cls.objects.filter(
+            snapshot_uuid__in=uuids
+        ).order_by('date', 'pk').values_list('snapshot_uuid', 'state'):
+            previous[uuid] = prev
+
+        with transaction.atomic():
+            cls.objects.bulk_create([
+                cls(snapshot_uuid=uuid, state=state, user=user, institution=institution)
+                for uuid in uuids
+            ])
+            DeviceLog.objects.bulk_create([
+                DeviceLog(
+                    snapshot_uuid=uuid,
+                    event=_("<Created> State '{}'. Previous State: '{}'").format(
+                        state, prev or _("None")
+                    ),
+                    user=user,
+                    institution=institution,
+                )
+                for uuid, prev in previous.items()
+            ])
+            ProductCache.update_states(institution, uuids)
+        return previous
 
     def __str__(self):
         return f"{self.institution.name} - {self.state} - {self.snapshot_uuid}"
@@ -1,3 +1,76 @@
+import uuid
+from unittest.mock import patch
+
+from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-# Create your tests here.
+from action.models import State, StateDefinition, DeviceLog
+from api.models import Token
+from evidence.models import SystemProperty
+from user.models import Institution, User
+
+
+class BulkStateChangeTests(TestCase):
+    """State.bulk_change moves many evidences to a state with a fixed number
+    of queries, whatever the number of devices."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        self.user = User.objects.create_user(
+            email="admin@example.com", institution=self.institution,
+            password="testpass123",
+        )
+        for state in ("Received", "Repaired"):
+            StateDefinition.objects.create(
+                institution=self.institution, state=state)
+        self.uuids = [uuid.uuid4() for _ in range(3)]
+
+    def test_previous_states_and_logs(self):
+        State.objects.create(snapshot_uuid=self.uuids[0], state="Received",
+                             institution=self.institution)
+
+        with self.assertNumQueries(7):
+            previous = State.bulk_change(
+                self.institution, self.user, "Repaired", self.uuids)
+
+        self.assertEqual(previous, {
+            self.uuids[0]: "Received", self.uuids[1]: None, self.uuids[2]: None,
+        })
+        self.assertEqual(
+            State.objects.filter(state="Repaired", user=self.user).count(), 3)
+        events = DeviceLog.objects.filter(
+            snapshot_uuid=self.uuids[0]).values_list("event", flat=True)
+        self.assertEqual(
+            list(events),
+            ["<Created> State 'Repaired'. Previous State: 'Received'"])
+
+    def test_unknown_state_changes_nothing(self):
+        with self.assertRaises(ValidationError):
+            State.bulk_change(self.institution, self.user, "Lost", self.uuids)
+        self.assertFalse(State.objects.exists())
+        self.assertFalse(DeviceLog.objects.exists())
+
+    def test_api_changes_state_of_valid_devices(self):
+        with patch("evidence.models.ProductCache.schedule"):
+            SystemProperty.objects.create(
+                owner=self.institution, uuid=self.uuids[0],
+                key="ereuse24", value="ereuse24:abc")
+        token = Token.objects.create(tag="scanner", token=uuid.uuid4(),
+                                     owner=self.user)
+        auth = {"HTTP_AUTHORIZATION": "Bearer {}".format(token.token)}
+        url = "/api/v1/devices/bulk-state/"
+
+        response = self.client.post(
+            url, {"device_ids": ["ereuse24:abc", "ereuse24:nope"],
+                  "state": "Repaired"},
+            content_type="application/json", **auth)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()["processed_ids"], ["ereuse24:abc"])
+        self.assertEqual(response.json()["invalid_ids"], ["ereuse24:nope"])
+        self.assertEqual(
+            State.objects.get(snapshot_uuid=self.uuids[0]).state, "Repaired")
+
+        response = self.client.post(
+            url, {"device_ids": ["ereuse24:abc"], "state": "Lost"},
+            content_type="application/json", **auth)
+        self.assertEqual(response.status_code, 400)
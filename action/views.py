@@ -9,7 +9,6 @@ from django.utils.translation import gettext_lazy as _
 from dashboard.mixins import DashboardView
 from django.http import HttpResponseRedirect, Http404
 from action.models import State, StateDefinition, Note, DeviceLog
-from device.models import Device
 
 
 class ChangeStateView(LoginRequiredMixin, FormView):
@@ -50,29 +49,18 @@ class BulkStateChangeView(DashboardView, View):
     def get(self, request, *args, **kwargs):
         state_id = self.kwargs.get('pk')
         new_state = StateDefinition.objects.filter(id=state_id).first().state
-        selected_devices = self.get_session_devices()
+        selected_devices = self.get_session_device_refs()
 
         if not selected_devices:
             messages.error(request, _("No devices selected"))
             return self.get_success_url()
         try:
-            for dev in selected_devices:
-
-                message = _("<Created> State '{}'. Previous State: '{}'").format(new_state, dev.get_current_state().state if dev.get_current_state() else _("None") )
-                State.objects.create(
-                    snapshot_uuid=dev.last_uuid(),
-                    state=new_state,
-                    user=self.request.user,
-                    institution=self.request.user.institution,
-                )
-
-                DeviceLog.objects.create(
-                    snapshot_uuid=dev.last_uuid(),
-                    event=message,
-                    user=self.request.user,
-                    institution=self.request.user.institution,
-                )
-
+            State.bulk_change(
+                self.request.user.institution,
+                self.request.user,
+                new_state,
+                [dev.latest_uuid for dev in selected_devices],
+            )
             messages.success(request,_("State changed Successfully"))
 
         except Exception as e:
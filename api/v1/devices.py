@@ -3,16 +3,17 @@ import logging
 from ninja import Router, Query
 from ninja.errors import HttpError
 from django.db import IntegrityError
+from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
 from evidence.models import UserProperty, RootAlias, SystemProperty
-from device.models import Device, ProductCache
-from action.models import DeviceLog
+from device.models import Device, DeviceRef, ProductCache
+from action.models import DeviceLog, State
 
 from api.auth import GlobalAuth
-from api.v1.schemas import MessageOut, SuccessResponse, PropertyIn, DeviceWithLogsOut, BulkPropertyIn, OperationResult, DeviceListResponse
+from api.v1.schemas import MessageOut, SuccessResponse, PropertyIn, DeviceWithLogsOut, BulkPropertyIn, BulkStateIn, OperationResult, DeviceListResponse
 
-from api.v1.utils import get_device_instance, check_valid_ids, get_all_search_results, build_device_response_list, build_bulk_device_export_dict
+from api.v1.utils import get_device_instance, check_valid_ids, get_all_search_results, build_device_response_list, SEARCH_SORT_PATTERN, build_bulk_device_export_dict
 
 
 logger = logging.getLogger('django')
@@ -175,6 +176,45 @@ def bulk_assign_properties(request, data: BulkPropertyIn):
         raise HttpError(500, "Internal server error")
 
 
+@router.post(
+    "/bulk-state/",
+    response={200: OperationResult, 207: OperationResult, 400: MessageOut, 403: MessageOut, 422: MessageOut},
+    summary=_("Bulk change the state of devices"),
+    description=_("""
+    Moves multiple devices to one of the institution's states in a single operation,
+    e.g. when a warehouse scanner reads a batch of labels.
+
+    Accepts partial hashes, short IDs, or exact aliases. Ambiguous identifiers are rejected.
+
+    Returns:
+    - 200: State changed on all devices
+    - 207: Partial success (some identifiers were invalid/ambiguous or have no evidence)
+    - 400: The state is not defined for the institution
+    - 422: No valid devices provided
+    """),
+    tags=["Devices"],
+    auth=GlobalAuth()
+)
+def bulk_change_state(request, data: BulkStateIn):
+    user = request.auth
+    institution = user.institution
+
+    valid_ids, invalid_ids = check_valid_ids(data.device_ids, institution)
+    refs = DeviceRef.resolve_many(institution, valid_ids)
+    invalid_ids |= valid_ids - {ref.root for ref in refs}
+    if not refs: raise HttpError(422, "No valid device IDs provided")
+
+    try:
+        State.bulk_change(institution, user, data.state, [ref.latest_uuid for ref in refs])
+    except ValidationError as e:
+        raise HttpError(400, " ".join(e.messages))
+
+    return (200 if not invalid_ids else 207), OperationResult(
+        success=True, processed_ids=[ref.root for ref in refs], invalid_ids=list(invalid_ids),
+        message="Some IDs were invalid or ambiguous" if invalid_ids else f"State '{data.state}' successfully applied."
+    )
+
+
 @router.get(
     "/",
     response={200: DeviceListResponse, 403: MessageOut},
@@ -188,6 +228,7 @@ def bulk_assign_properties(request, data: BulkPropertyIn):
 def list_all_devices(
     request,
     q: str = Query(None, description="Optional search query (ShortID or Text)"),
+    sort: str = Query(None, pattern=SEARCH_SORT_PATTERN, description="Order text search matches by date, type or manufacturer instead of relevance; prefix with - for descending"),
     prop_key: str = Query(None, description="Filter by UserProperty key"),
     prop_value: str = Query(None, description="Filter by UserProperty value"),
     page: int = Query(1, ge=1, description="Page number"),
@@ -206,7 +247,7 @@ def list_all_devices(
 
     # search
     if q and q.strip():
-        search_ids = get_all_search_results(q.strip(), institution)
+        search_ids = get_all_search_results(q.strip(), institution, sort=sort)
         chids_ordered = [x for x in search_ids if (valid_ids_set is None or x in valid_ids_set)]
     else:
         cache_qs = ProductCache.objects.filter(owner=institution).order_by('-last_updated')
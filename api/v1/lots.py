@@ -3,15 +3,17 @@ import logging
 import math
 from ninja import Router, Query
 from ninja.errors import HttpError
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models import Exists, OuterRef
 from django.utils.translation import gettext_lazy as _
 
-from lot.models import DeviceLot
 from evidence.models import UserProperty
+from lot.models import DeviceLot
 from api.auth import GlobalAuth
 from api.v1.schemas import DeviceIDInput, LotDevicesResponse, MessageOut, OperationResult
 
-from api.v1.utils import find_lot, check_valid_ids, get_all_search_results, build_device_response_list
+from api.v1.utils import find_lot, check_valid_ids, keyset_page, search_q, build_device_response_list, SEARCH_SORT_PATTERN
 from device.models import ProductCache
 
 logger = logging.getLogger('django')
@@ -19,7 +21,7 @@ router = Router(tags=["Lots"])
 
 @router.get(
     "/{lot_id}/devices/",
-    response={200: LotDevicesResponse, 404: MessageOut},
+    response={200: LotDevicesResponse, 400: MessageOut, 404: MessageOut},
     summary=_("Retrieve devices in a lot"),
     description=_("""Get all devices belonging to a specific lot.
 
@@ -27,8 +29,14 @@ router = Router(tags=["Lots"])
     - Its numeric ID (e.g., #1)
     - Its name (e.g., "donante-orgA")
 
+    Devices are paged by `page`, or, for walking large lots, by passing the
+    `next_cursor` of the previous response as `cursor`. Cursor pages do not
+    count the whole lot, so their totals are null. Search matches are
+    ordered by `sort`, not by relevance.
+
     Returns:
     - 200 - Lot details (ID, name, description, etc.) and list of all devices with their technical specifications
+    - 400 - Invalid cursor
     - 404 - Lot not found
     """),
     tags=["Lots"],
@@ -37,11 +45,13 @@ router = Router(tags=["Lots"])
 def retrieveLotDevices(
     request,
     lot_id: str,
-    q: str = Query(None, description="Optional search query (ShortID or Text)"),
+    q: str = Query(None, description="Optional search query: ShortID, CHID or alias, evidence full text, or terms that all match the device hardware, state or user properties"),
+    sort: str = Query("-date", pattern=SEARCH_SORT_PATTERN, description="Order by date, type or manufacturer; prefix with - for descending"),
     prop_key: str = Query(None, description="Filter by UserProperty key"),
     prop_value: str = Query(None, description="Filter by UserProperty value"),
     page: int = Query(1, ge=1, description="Page number"),
-    size: int = Query(50, ge=1, le=50, description="Items per page")
+    cursor: str = Query(None, description="next_cursor of the previous page; takes precedence over page"),
+    size: int = Query(50, ge=1, le=settings.API_MAX_PAGE_SIZE, description="Items per page")
 ):
     user = request.auth
     institution = user.institution
@@ -50,41 +60,41 @@ def retrieveLotDevices(
     if not lot:
         raise HttpError(404, "Lot not found for your institution")
 
-    valid_ids_set = set(lot.devicelot_set.values_list("device_id", flat=True))
+    devices = ProductCache.objects.filter(
+        owner=institution,
+        root__in=DeviceLot.objects.filter(lot=lot).values("device_id"),
+    )
 
     # apply filters
     if prop_key or prop_value:
-        prop_qs = UserProperty.objects.filter(owner=institution, device_id__in=valid_ids_set, type=UserProperty.Type.USER)
-        if prop_key: prop_qs = prop_qs.filter(key=prop_key)
-        if prop_value: prop_qs = prop_qs.filter(value=prop_value)
-        valid_ids_set = valid_ids_set.intersection(prop_qs.values_list("device_id", flat=True))
+        props = UserProperty.objects.filter(owner=institution, device_id=OuterRef("root"), type=UserProperty.Type.USER)
+        if prop_key: props = props.filter(key=prop_key)
+        if prop_value: props = props.filter(value=prop_value)
+        devices = devices.filter(Exists(props))
 
     if q and q.strip():
-        search_ids = get_all_search_results(q.strip(), institution)
-        chids_ordered = [x for x in search_ids if x in valid_ids_set]
-    else:
-        chids_ordered = list(ProductCache.objects.filter(root__in=valid_ids_set).order_by('-last_updated').values_list('root', flat=True))
+        devices = devices.filter(search_q(q.strip(), institution))
 
-    total_items = len(chids_ordered)
-    total_pages = math.ceil(total_items / size) if total_items > 0 else 1
+    lot_info = {"id": lot.pk, "name": lot.name, "code": lot.code, "archived": lot.archived, "created": lot.created, "updated": lot.updated, "description": lot.description}
 
-    if total_items == 0 or page > total_pages:
-        return LotDevicesResponse(
-            lot={"id": lot.pk, "name": lot.name, "code": lot.code, "archived": lot.archived, "created": lot.created, "updated": lot.updated, "description": lot.description},
-            pagination={"total_items": total_items, "total_pages": total_pages, "current_page": page, "page_size": size},
-            devices=[]
-        )
-
-    # slice and then fetch data
-    offset = (page - 1) * size
-    chids_page = chids_ordered[offset : offset + size]
+    if cursor:
+        rows, next_cursor = keyset_page(devices, sort, size, cursor)
+        pagination = {"total_items": None, "total_pages": None, "current_page": None, "page_size": size}
+    else:
+        total_items = devices.count()
+        total_pages = math.ceil(total_items / size) if total_items > 0 else 1
+        pagination = {"total_items": total_items, "total_pages": total_pages, "current_page": page, "page_size": size}
+        if total_items == 0 or page > total_pages:
+            return LotDevicesResponse(lot=lot_info, pagination=pagination, devices=[], next_cursor=None)
+        rows, next_cursor = keyset_page(devices, sort, size, offset=(page - 1) * size)
 
-    devices_export = build_device_response_list(chids_page, institution, lot)
+    devices_export = build_device_response_list([row.root for row in rows], institution, lot)
 
     return LotDevicesResponse(
-        lot={"id": lot.pk, "name": lot.name, "code": lot.code, "archived": lot.archived, "created": lot.created, "updated": lot.updated, "description": lot.description},
-        pagination={"total_items": total_items, "total_pages": total_pages, "current_page": page, "page_size": size},
-        devices=devices_export
+        lot=lot_info,
+        pagination=pagination,
+        devices=devices_export,
+        next_cursor=next_cursor,
     )
 
 @router.post(
@@ -119,11 +129,7 @@ def assignLotDevices(request, lot_id: str, data: DeviceIDInput):
         valid_ids, invalid_ids = check_valid_ids(data.device_ids, user.institution)
         if not valid_ids: raise HttpError(422, "No valid device IDs provided")
 
-        existing_devices = set(lot.devicelot_set.filter(device_id__in=valid_ids).values_list('device_id', flat=True))
-        unassigned_ids = valid_ids - existing_devices
-
-        if unassigned_ids:
-            DeviceLot.objects.bulk_create([DeviceLot(lot=lot, device_id=did) for did in unassigned_ids], ignore_conflicts=True)
+        lot.add_many(valid_ids)
 
         return (200 if not invalid_ids else 207), OperationResult(
             success=True, processed_ids=list(valid_ids), invalid_ids=list(invalid_ids),
@@ -161,11 +167,7 @@ def remove_devices_from_lot(request, lot_id: str, data: DeviceIDInput):
         valid_ids, invalid_ids = check_valid_ids(data.device_ids, user.institution)
         if not valid_ids: raise HttpError(422, "No valid device IDs provided")
 
-        existing_devices = set(lot.devicelot_set.filter(device_id__in=valid_ids).values_list('device_id', flat=True))
-        devices_to_remove = valid_ids & existing_devices
-
-        if devices_to_remove:
-            lot.devicelot_set.filter(device_id__in=devices_to_remove).delete()
+        lot.remove_many(valid_ids)
 
         return (200 if not invalid_ids else 207), OperationResult(
             success=True, processed_ids=list(valid_ids), invalid_ids=list(invalid_ids),
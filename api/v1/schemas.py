@@ -11,9 +11,9 @@ from evidence.models import UserProperty
 
 
 class PaginationOut(BaseModel):
-    total_items: int = Field(..., description=str(_("Total number of items across all pages")))
-    total_pages: int = Field(..., description=str(_("Total number of pages")))
-    current_page: int = Field(..., description=str(_("Current page number")))
+    total_items: Optional[int] = Field(..., description=str(_("Total number of items across all pages, null on cursor pages")))
+    total_pages: Optional[int] = Field(..., description=str(_("Total number of pages, null on cursor pages")))
+    current_page: Optional[int] = Field(..., description=str(_("Current page number, null on cursor pages")))
     page_size: int = Field(..., description=str(_("Number of items per page")))
 
 
@@ -146,6 +146,7 @@ class LotDevicesResponse(BaseModel):
     lot: LotInfo = Field(..., description=str(_("Lot information")))
     pagination: PaginationOut = Field(..., description=str(_("Pagination metadata")))
     devices: List[DeviceResponse] = Field(..., description=str(_("List of devices in this lot")))
+    next_cursor: Optional[str] = Field(None, description=str(_("Cursor of the next page, null on the last one")))
 
 
 class MessageOut(BaseModel):
@@ -262,6 +263,51 @@ class SnapshotResponse(BaseModel):
     )
 
 
+class BulkSnapshotResult(BaseModel):
+    line: Optional[int] = Field(
+        None,
+        description=str(_("Line of the snapshot in the uploaded stream")),
+        example=1
+    )
+    uuid: Optional[str] = Field(
+        None,
+        description=str(_("Snapshot UUID, if it could be read")),
+        example="b5a8b2b5-6d5c-4e0e-9e44-6b1f2c3d4e5f"
+    )
+    status: str = Field(
+        ...,
+        description=str(_("created, duplicate, invalid or error")),
+        example="created"
+    )
+    dhid: Optional[str] = Field(
+        None,
+        description=str(_("DeviceHub identifier (short code) of a created snapshot")),
+        example="0FCDC8"
+    )
+    details: Optional[str] = Field(
+        None,
+        description=str(_("Why the snapshot was not created")),
+        example=str(_t("UUID repeated in this upload"))
+    )
+
+
+class BulkSnapshotResponse(BaseModel):
+    status: str = Field(
+        ...,
+        description=str(_("success if every snapshot was created, partial otherwise")),
+        example="success"
+    )
+    summary: Dict[str, int] = Field(
+        ...,
+        description=str(_("Number of snapshots per status")),
+        example={"created": 2, "duplicate": 0, "invalid": 0, "error": 0}
+    )
+    results: List[BulkSnapshotResult] = Field(
+        ...,
+        description=str(_("One status per snapshot, in upload order"))
+    )
+
+
 class DeviceLogOut(Schema):
     event: str = Field(
         ...,
@@ -312,3 +358,16 @@ class BulkPropertyIn(Schema):
         example="12-months",
         description=str(_("The value to assign to the property across all specified devices"))
     )
+
+
+class BulkStateIn(Schema):
+    device_ids: List[str] = Field(
+        ...,
+        example=["ereuse24:50d7033117...", "0FCDC8"],
+        description=str(_("List of device identifiers (can be full hashes, short IDs, or custom aliases)"))
+    )
+    state: str = Field(
+        ...,
+        example="Repaired",
+        description=str(_("Name of one of the institution's state definitions"))
+    )
@@ -10,14 +10,17 @@ from django.utils.translation import gettext_lazy as _
 from utils.save_snapshots import move_json, save_in_disk
 from evidence.models import SystemProperty
 from evidence.parse import Build
+from evidence.ingest import SnapshotStream
 from device.models import Device
-from .schemas import SnapshotResponse, MessageOut
+from .schemas import SnapshotResponse, BulkSnapshotResponse, MessageOut
 from api.auth import GlobalAuth
 
 logger = logging.getLogger('django')
 
 router = Router(tags=["Snapshot"])
 
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
 @router.post(
     "/",
     response={
@@ -62,7 +65,7 @@ def NewSnapshot(request, data: dict = Body(..., description="Paste the raw workb
         }
 
     try:
-        Build(data, None, check=True)
+        build = Build(data, user, check=True)
     except Exception as e:
         logger.warning("Snapshot validation failed: %s", str(e))
         return 422, {
@@ -86,7 +89,8 @@ def NewSnapshot(request, data: dict = Body(..., description="Paste the raw workb
         return 409, {"error": "Snapshot already exists", "details": f"UUID {ev_uuid} is already registered"}
 
     try:
-        Build(data, user)
+        # stores the snapshot parsed above instead of parsing it again
+        build.save()
     except Exception as err:
         if settings.DEBUG:
             logger.exception("%s", err)
@@ -127,3 +131,45 @@ def NewSnapshot(request, data: dict = Body(..., description="Paste the raw workb
         "public_url": url_public
     }
     return response
+
+
+@router.post(
+    "/bulk/",
+    response={
+        200: BulkSnapshotResponse,
+        207: BulkSnapshotResponse,
+        415: MessageOut,
+    },
+    summary=_("Process many device snapshots"),
+    description=_("""
+    Upload workbench snapshots as NDJSON (Content-Type: application/x-ndjson),
+    one JSON snapshot per line. The body is read as a stream: each snapshot
+    is validated on arrival and the valid ones are stored in batches.
+
+    Returns a status per snapshot: created, duplicate, invalid or error.
+    - 200: Success - Every snapshot was created
+    - 207: Partial success - Some snapshots were not created
+    - 415: Unsupported Media Type - The body is not NDJSON
+    """),
+    tags=["Snapshots"],
+    url_name="upload_snapshots_bulk",
+    auth=GlobalAuth()
+)
+def BulkSnapshots(request):
+    if request.content_type not in NDJSON_CONTENT_TYPES:
+        return 415, {
+            "error": "Unsupported media type",
+            "details": "Send one JSON snapshot per line as application/x-ndjson"
+        }
+
+    stream = SnapshotStream(request.auth)
+    # iterating the request reads the body line by line, never whole
+    results = stream.ingest_lines(request)
+    summary = stream.summary()
+
+    created = summary[SnapshotStream.CREATED]
+    return (200 if created == len(results) else 207), {
+        "status": "success" if created == len(results) else "partial",
+        "summary": summary,
+        "results": results,
+    }
@@ -1,14 +1,15 @@
 import re
 import json
+import base64
 import logging
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils.dateparse import parse_datetime
 from ninja.errors import HttpError
 
 from lot.models import Lot, DeviceBeneficiary
 from evidence.models import RootAlias, SystemProperty, UserProperty
 from device.models import Device, ProductCache
-from action.models import State
-from evidence.xapian import search
+from evidence.xapian import search, search_devices
 
 logger = logging.getLogger('django')
 
@@ -151,22 +152,30 @@ def search_shortid_ids(query_str, institution):
     return ids
 
 
-def get_xapian_results(query_str, institution, offset, limit):
-    """Returns (xapian_count, list_of_canonical_roots_in_page)"""
+# ?sort= of the search endpoints: an index value slot, "-" for descending
+SEARCH_SORT_PATTERN = r"^-?(date|type|manufacturer)$"
+
+
+def get_xapian_results(query_str, institution, offset, limit, sort=None):
+    """Returns (xapian_count, list_of_canonical_roots_in_page).
+
+    ``sort`` orders the page by an index value slot (see
+    evidence.xapian.VALUE_SLOTS) instead of relevance.
+    """
     if not search:
         return 0, []
 
-    matches = search(institution, query_str, 0, 9999)
-    if not matches:
+    # one query for the page and the (estimated beyond
+    # DEVICEHUB_SEARCH_EXACT_COUNT) number of devices matching
+    page_matches = search(
+        institution, query_str, offset, max(0, limit), sort=sort,
+        collapse=True,
+    )
+    if not page_matches:
         return 0, []
 
-    total_count = matches.size()
-
-    if limit <= 0:
-        return total_count, []
-
-    page_matches = search(institution, query_str, offset, limit)
-    if not page_matches or page_matches.size() == 0:
+    total_count = page_matches.get_matches_estimated()
+    if page_matches.size() == 0:
         return total_count, []
 
     uuids = []
@@ -199,10 +208,10 @@ def get_xapian_results(query_str, institution, offset, limit):
 
     return total_count, ordered_roots
 
-def get_all_search_results(query_str, institution):
+def get_all_search_results(query_str, institution, sort=None):
     """Returns a fully ordered, combined list of all device root IDs matching a search string."""
     sp_ids = search_shortid_ids(query_str, institution)
-    _, xapian_page = get_xapian_results(query_str, institution, 0, 9999)
+    _, xapian_page = get_xapian_results(query_str, institution, 0, 9999, sort=sort)
 
     seen = set(sp_ids)
     combined = list(sp_ids)
@@ -213,10 +222,119 @@ def get_all_search_results(query_str, institution):
     return combined
 
 
+def get_xapian_roots(query_str, institution):
+    """Canonical roots of the devices whose evidences match ``query_str``.
+
+    Bounded to DEVICEHUB_SEARCH_EXACT_COUNT devices and read from their
+    device value slot alone, resolved to roots in one RootAlias query.
+    """
+    values = search_devices(institution, query_str)
+    alias_map = dict(
+        RootAlias.objects.filter(owner=institution, alias__in=values)
+        .values_list("alias", "root")
+    )
+    return [alias_map.get(v, v) for v in values]
+
+
+def search_q(query_str, institution):
+    """Q over ProductCache rows of devices matching ``query_str``.
+
+    A device matches by ShortID, full CHID or alias, by the Xapian full
+    text of its evidences (component models, serials... see
+    get_xapian_roots), or when every term is in its search_text, current
+    state or user properties. The row filter then runs in SQL with the
+    rest of the query.
+    """
+    matches = Q()
+    for term in query_str.lower().split():
+        props = UserProperty.objects.filter(
+            owner=institution, device_id=OuterRef("root"), type=UserProperty.Type.USER,
+        ).filter(Q(key__icontains=term) | Q(value__icontains=term))
+        matches &= (
+            Q(search_text__contains=term) | Q(current_state__icontains=term) | Q(Exists(props))
+        )
+    roots = search_shortid_ids(query_str, institution)
+    roots += get_xapian_roots(query_str, institution)
+    return Q(root__in=roots) | matches
+
+
+# keyset pagination - - -
+
+# ?sort= of the lot devices endpoint -> ProductCache column
+KEYSET_SORT_COLUMNS = {
+    "date": "last_updated",
+    "type": "type",
+    "manufacturer": "manufacturer",
+}
+
+
+def encode_cursor(sort, value, root):
+    """Opaque cursor pointing after the row with sort ``value`` and ``root``
+    in the ``sort`` order."""
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, root]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor, sort):
+    """(value, root) of ``cursor``; it must come from a page in ``sort``
+    order, as its value means nothing in another one."""
+    try:
+        cursor_sort, value, root = json.loads(
+            base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HttpError(400, "Invalid cursor")
+    if cursor_sort != sort:
+        raise HttpError(400, "Cursor does not match the sort order")
+    if not isinstance(root, str):
+        raise HttpError(400, "Invalid cursor")
+    column = KEYSET_SORT_COLUMNS[sort.lstrip("-")]
+    if column == "last_updated" and value is not None:
+        value = parse_datetime(value)
+    return value, root
+
+
+def keyset_page(qs, sort, size, cursor=None, offset=0):
+    """The ``size`` ProductCache rows of ``qs`` after ``cursor``.
+
+    Rows are ordered by the ``sort`` column (see KEYSET_SORT_COLUMNS, "-"
+    for descending), nulls last, then by root, so a page is one index range
+    scan however deep it is. ``offset`` serves plain page numbers. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    descending = sort.startswith("-")
+    column = KEYSET_SORT_COLUMNS[sort.lstrip("-")]
+    col = qs.model._meta.get_field(column)
+
+    if cursor:
+        value, root = decode_cursor(cursor, sort)
+        after = "lt" if descending else "gt"
+        if value is None:
+            qs = qs.filter(**{f"{column}__isnull": True, f"root__{after}": root})
+        else:
+            qs = qs.filter(
+                Q(**{f"{column}__{after}": value})
+                | Q(**{column: value, f"root__{after}": root})
+                | Q(**{f"{column}__isnull": True})
+            )
+
+    if descending:
+        qs = qs.order_by(F(column).desc(nulls_last=True), "-root")
+    else:
+        qs = qs.order_by(F(column).asc(nulls_last=True), "root")
+    rows = list(qs[offset:offset + size + 1])
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, encode_cursor(sort, getattr(last, col.attname), last.root)
+
+
 # bulk orm queries - - -
 
 def fetch_bulk_device_data(chids_page, institution, lot=None):
-    """Executes the 4 heavy SQL queries required for export payloads in bulk."""
+    """Executes the relational SQL queries required for export payloads in bulk."""
 
     #user properties
     user_props_qs = UserProperty.objects.filter(owner=institution, device_id__in=chids_page)
@@ -229,22 +347,7 @@ def fetch_bulk_device_data(chids_page, institution, lot=None):
     dev_bens = DeviceBeneficiary.objects.filter(device_id__in=chids_page, beneficiary__lot=lot) if lot else DeviceBeneficiary.objects.filter(device_id__in=chids_page)
     ben_map = {db.device_id: str(DeviceBeneficiary.Status(db.status).label) for db in dev_bens}
 
-    # states
-    aliases_qs = RootAlias.objects.filter(owner=institution, root__in=chids_page).values_list('alias', 'root')
-    alias_to_root = {alias: root for alias, root in aliases_qs}
-
-    sp_qs = SystemProperty.objects.filter(owner=institution, value__in=alias_to_root.keys()).order_by('-created').values_list('value', 'uuid')
-    latest_uuids = {}
-    for alias, uuid in sp_qs:
-        root = alias_to_root.get(alias)
-        if root and root not in latest_uuids:
-            latest_uuids[root] = uuid
-
-    states_qs = State.objects.filter(snapshot_uuid__in=latest_uuids.values()).order_by('-date')
-    uuid_to_state = {state.snapshot_uuid: state.state for state in states_qs}
-    state_map = {root: str(uuid_to_state.get(uuid, "")) for root, uuid in latest_uuids.items()}
-
-    return props_map, ben_map, default_ben_status, state_map
+    return props_map, ben_map, default_ben_status
 
 def build_bulk_device_export_dict(cache, state_str, ben_status_str, user_props_dict):
     """Standardizes dictionary construction."""
@@ -272,7 +375,7 @@ def build_device_response_list(chids_page, institution, lot=None):
     cached_qs = ProductCache.objects.filter(owner=institution, root__in=chids_page)
     cache_map = {cache.root: cache for cache in cached_qs}
 
-    props_map, ben_map, default_ben_status, state_map = fetch_bulk_device_data(chids_page, institution, lot)
+    props_map, ben_map, default_ben_status = fetch_bulk_device_data(chids_page, institution, lot)
 
     devices_export = []
     for root_id in chids_page:
@@ -280,7 +383,7 @@ def build_device_response_list(chids_page, institution, lot=None):
         if cache:
             devices_export.append(build_bulk_device_export_dict(
                 cache=cache,
-                state_str=state_map.get(root_id, ""),
+                state_str=cache.current_state or "",
                 ben_status_str=ben_map.get(root_id, default_ben_status),
                 user_props_dict=props_map.get(root_id, {})
             ))
@@ -5,11 +5,10 @@ from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.base import TemplateView
-from device.models import Device
+from device.models import Device, DeviceRef
 from device.product_cache import ProductCache
-from evidence.models import SystemProperty, RootAlias
 from lot.models import LotTag
-from action.models import StateDefinition, State
+from action.models import StateDefinition
 from dashboard.tables import DeviceTable, AllDevicesTable
 from django_tables2 import RequestConfig, SingleTableView
 from django.utils.dateparse import parse_datetime
@@ -54,30 +53,23 @@ class DashboardView(LoginRequiredMixin):
         })
         return context
 
-    def get_session_devices(self):
+    def get_session_device_refs(self):
+        """Pop the selected devices from the session as DeviceRefs: root
+        and latest uuid of each, in a fixed number of queries."""
         dev_ids = self.request.session.pop("devices", [])
+        self._devices = DeviceRef.resolve_many(
+            self.request.user.institution, dev_ids
+        )
+        return self._devices
 
-        self._devices = []
-
-        custom_ids = [d for d in dev_ids if d.startswith("custom_id:")]
-        regular_ids = [d for d in dev_ids if not d.startswith("custom_id:")]
-
-        if custom_ids:
-            root_aliases = RootAlias.objects.filter(
-                root__in=custom_ids,
-                owner=self.request.user.institution
-            ).order_by("-updated")
-            seen_roots = set()
-            for ra in root_aliases:
-                if ra.root not in seen_roots:
-                    seen_roots.add(ra.root)
-                    regular_ids.append(ra.alias)
-
-        dev_ids_list = SystemProperty.objects.filter(value__in=regular_ids)
-        dev_org = dev_ids_list.filter(owner=self.request.user.institution)
-        dev_org_set = set(x.value for x in dev_org)
-        for x in dev_org_set:
-            self._devices.append(Device(id=x))
+    def get_session_devices(self):
+        """Like get_session_device_refs but as full Devices, for the views
+        that read their evidence (labels)."""
+        institution = self.request.user.institution
+        self._devices = [
+            Device(id=ref.root, owner=institution, uuid=ref.latest_uuid)
+            for ref in self.get_session_device_refs()
+        ]
         return self._devices
 
 
@@ -231,9 +223,9 @@ class ProductCacheTableMixin():
     """Device list table backed by the ProductCache read model.
 
     Same column structure as the lot table (LotDashboardView) but for the
-    All Devices / Inbox lists: rows come from ProductCache plus a fixed
-    number of batched relational queries for current_state, with no per-device
-    Device construction (and thus no Xapian read/parse per row). Subclasses
+    All Devices / Inbox lists: rows, current state included, come from
+    ProductCache in one query, with no per-device Device construction (and
+    thus no Xapian read/parse per row). Subclasses
     implement get_device_ids() to pick which canonical roots, in what order,
     and the page slice. The beneficiary column is lot-scoped, so it is excluded
     here (these lists are not bound to a single lot).
@@ -249,6 +241,7 @@ class ProductCacheTableMixin():
         "type": "type",
         "manufacturer": "manufacturer",
         "model": "model",
+        "current_state": "current_state",
         "last_updated": "last_updated",
     }
 
@@ -281,52 +274,15 @@ class ProductCacheTableMixin():
                  else col.asc(nulls_last=True))
         return qry.order_by(order, "root")
 
-    def _batch_product_cache_state(self, root_ids):
-        """Batch the projection rows and current state for ``root_ids``
-        (canonical roots) in a fixed number of queries, resolving evidence
-        aliases. No Xapian. Returns (projections_by_root, state_by_root)."""
-        institution = self.request.user.institution
-
+    def build_product_cache_rows(self, root_ids):
         projections = {
             p.root: p for p in ProductCache.objects.filter(
-                owner=institution, root__in=root_ids)
+                owner=self.request.user.institution, root__in=root_ids)
         }
-
-        # alias -> root, plus the full physical-id set, in one query.
-        alias_to_root = {}
-        alias_ids = set(root_ids)
-        for ra in RootAlias.objects.filter(
-            owner=institution, root__in=root_ids
-        ).values('alias', 'root'):
-            alias_to_root[ra['alias']] = ra['root']
-            alias_ids.add(ra['alias'])
-
-        # newest evidence uuid per root (across its physical aliases).
-        root_latest_uuid = {}
-        for sp in SystemProperty.objects.filter(
-            owner=institution, value__in=alias_ids
-        ).order_by('-created').values('value', 'uuid'):
-            root = alias_to_root.get(sp['value'], sp['value'])
-            root_latest_uuid.setdefault(root, sp['uuid'])
-
-        # current state per root via its latest uuid.
-        uuid_to_root = {uuid: root for root, uuid in root_latest_uuid.items()}
-        state_by_root = {}
-        for st in State.objects.filter(
-            snapshot_uuid__in=root_latest_uuid.values()
-        ).order_by('-date').values('snapshot_uuid', 'state'):
-            root = uuid_to_root.get(st['snapshot_uuid'])
-            if root is not None:
-                state_by_root.setdefault(root, st['state'])
-
-        return projections, state_by_root
-
-    def build_product_cache_rows(self, root_ids):
-        projections, state_by_root = self._batch_product_cache_state(root_ids)
         rows = []
         for did in root_ids:
             p = projections.get(did)
-            state = state_by_root.get(did)
+            state = p.current_state if p else None
             rows.append({
                 'id': did,
                 'link_pk': did,
@@ -198,23 +198,8 @@ class ProductCacheTable(DeviceTable):
 
 
 class AllDevicesTable(ProductCacheTable):
-    """ProductCacheTable for the All Devices / Inbox lists. current_state
-    is not orderable here: it is not a ProductCache column, so it cannot be
-    ordered at the DB level (see ProductCacheTableMixin.SORTABLE_FIELDS), and
-    these lists are paginated in the database to avoid materialising every
-    device. Without a header arrow there is no misleading control that does not
-    actually sort. The lot view keeps it orderable, sorting in Python."""
-
-    current_state = tables.Column(
-        accessor='current_state',
-        verbose_name=_("Current State"),
-        attrs={
-            'th': {'class': 'text-center'},
-            'td': {'class': 'text-muted text-center'}
-        },
-        default="N/A",
-        orderable=False,
-    )
+    """ProductCacheTable for the All Devices / Inbox lists, which are sorted
+    and paginated in the database by ProductCacheTableMixin."""
 
     class Meta(ProductCacheTable.Meta):
         pass
@@ -386,6 +386,15 @@ class ProductCacheDeviceListTests(TestCase):
         root_ids, _ = view.get_device_ids()
         self.assertEqual(root_ids, ["ereuse24:bbbbbb", "ereuse24:aaaaaa"])
 
+    def test_sort_by_current_state_puts_devices_without_state_last(self):
+        self._set_projection("ereuse24:aaaaaa", current_state="Repaired")
+        self._set_projection("ereuse24:bbbbbb", current_state=None)
+
+        for sort in ("current_state", "-current_state"):
+            view = self._view(AllDevicesView, sort=sort)
+            root_ids, _ = view.get_device_ids()
+            self.assertEqual(root_ids, ["ereuse24:aaaaaa", "ereuse24:bbbbbb"])
+
     def test_unknown_sort_keeps_default_latest_order(self):
         # default order is -latest: the most recently seen root comes first
         # (bbbbbb's SystemProperty was created after aaaaaa's in setUp).
@@ -396,7 +405,7 @@ class ProductCacheDeviceListTests(TestCase):
 
 class LotSortTests(TestCase):
     """LotDashboardView orders its rows from the ProductCache columns in
-    Python (lots are bounded). type/manufacturer/model are sortable like the
+    SQL before slicing a page. type/manufacturer/model are sortable like the
     All Devices / Inbox lists; the user sort replaces the default
     -last_updated order."""
 
@@ -450,10 +459,109 @@ class LotSortTests(TestCase):
             ["ereuse24:bbbbbb", "ereuse24:aaaaaa"])
 
 
+class LotSqlSearchTests(TestCase):
+    """The lot search runs in SQL: ``term:field`` tokens, bare terms over
+    every field and user properties, relational columns and the page
+    slice."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        self.user = User.objects.create(
+            email="u@test.local", institution=self.institution)
+        self.tag = LotTag.objects.create(name="t", owner=self.institution)
+        self.lot = Lot.objects.create(
+            name="L", owner=self.institution, type=self.tag)
+        self.uuids = {}
+        projections = {
+            "ereuse24:aaaaaa": {"manufacturer": "Samsung", "model": "Galaxy"},
+            "ereuse24:bbbbbb": {"manufacturer": "Dell", "model": "Samsung Edition",
+                                "data": {"ram_total": "16 GB"}},
+            "ereuse24:cccccc": {"manufacturer": "HP", "model": "Elitebook"},
+        }
+        for root, fields in projections.items():
+            sp = SystemProperty.objects.create(
+                owner=self.institution, uuid=uuidlib.uuid4(), value=root)
+            self.uuids[root] = sp.uuid
+            self.lot.add(root)
+            ProductCache.objects.update_or_create(
+                owner=self.institution, root=root, defaults=fields)
+
+    def _row_ids(self, **params):
+        req = RequestFactory().get("/", params)
+        req.user = self.user
+        view = LotDashboardView()
+        view.request = req
+        view.kwargs = {"pk": self.lot.pk}
+        view.object = self.lot
+        return [r['id'] for r in view.get_table_data()]
+
+    def test_search_text_is_kept_on_save(self):
+        row = ProductCache.objects.get(root="ereuse24:bbbbbb")
+        self.assertIn("samsung edition", row.search_text)
+        self.assertIn("16 gb", row.search_text)
+
+    def test_field_term_only_matches_that_field(self):
+        self.assertEqual(
+            self._row_ids(lquery="samsung:manufacturer"), ["ereuse24:aaaaaa"])
+        self.assertEqual(
+            sorted(self._row_ids(lquery="samsung")),
+            ["ereuse24:aaaaaa", "ereuse24:bbbbbb"])
+        self.assertEqual(self._row_ids(lquery="16:total_ram"), ["ereuse24:bbbbbb"])
+        self.assertEqual(self._row_ids(lquery="samsung:nofield"), [])
+
+    def test_terms_match_state_status_and_user_properties(self):
+        StateDefinition.objects.create(
+            institution=self.institution, state="Repaired", order=1)
+        State.objects.create(
+            institution=self.institution, user=self.user,
+            state="Repaired", snapshot_uuid=self.uuids["ereuse24:cccccc"])
+        shop = LotSubscription.objects.create(
+            lot=self.lot, user=self.user, type=LotSubscription.Type.SHOP)
+        b = Beneficiary.objects.create(
+            lot=self.lot, shop=shop, email="b@test.local")
+        DeviceBeneficiary.objects.create(
+            beneficiary=b, device_id="ereuse24:aaaaaa",
+            status=DeviceBeneficiary.Status.CONFIRMED)
+        UserProperty.objects.create(
+            owner=self.institution, device_id="ereuse24:bbbbbb",
+            key="color", value="blue", type=UserProperty.Type.USER)
+
+        self.assertEqual(self._row_ids(lquery="repaired"), ["ereuse24:cccccc"])
+        self.assertEqual(
+            self._row_ids(lquery="confirmed:status_beneficiary"),
+            ["ereuse24:aaaaaa"])
+        self.assertEqual(self._row_ids(lquery="blue"), ["ereuse24:bbbbbb"])
+        self.assertEqual(
+            self._row_ids(sort="-current_state"),
+            ["ereuse24:cccccc", "ereuse24:aaaaaa", "ereuse24:bbbbbb"])
+
+    def test_devices_without_beneficiary_sort_first_with_available(self):
+        shop = LotSubscription.objects.create(
+            lot=self.lot, user=self.user, type=LotSubscription.Type.SHOP)
+        b = Beneficiary.objects.create(
+            lot=self.lot, shop=shop, email="b@test.local")
+        DeviceBeneficiary.objects.create(
+            beneficiary=b, device_id="ereuse24:aaaaaa",
+            status=DeviceBeneficiary.Status.INTERESTED)
+        DeviceBeneficiary.objects.create(
+            beneficiary=b, device_id="ereuse24:bbbbbb",
+            status=DeviceBeneficiary.Status.AVAILABLE)
+
+        self.assertEqual(
+            self._row_ids(sort="status_beneficiary"),
+            ["ereuse24:bbbbbb", "ereuse24:cccccc", "ereuse24:aaaaaa"])
+
+    def test_page_is_sliced_after_sorting(self):
+        self.assertEqual(
+            self._row_ids(sort="manufacturer", limit=1, page=2),
+            ["ereuse24:cccccc"])
+
+
 def _fake_xapian_search(ordered_uuids):
     """Build a stand-in for ``evidence.xapian.search``: an ``(institution,
-    qs, offset, limit) -> matches`` callable backed by a fixed, relevance
-    ordered list of uuids, so tests never touch a real Xapian database."""
+    qs, offset, limit, sort) -> matches`` callable backed by a fixed, relevance
+    ordered list of uuids, so tests never touch a real Xapian database. The
+    matches report the size of the whole list, as an MSet does."""
 
     class _FakeDocument:
         def __init__(self, data):
@@ -470,7 +578,11 @@ def _fake_xapian_search(ordered_uuids):
         def size(self):
             return len(self)
 
-    def fake_search(institution, qs, offset=0, limit=10):
+        def get_matches_estimated(self):
+            return len(ordered_uuids)
+
+    def fake_search(institution, qs, offset=0, limit=10, sort=None,
+                    check_at_least=None, collapse=False):
         page = ordered_uuids[offset:offset + limit]
         return _FakeMSet(_FakeMatch(u) for u in page)
 
@@ -577,6 +689,17 @@ class SearchViewGqueryTests(TestCase):
             [d.pk for d in devices],
             ["ereuse24:acme12", "ereuse24:zzzxxx", "ereuse24:yyyxxx"])
 
+    def test_page_and_count_come_from_one_search(self):
+        fake_search = _fake_xapian_search(
+            [self.top_sp.uuid, self.second_sp.uuid])
+        view = self._view(gquery="acme")
+        with patch("dashboard.views.search", side_effect=fake_search) as s:
+            devices, total = view.get_devices(self.user, 1, 1)
+
+        s.assert_called_once()
+        self.assertEqual(total, 3)
+        self.assertEqual([d.pk for d in devices], ["ereuse24:zzzxxx"])
+
     def test_old_search_param_name_returns_nothing(self):
         view = self._view(search="acme")
         with patch("dashboard.views.search", side_effect=_fake_xapian_search([])):
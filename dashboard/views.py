@@ -19,8 +19,9 @@ from django_tables2.views import SingleTableMixin
 from django_tables2.export.export import TableExport
 from django_tables2.export.views import ExportMixin
 
-from action.models import StateDefinition, State
-from django.db.models import Q, Subquery, OuterRef
+from action.models import StateDefinition
+from django.db.models import Exists, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 
 from dashboard.mixins import InventaryMixin, DetailsMixin, DeviceTableMixin, ProductCacheTableMixin
 from evidence.models import SystemProperty, RootAlias, UserProperty
@@ -147,43 +148,30 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
         return context
 
     def get_table_data(self):
-        search = self.request.GET.get('lquery', '').lower()
-        chids = list(self._get_chids_qs())
+        search = self.request.GET.get('lquery', '')
+        sort = self.request.GET.get('sort', '-last_updated')
 
-        # Both paths read the ProductCache read model (no per-device Device
-        # construction, and thus no Xapian read/parse per row). Search just
-        # narrows the canonical roots before the shared sort + pagination.
+        # Search, sort and pagination run in SQL over the ProductCache read
+        # model; rows are then built for the page only (no per-device Device
+        # construction, and thus no Xapian read/parse per row).
+        devices = self._lot_devices(search, sort)
+        count = devices.count()
         if search:
-            device_ids = self._search_roots(chids, search)
-            self._search_count = len(device_ids)
+            self._search_count = count
         else:
-            device_ids = chids
-            self._total_count = len(device_ids)
+            self._total_count = count
 
-        if not device_ids:
+        if not count:
             return []
 
-        rows_by_id, sort_keys = self._build_table_rows(device_ids)
-
-        sort_param = self.request.GET.get('sort', '-last_updated')
-        reverse = sort_param.startswith('-')
-        sort_field = sort_param.lstrip('-')
-
-        def get_sort_val(did):
-            keys = sort_keys[did]
-            if sort_field in keys:
-                return keys[sort_field]
-            return rows_by_id[did]['shortid']  # shortid fallback
-
-        none_ids = [did for did in device_ids if get_sort_val(did) is None]
-        val_ids  = [did for did in device_ids if get_sort_val(did) is not None]
-        sorted_ids = sorted(val_ids, key=get_sort_val, reverse=reverse) + none_ids
-
         limit = int(self.request.GET.get('limit', self.paginate_by))
         page  = int(self.request.GET.get('page', 1))
         offset = (page - 1) * limit if limit else 0
-        page_ids = sorted_ids[offset:offset + limit] if limit else sorted_ids
+        if limit:
+            devices = devices[offset:offset + limit]
+        page_ids = [row['device_id'] for row in devices]
 
+        rows_by_id = self._build_table_rows(page_ids)
         return [rows_by_id[did] for did in page_ids]
 
     def get_table_kwargs(self):
@@ -214,27 +202,65 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
                 pk=self.kwargs['pk'],
                 owner=self.request.user.institution,
             )
-        chids = list(self._get_chids_qs())
-        search = self.request.GET.get('lquery', '').lower()
-        if search:
-            chids = self._search_roots(chids, search)
-        return chids
+        search = self.request.GET.get('lquery', '')
+        return [row['device_id'] for row in self._lot_devices(search)]
+
+    # ?sort= field -> ProductCache column ordered by in SQL; other fields
+    # than these and the relational ones order by shortid.
+    SORT_COLUMNS = {
+        'shortid': 'shortid',
+        'type': 'type',
+        'manufacturer': 'manufacturer',
+        'model': 'model',
+        'last_updated': 'last_updated',
+    }
 
-    def _search_roots(self, device_ids, search_query):
-        """Filter canonical roots by ``search_query`` against the ProductCache
-        read model, matching the same device fields without constructing
-        Device objects (no Xapian read/parse per device).
+    def _lot_devices(self, search_query='', sort=None):
+        """Distinct device ids of the lot matching ``search_query``, ordered
+        by ``sort``, as a queryset of ``{'device_id': ...}`` rows.
 
         Whitespace separates terms and a device must match all of them (AND).
         A ``term:field`` token restricts that term to one field; a bare term
-        matches any field plus the device's user properties.
+        matches any field plus the device's user properties. Hardware fields
+        are matched on ProductCache.search_text, current state and
+        beneficiary status through subqueries, so only the page is fetched.
         """
-        projections, state_by_root, status_by_root = self._batch_device_data(
-            device_ids)
-        available = DeviceBeneficiary.Status.AVAILABLE.label
-
-        # (value, field) per whitespace-separated term; field is None for a
-        # bare term (matches any field + user properties).
+        terms = self._search_terms(search_query)
+        sort_field = (sort or '').lstrip('-')
+        fields = {field for _, field in terms} | {sort_field}
+
+        devices = DeviceLot.objects.filter(lot=self.object).values('device_id')
+        if None in fields or 'current_state' in fields:
+            projection = ProductCache.objects.filter(
+                owner=self.request.user.institution, root=OuterRef('device_id'))
+            devices = devices.annotate(
+                _state=Subquery(projection.values('current_state')[:1]))
+        if None in fields or 'status_beneficiary' in fields:
+            devices = devices.annotate(_status=self._status_subquery())
+        for value, field in terms:
+            devices = devices.filter(self._term_q(value, field))
+        devices = devices.distinct()
+
+        if not sort:
+            return devices.order_by('device_id')
+        if sort_field == 'current_state':
+            col = F('_state')
+        elif sort_field == 'status_beneficiary':
+            col = F('_status')
+        else:
+            column = self.SORT_COLUMNS.get(sort_field, 'shortid')
+            projection = ProductCache.objects.filter(
+                owner=self.request.user.institution, root=OuterRef('device_id'))
+            devices = devices.annotate(
+                _sortcol=Subquery(projection.values(column)[:1]))
+            col = F('_sortcol')
+        order = (col.desc(nulls_last=True) if sort.startswith('-')
+                 else col.asc(nulls_last=True))
+        return devices.order_by(order, 'device_id')
+
+    def _search_terms(self, search_query):
+        """(value, field) per whitespace-separated term; field is None for a
+        bare term (matches any field + user properties)."""
         terms = []
         for token in search_query.lower().split():
             value, field = token, None
@@ -244,55 +270,63 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
             value = value.strip()
             if value:
                 terms.append((value, field))
-        if not terms:
-            return list(device_ids)
+        return terms
 
-        # User properties are only consulted when a bare (fieldless) term exists.
-        user_props = {}
-        if any(field is None for _, field in terms):
-            for up in UserProperty.objects.filter(
-                owner=self.request.user.institution, device_id__in=device_ids,
+    def _term_q(self, value, field):
+        institution = self.request.user.institution
+        # served by the trigram index on Postgres, then narrowed per field
+        projections = ProductCache.objects.filter(
+            owner=institution, search_text__contains=value)
+        statuses = [
+            status for status in DeviceBeneficiary.Status
+            if value in str(status.label).lower()
+        ]
+
+        if field is None:
+            user_props = UserProperty.objects.filter(
+                owner=institution, device_id=OuterRef('device_id'),
                 type=UserProperty.Type.USER,
-            ).values('device_id', 'key', 'value'):
-                user_props.setdefault(up['device_id'], []).extend(
-                    [str(up['key']).lower(), str(up['value']).lower()])
-
-        matched = []
-        for did in device_ids:
-            p = projections.get(did)
-            data = p.data if p else {}
-            status = status_by_root.get(did)
-            fields = {
-                'shortid': (p.shortid if p else '').lower(),
-                'type': (p.type if p else '').lower(),
-                'manufacturer': (p.manufacturer if p else '').lower(),
-                'model': (p.model if p else '').lower(),
-                'current_state': (state_by_root.get(did) or '').lower(),
-                'status_beneficiary': (
-                    DeviceBeneficiary.Status(status).label
-                    if status is not None else available).lower(),
-                'serial': (p.serial if p else '').lower(),
-                'cpu': (p.cpu_model if p else '').lower(),
-                'total_ram': str(data.get('ram_total', '')).lower(),
-            }
-            props = user_props.get(did, [])
-
-            def term_matches(value, field):
-                if field is not None:
-                    val = fields.get(field)
-                    return val is not None and value in val
-                return (any(value in v for v in fields.values())
-                        or any(value in v for v in props))
-
-            if all(term_matches(value, field) for value, field in terms):
-                matched.append(did)
-        return matched
+            ).filter(Q(key__icontains=value) | Q(value__icontains=value))
+            return (Q(device_id__in=projections.values('root'))
+                    | Q(_state__icontains=value)
+                    | Q(_status__in=statuses)
+                    | Q(Exists(user_props)))
+
+        if field in ProductCache.SEARCH_FIELDS:
+            name = ProductCache.SEARCH_FIELDS[field]
+            if name in ProductCache.DATA_FIELDS:
+                name = 'data__{}'.format(name)
+            projections = projections.filter(**{name + '__icontains': value})
+            return Q(device_id__in=projections.values('root'))
+        if field == 'current_state':
+            return Q(_state__icontains=value)
+        if field == 'status_beneficiary':
+            return Q(_status__in=statuses)
+        # an unknown field matches nothing
+        return Q(pk__in=[])
+
+    def _status_subquery(self):
+        """Beneficiary status of a lot device in this lot (any physical id
+        may carry the row); Available (0) when it has none, so such devices
+        still sort first, together with the available ones."""
+        aliases = RootAlias.objects.filter(
+            owner=self.request.user.institution,
+            root=OuterRef(OuterRef('device_id')),
+        ).values('alias')
+        status = DeviceBeneficiary.objects.filter(
+            beneficiary__lot=self.object,
+        ).filter(
+            Q(device_id=OuterRef('device_id')) | Q(device_id__in=Subquery(aliases))
+        ).values('status')[:1]
+        return Coalesce(
+            Subquery(status), Value(DeviceBeneficiary.Status.AVAILABLE.value))
 
     def _batch_device_data(self, device_ids):
         """Batch the projection + relational data for ``device_ids`` (canonical
         roots), resolving evidence aliases. Fixed query count, no Xapian.
-        Returns three dicts keyed by root: projection rows, current state and
-        beneficiary status. Shared by the list view and the export.
+        Returns two dicts keyed by root: projection rows (current state
+        included) and beneficiary status. Shared by the list view and the
+        export.
         """
         institution = self.request.user.institution
 
@@ -310,24 +344,6 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
             alias_to_root[ra['alias']] = ra['root']
             alias_ids.add(ra['alias'])
 
-        # newest evidence uuid per root (across its physical aliases).
-        root_latest_uuid = {}
-        for sp in SystemProperty.objects.filter(
-            owner=institution, value__in=alias_ids
-        ).order_by('-created').values('value', 'uuid'):
-            root = alias_to_root.get(sp['value'], sp['value'])
-            root_latest_uuid.setdefault(root, sp['uuid'])
-
-        # current state per root via its latest uuid.
-        uuid_to_root = {uuid: root for root, uuid in root_latest_uuid.items()}
-        state_by_root = {}
-        for st in State.objects.filter(
-            snapshot_uuid__in=root_latest_uuid.values()
-        ).order_by('-date').values('snapshot_uuid', 'state'):
-            root = uuid_to_root.get(st['snapshot_uuid'])
-            if root is not None:
-                state_by_root.setdefault(root, st['state'])
-
         # beneficiary status per root (any physical id may carry the row).
         status_by_root = {}
         for db in DeviceBeneficiary.objects.filter(
@@ -336,20 +352,17 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
             root = alias_to_root.get(db['device_id'], db['device_id'])
             status_by_root.setdefault(root, db['status'])
 
-        return projections, state_by_root, status_by_root
+        return projections, status_by_root
 
     def _build_table_rows(self, device_ids):
-        """Full list-view rows from the projection, keyed by root. Returns
-        (rows_by_id, sort_keys); sort_keys holds the raw sortable values
-        (datetime / state string / status int) for the Python sort."""
-        projections, state_by_root, status_by_root = self._batch_device_data(
-            device_ids)
+        """Full list-view rows from the projection, keyed by root."""
+        projections, status_by_root = self._batch_device_data(device_ids)
 
         available = DeviceBeneficiary.Status.AVAILABLE.label
-        rows_by_id, sort_keys = {}, {}
+        rows_by_id = {}
         for did in device_ids:
             p = projections.get(did)
-            state = state_by_root.get(did)
+            state = p.current_state if p else None
             status = status_by_root.get(did)
             rows_by_id[did] = {
                 'id': did,
@@ -365,15 +378,7 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
                     if status is not None else available),
                 'last_updated': (p.last_updated if p else None) or '--',
             }
-            sort_keys[did] = {
-                'type': p.type if p else None,
-                'manufacturer': p.manufacturer if p else None,
-                'model': p.model if p else None,
-                'last_updated': p.last_updated if p else None,
-                'current_state': state,
-                'status_beneficiary': status if status is not None else 0,
-            }
-        return rows_by_id, sort_keys
+        return rows_by_id
 
     def _export_rows(self, device_ids):
         """Assemble export rows for ``device_ids`` (canonical roots) using the
@@ -382,8 +387,7 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
         from Postgres in a fixed number of queries regardless of device count.
         """
         institution = self.request.user.institution
-        projections, state_by_root, status_by_root = self._batch_device_data(
-            device_ids)
+        projections, status_by_root = self._batch_device_data(device_ids)
 
         # user properties per canonical device id.
         user_props = {}
@@ -399,7 +403,7 @@ class LotDashboardView(ExportMixin, SingleTableMixin, InventaryMixin, DetailsMix
         for did in device_ids:
             p = projections.get(did)
             data = p.data if p else {}
-            state = state_by_root.get(did)
+            state = p.current_state if p else None
             status = status_by_root.get(did)
             # openpyxl (xlsx export) rejects tz-aware datetimes, so strip the
             # tzinfo at this export boundary.
@@ -523,13 +527,13 @@ class SearchView(DeviceTableMixin, InventaryMixin):
         sp_ids = self._search_shortid_ids(query_str)
         sp_count = len(sp_ids)
 
-        # 2. Xapian: count (no JSON) + page (JSON only for page documents)
+        # 2. Xapian: page (JSON only for page documents) and count in one pass
         sp_page = sp_ids[offset:offset + limit]
         xapian_needed = limit - len(sp_page)
         xapian_offset = max(0, offset - sp_count)
-        xapian_count = self._get_xapian_count(query_str)
-        xapian_page = self._search_xapian_page(
-            query_str, xapian_offset, xapian_needed
+        xapian_page, xapian_count = self._search_xapian_page(
+            query_str, xapian_offset, xapian_needed,
+            sort=self.request.GET.get("order"),
         )
         total = sp_count + xapian_count
 
@@ -633,23 +637,26 @@ class SearchView(DeviceTableMixin, InventaryMixin):
 
         return ids
 
-    def _get_xapian_count(self, query_str):
-        """Return the number of xapian document matches (no JSON parsing)."""
-        matches = search(self.request.user.institution, query_str, 0, 9999)
+    def _search_xapian_page(self, query_str, offset, limit, sort=None):
+        """Fetch one page of xapian results and the number of matches with a
+        single query. JSON is parsed only for the documents in this page.
+        Matches are collapsed by device in the index: one result per device,
+        its best matching evidence, and the count is of devices.
+        ``?order=`` (date, type or manufacturer, "-" for descending) sorts
+        them by an index value slot instead of relevance.
+        Returns (ids, count); past DEVICEHUB_SEARCH_EXACT_COUNT matches the
+        count is Xapian's estimate."""
+        institution = self.request.user.institution
+        matches = search(
+            institution, query_str, offset, max(0, limit),
+            sort=sort, collapse=True,
+        )
         if not matches:
-            return 0
-        return matches.size()
-
-    def _search_xapian_page(self, query_str, offset, limit):
-        """Fetch one page of xapian results. JSON is parsed only for the
-        documents in this page. No deduplication: one xapian document = one result."""
-        if limit <= 0:
-            return []
+            return [], 0
 
-        institution = self.request.user.institution
-        matches = search(institution, query_str, offset, limit)
-        if not matches or matches.size() == 0:
-            return []
+        count = matches.get_matches_estimated()
+        if matches.size() == 0:
+            return [], count
 
         uuids = []
         for x in matches:
@@ -664,7 +671,7 @@ class SearchView(DeviceTableMixin, InventaryMixin):
                 logger.error("Error: {}".format(err))
 
         if not uuids:
-            return []
+            return [], count
 
         props = SystemProperty.objects.filter(
             owner=institution,
@@ -672,4 +679,4 @@ class SearchView(DeviceTableMixin, InventaryMixin):
         ).values_list("uuid", "value")
         uuid_to_value = {str(u): v for u, v in props}
 
-        return [uuid_to_value[uuid] for uuid in uuids if uuid in uuid_to_value]
+        return [uuid_to_value[uuid] for uuid in uuids if uuid in uuid_to_value], count
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from device.models import ProductCacheQueue
+
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the ProductCache rows queued by evidence uploads and alias "
+        "changes when DEVICEHUB_PRODUCT_CACHE_DEFERRED is enabled. Drains "
+        "the queue and exits, or keeps polling with --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Queued roots rebuilt per batch (default: 100).',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, polling the queue when it is empty.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls of an empty queue with --loop.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+
+        # a single run serves what is queued now; failed roots go back to
+        # the queue and are left for the next run
+        until = None if options['loop'] else ProductCacheQueue.last_pk() or 0
+
+        total = failed_total = 0
+        while True:
+            processed, failed = ProductCacheQueue.drain(
+                batch_size=batch_size, until=until)
+            total += processed
+            failed_total += failed
+            if not options['loop']:
+                if not processed:
+                    break
+                continue
+            # only a batch with some progress is worth repeating right away
+            if processed > failed:
+                continue
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {total - failed_total} queued product cache(s), '
+            f'{failed_total} failed.'
+        ))
@@ -24,6 +24,30 @@ class Command(BaseCommand):
             default=None,
             help='Institution id to scope the rebuild to (default: all).',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes rebuilding chunks in parallel (default: 1).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Roots rebuilt per chunk (default: 500).',
+        )
+        parser.add_argument(
+            '--since',
+            action='store_true',
+            help='Only rebuild roots without a cache row or whose RootAlias '
+                 'changed after the row was built.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=None,
+            help='File recording finished chunks; rerun with the same file '
+                 'to resume an interrupted rebuild.',
+        )
 
     def handle(self, *args, **options):
         owner = None
@@ -33,9 +57,25 @@ class Command(BaseCommand):
             if not owner:
                 raise CommandError(f'No institution with id {owner_id}')
 
-        total = ProductCache.rebuild_all(owner=owner)
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive')
+
+        total = ProductCache.rebuild_all(
+            owner=owner,
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            since=options['since'],
+            checkpoint=options['checkpoint'],
+            progress=self.progress,
+        )
 
         scope = owner.name if owner else 'all institutions'
         self.stdout.write(self.style.SUCCESS(
             f'Rebuilt {total} product cache(s) for {scope}.'
         ))
+
+    def progress(self, done, total, failed, elapsed):
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{done}/{total} roots, {failed} failed ({rate:.1f} roots/s)'
+        )
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.6 on 2026-10-18 10:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("device", "0001_initial"),
+        ("user", "0006_institutionsettings_qr_font_size_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductCacheQueue",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("root", models.CharField(max_length=256)),
+                (
+                    "enqueued_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="user.institution",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="productcachequeue",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "root"), name="productcachequeue_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:16
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+import device.product_cache
+
+
+# ProductCache.SEARCH_FIELDS when this migration was written
+COLUMNS = ("shortid", "type", "manufacturer", "model", "serial", "cpu_model")
+DATA_KEYS = ("ram_total",)
+
+
+def fill_search_text(apps, schema_editor):
+    ProductCache = apps.get_model("device", "ProductCache")
+    batch = []
+    for row in ProductCache.objects.iterator(chunk_size=1000):
+        values = [getattr(row, name) for name in COLUMNS]
+        values += [(row.data or {}).get(key, "") for key in DATA_KEYS]
+        row.search_text = "\n".join(
+            str(v if v is not None else "").lower().replace("\n", " ")
+            for v in values
+        )
+        batch.append(row)
+        if len(batch) >= 1000:
+            ProductCache.objects.bulk_update(batch, ["search_text"])
+            batch = []
+    ProductCache.objects.bulk_update(batch, ["search_text"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("device", "0002_productcachequeue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productcache",
+            name="search_text",
+            field=models.TextField(default="", editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        # the extension is skipped on SQLite, where the index is a plain one
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="productcache",
+            index=device.product_cache.TrigramIndex(
+                fields=["search_text"],
+                name="productcache_search_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
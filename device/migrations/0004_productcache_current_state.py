@@ -0,0 +1,76 @@
+# Generated by Django 5.0.6 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+def fill_current_state(apps, schema_editor):
+    ProductCache = apps.get_model("device", "ProductCache")
+    RootAlias = apps.get_model("evidence", "RootAlias")
+    SystemProperty = apps.get_model("evidence", "SystemProperty")
+    State = apps.get_model("action", "State")
+
+    rows = list(ProductCache.objects.only("owner", "root", "latest_uuid").order_by("pk"))
+    for i in range(0, len(rows), 1000):
+        batch = rows[i:i + 1000]
+        by_owner = {}
+        for row in batch:
+            by_owner.setdefault(row.owner_id, {})[row.root] = row
+
+        # newest evidence of each root, across its physical aliases
+        for owner_id, by_root in by_owner.items():
+            alias_to_root = {root: root for root in by_root}
+            for alias, root in RootAlias.objects.filter(
+                owner_id=owner_id, root__in=list(by_root)
+            ).values_list("alias", "root"):
+                alias_to_root[alias] = root
+            for value, uuid in SystemProperty.objects.filter(
+                owner_id=owner_id, value__in=list(alias_to_root)
+            ).order_by("-created").values_list("value", "uuid"):
+                row = by_root[alias_to_root[value]]
+                if row.latest_uuid is None:
+                    row.latest_uuid = uuid
+
+        by_uuid = {row.latest_uuid: row for row in batch if row.latest_uuid}
+        for uuid, state, date in State.objects.filter(
+            snapshot_uuid__in=list(by_uuid)
+        ).order_by("date", "pk").values_list("snapshot_uuid", "state", "date"):
+            by_uuid[uuid].current_state = state
+            by_uuid[uuid].state_date = date
+
+        ProductCache.objects.bulk_update(
+            batch, ["latest_uuid", "current_state", "state_date"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("device", "0003_productcache_search_text"),
+        ("user", "0006_institutionsettings_qr_font_size_and_more"),
+        ("action", "0002_devicelog_note"),
+        ("evidence", "0013_photoprocessing"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productcache",
+            name="current_state",
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name="productcache",
+            name="latest_uuid",
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="productcache",
+            name="state_date",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="productcache",
+            index=models.Index(
+                fields=["owner", "current_state"], name="productcache_owner_state_idx"
+            ),
+        ),
+        migrations.RunPython(fill_current_state, migrations.RunPython.noop),
+    ]
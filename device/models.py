@@ -154,7 +154,7 @@ class Device:
         if not self.uuids:
             self.get_uuids()
 
-        self.evidences = [Evidence(u) for u in self.uuids]
+        self.evidences = Evidence.load_many(self.owner, self.uuids)
 
     def get_last_evidence(self):
         if self.last_evidence:
@@ -446,16 +446,17 @@ class Device:
         parse (e.g. missing from Xapian) is skipped rather than fatal, so one
         bad evidence never breaks the whole projection.
         """
-        self.get_uuids()
+        if not self.evidences:
+            self.get_evidences()
         # Walking back through evidences reassigns self.last_evidence; remember
         # the entry state so the device is left pointing at its newest evidence.
         saved_last_evidence = self.last_evidence
         skip = {"ID", "last_updated"}
         merged = None
         remaining = set()
-        for uuid in self.uuids:  # ordered newest -> oldest
+        for evidence in self.evidences:  # ordered newest -> oldest
             try:
-                self.last_evidence = Evidence(uuid)
+                self.last_evidence = evidence
                 fields = self.evidence_export_fields()
 
                 is_web_snapshot = (self.last_evidence.is_web_snapshot()
@@ -508,12 +509,13 @@ class Device:
         if self.is_websnapshot:
             return self.components.get("storage_hours", {})
 
-        self.get_uuids()
+        if not self.evidences:
+            self.get_evidences()
         disks = {}
         seen = {}  # serial -> set of uuids already recorded
-        for uuid in reversed(list(self.uuids)):  # oldest -> newest
+        for evidence in reversed(self.evidences):  # oldest -> newest
+            uuid = evidence.uuid
             try:
-                evidence = Evidence(uuid)
                 components = evidence.get_components()
             except Exception:
                 continue
@@ -683,7 +685,67 @@ class Device:
             'logo_url': self.owner.logo if settings.qr_include_logo and self.owner.logo else None,
         }
 
-# Registers the ProductCache ORM model under the `device` app. Django only
-# auto-imports `<app>.models`, so the read model defined in device/product_cache.py
+class DeviceRef:
+    """Canonical root and latest evidence uuid of a device.
+
+    What bulk actions (state changes, lot and beneficiary membership) need
+    of each selected device, without the Xapian read and parse a full
+    Device does on construction. Build them with ``resolve_many``.
+    """
+    __slots__ = ("root", "latest_uuid")
+
+    def __init__(self, root, latest_uuid):
+        self.root = root
+        self.latest_uuid = latest_uuid
+
+    def __repr__(self):
+        return f"DeviceRef({self.root!r}, {self.latest_uuid!r})"
+
+    @property
+    def id(self):
+        return self.root
+
+    pk = id
+
+    @property
+    def shortid(self):
+        return self.root.split(":")[1][:6].upper()
+
+    @classmethod
+    def resolve_many(cls, owner, ids):
+        """Resolve ``ids`` (physical ids or roots) to one DeviceRef per
+        canonical root in three queries, whatever the number of ids.
+
+        The latest uuid is the newest SystemProperty among all the
+        physical aliases of the root. Ids without an evidence of ``owner``
+        are dropped. Refs keep the order of the first id of each root.
+        """
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+
+        to_root = dict(
+            RootAlias.objects.filter(owner=owner, alias__in=ids)
+            .values_list("alias", "root")
+        )
+        roots = list(dict.fromkeys(to_root.get(i, i) for i in ids))
+
+        alias_to_root = {root: root for root in roots}
+        for alias, root in RootAlias.objects.filter(
+            owner=owner, root__in=roots
+        ).values_list("alias", "root"):
+            alias_to_root[alias] = root
+
+        latest = {}
+        for value, uuid in SystemProperty.objects.filter(
+            owner=owner, value__in=list(alias_to_root)
+        ).order_by("-created").values_list("value", "uuid"):
+            latest.setdefault(alias_to_root[value], uuid)
+
+        return [cls(root, latest[root]) for root in roots if root in latest]
+
+
+# Registers the ProductCache ORM models under the `device` app. Django only
+# auto-imports `<app>.models`, so the models defined in device/product_cache.py
 # must be imported here to be discovered by makemigrations.
-from device.product_cache import ProductCache  # noqa: E402,F401
+from device.product_cache import ProductCache, ProductCacheQueue  # noqa: E402,F401
@@ -1,18 +1,50 @@
-from django.db import models
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.db import connections, models, transaction
+from django.db.models import Index
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
 
 from utils.constants import STR_EXTEND_SIZE
 from user.models import Institution
 
 
+logger = logging.getLogger('django')
+
+
+class TrigramIndex(GinIndex):
+    """pg_trgm GIN index serving substring LIKE on Postgres.
+
+    SQLite, the fallback database, has neither GIN nor pg_trgm and gets a
+    plain index of the same name.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != "postgresql":
+            return Index(fields=self.fields, name=self.name).create_sql(
+                model, schema_editor, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class ProductCache(models.Model):
     """Persistent read model of a device's evidence-derived export fields.
 
     One row per canonical device, keyed by (owner, root) where root is the
     RootAlias canonical id. Rebuilt from evidence by ProductCache.rebuild()
-    and never edited by hand. Relational fields (current_state, beneficiary
-    status, user properties) are intentionally NOT stored here: they are cheap
-    SQL already and change without a new evidence, so keeping them out limits
-    rebuild triggers to two events (a new evidence and a RootAlias change).
+    and never edited by hand. Relational fields (beneficiary status, user
+    properties) are intentionally NOT stored here: they are cheap SQL already
+    and change without a new evidence, so keeping them out limits rebuild
+    triggers to two events (a new evidence and a RootAlias change). The
+    current state is the exception, because device lists filter and sort by
+    it: it is copied from the newest State of ``latest_uuid`` by rebuild()
+    and by update_states() whenever a State is created.
 
     Queried fields (filtered/ordered/searched by the list view) live in their
     own columns so Postgres can index them; display-only export fields live in
@@ -43,6 +75,18 @@ class ProductCache(models.Model):
         "megapixels", "max_resolution",
     )
 
+    # Lot search field -> column (or ``data`` key) whose lowercased value is
+    # kept in ``search_text``, one line per field.
+    SEARCH_FIELDS = {
+        "shortid": "shortid",
+        "type": "type",
+        "manufacturer": "manufacturer",
+        "model": "model",
+        "serial": "serial",
+        "cpu": "cpu_model",
+        "total_ram": "ram_total",
+    }
+
 
     owner = models.ForeignKey(Institution, on_delete=models.CASCADE)
     root = models.CharField(max_length=STR_EXTEND_SIZE)
@@ -58,6 +102,15 @@ class ProductCache(models.Model):
     # Display-only export payload, keyed by DATA_FIELDS.
     data = models.JSONField(default=dict)
 
+    # Normalized SEARCH_FIELDS values, kept by save(). Matched with a plain
+    # substring LIKE, served by TrigramIndex on Postgres.
+    search_text = models.TextField(default="", editable=False)
+
+    # Newest evidence of the device, and the newest State recorded on it.
+    latest_uuid = models.UUIDField(null=True, blank=True, db_index=True)
+    current_state = models.CharField(max_length=50, null=True, blank=True)
+    state_date = models.DateTimeField(null=True, blank=True)
+
     # When this row was last rebuilt (not the device's evidence date).
     updated = models.DateTimeField(auto_now=True)
 
@@ -70,8 +123,35 @@ class ProductCache(models.Model):
             models.Index(
                 fields=["owner", "-last_updated"],
                 name="productcache_owner_lastupd_idx"),
+            models.Index(
+                fields=["owner", "current_state"],
+                name="productcache_owner_state_idx"),
+            TrigramIndex(
+                fields=["search_text"], opclasses=["gin_trgm_ops"],
+                name="productcache_search_trgm_idx"),
         ]
 
+    def save(self, *args, **kwargs):
+        self.search_text = self.build_search_text()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "search_text"}
+        super().save(*args, **kwargs)
+
+    def search_value(self, field):
+        """Lowercased value of the lot search ``field``."""
+        name = self.SEARCH_FIELDS[field]
+        if name in self.DATA_FIELDS:
+            value = (self.data or {}).get(name, "")
+        else:
+            value = getattr(self, name)
+        return str(value if value is not None else "").lower().replace("\n", " ")
+
+    def build_search_text(self):
+        return "\n".join(
+            self.search_value(field) for field in self.SEARCH_FIELDS
+        )
+
     @classmethod
     def rebuild(cls, owner, root):
         """(Re)build the projection row for one canonical device.
@@ -81,6 +161,7 @@ class ProductCache(models.Model):
         through here. Returns the row, or None if the root has no evidence, in
         which case any stale row is removed.
         """
+        from action.models import State
         from device.models import Device
 
         device = Device(id=root, owner=owner)
@@ -89,6 +170,10 @@ class ProductCache(models.Model):
             cls.objects.filter(owner=owner, root=root).delete()
             return None
 
+        latest_uuid = device.uuids[0]
+        state = State.objects.filter(
+            snapshot_uuid=latest_uuid).order_by("-date", "-pk").first()
+
         f = device.merged_export_fields()
         data = {k: f.get(k, "") for k in cls.DATA_FIELDS}
         # Raw per-disk power-on-hours history, kept under its own nested key so
@@ -106,35 +191,272 @@ class ProductCache(models.Model):
                 "cpu_model": f.get("cpu_model", "") or "",
                 "last_updated": f.get("last_updated") or None,
                 "data": data,
+                "latest_uuid": latest_uuid,
+                "current_state": state.state if state else None,
+                "state_date": state.date if state else None,
             },
         )
         return obj
 
+    @classmethod
+    def update_states(cls, owner, snapshot_uuids):
+        """Copy the newest State of ``snapshot_uuids`` onto the rows whose
+        latest evidence they are, in one UPDATE.
+
+        Called in the transaction that creates the States. A State of an
+        older evidence changes nothing, as for the lists before; the rows of
+        an evidence not indexed yet get their state when they are rebuilt.
+        """
+        from action.models import State
+
+        newest = State.objects.filter(
+            snapshot_uuid=OuterRef("latest_uuid")
+        ).order_by("-date", "-pk")
+        cls.objects.filter(
+            owner=owner, latest_uuid__in=list(snapshot_uuids)
+        ).update(
+            current_state=Subquery(newest.values("state")[:1]),
+            state_date=Subquery(newest.values("date")[:1]),
+        )
+
     @classmethod
     def drop(cls, owner, root):
         """Remove the projection row for a root that is no longer canonical."""
         cls.objects.filter(owner=owner, root=root).delete()
 
     @classmethod
-    def rebuild_all(cls, owner=None):
+    def refresh(cls, owner, root):
+        """Rebuild ``root`` if it is still a canonical root, else drop it."""
+        from evidence.models import RootAlias
+
+        if RootAlias.objects.filter(owner=owner, root=root).exists():
+            return cls.rebuild(owner, root)
+        cls.drop(owner, root)
+
+    @classmethod
+    def schedule(cls, owner, *roots):
+        """Bring the rows of ``roots`` up to date after a write.
+
+        Refreshed inline by default. With PRODUCT_CACHE_DEFERRED the roots
+        are put on ProductCacheQueue once the current transaction commits
+        and the process_product_cache_queue worker rebuilds them, so the
+        request that changed them does not wait for Xapian.
+        """
+        roots = [r for r in roots if r]
+        if not settings.PRODUCT_CACHE_DEFERRED:
+            for root in roots:
+                cls.refresh(owner, root)
+            return
+        transaction.on_commit(lambda: ProductCacheQueue.enqueue(owner, roots))
+
+    @classmethod
+    def rebuild_all(cls, owner=None, workers=1, chunk_size=500, since=False,
+                    checkpoint=None, progress=None):
         """Rebuild projections for every canonical device.
 
         Iterates DISTINCT RootAlias.root per owner (the canonical device set)
         and rebuilds each. Pass ``owner`` to scope to one institution. Returns
         the number of roots processed.
-        """
-        from evidence.models import RootAlias
 
+        Roots are rebuilt in chunks of ``chunk_size``; with ``workers`` > 1
+        the chunks run in a process pool, each worker with its own database
+        connection and Xapian reader. ``since`` limits the run to roots
+        without a row or whose RootAlias changed after the row was built.
+        ``checkpoint`` is a file recording the roots of finished chunks so an
+        interrupted run resumes where it stopped, whatever the chunks; it is removed once the run completes.
+        ``progress(done, total, failed, elapsed)`` is called after each chunk.
+        A root that fails to rebuild is logged and counted, not fatal.
+        """
         institutions = [owner] if owner is not None else list(
             Institution.objects.all())
-        total = 0
+
+        finished = _read_checkpoint(checkpoint)
+        pending = []
         for inst in institutions:
-            roots = (
-                RootAlias.objects.filter(owner=inst)
-                .values_list("root", flat=True)
-                .distinct()
-            )
-            for root in roots:
-                cls.rebuild(inst, root)
-                total += 1
-        return total
+            roots = [
+                root for root in (
+                    cls.stale_roots(inst) if since else cls.roots(inst))
+                if _root_key(inst, root) not in finished
+            ]
+            for i in range(0, len(roots), chunk_size):
+                pending.append((inst, roots[i:i + chunk_size]))
+        total = sum(len(roots) for _, roots in pending)
+        done = failed = 0
+        start = time.monotonic()
+
+        def record(chunk, result):
+            nonlocal done, failed
+            done += result[0]
+            failed += result[1]
+            if checkpoint:
+                inst, roots = chunk
+                finished.update(_root_key(inst, root) for root in roots)
+                _write_checkpoint(checkpoint, finished)
+            if progress:
+                progress(done, total, failed, time.monotonic() - start)
+
+        if workers <= 1 or len(pending) <= 1:
+            for chunk in pending:
+                record(chunk, _rebuild_chunk(*chunk))
+        else:
+            # children must not share the parent's database sockets
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=context) as pool:
+                futures = {
+                    pool.submit(_rebuild_chunk, inst.pk, roots): (inst, roots)
+                    for inst, roots in pending
+                }
+                for future in as_completed(futures):
+                    record(futures[future], future.result())
+
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        return done
+
+    @classmethod
+    def roots(cls, owner):
+        """Canonical roots of ``owner`` in a stable order."""
+        from evidence.models import RootAlias
+
+        return (
+            RootAlias.objects.filter(owner=owner)
+            .values_list("root", flat=True)
+            .distinct()
+            .order_by("root")
+        )
+
+    @classmethod
+    def stale_roots(cls, owner):
+        """Roots of ``owner`` with no row, or with a RootAlias updated after
+        the row was last rebuilt."""
+        from evidence.models import RootAlias
+
+        built = cls.objects.filter(
+            owner=OuterRef("owner"), root=OuterRef("root")
+        ).values("updated")[:1]
+        return (
+            RootAlias.objects.filter(owner=owner)
+            .annotate(built=Subquery(built))
+            .filter(Q(built__isnull=True) | Q(updated__gt=F("built")))
+            .values_list("root", flat=True)
+            .distinct()
+            .order_by("root")
+        )
+
+
+class ProductCacheQueue(models.Model):
+    """Durable queue of roots waiting for a ProductCache refresh.
+
+    One row per (owner, root): enqueueing a root that is already waiting
+    only moves its ``enqueued_at``, so a burst of evidences for one device
+    costs one rebuild. Rows are served in insertion order and a row is
+    only removed if it was not enqueued again while being rebuilt.
+    """
+
+    owner = models.ForeignKey(Institution, on_delete=models.CASCADE)
+    root = models.CharField(max_length=STR_EXTEND_SIZE)
+    enqueued_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "root"], name="productcachequeue_unique"),
+        ]
+
+    @classmethod
+    def enqueue(cls, owner, roots):
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [cls(owner=owner, root=root, enqueued_at=now) for root in roots],
+            update_conflicts=True,
+            unique_fields=["owner", "root"],
+            update_fields=["enqueued_at"],
+        )
+
+    @classmethod
+    def last_pk(cls):
+        return cls.objects.aggregate(last=models.Max("pk"))["last"]
+
+    @classmethod
+    def drain(cls, batch_size=100, until=None):
+        """Refresh up to ``batch_size`` queued roots.
+
+        Each row is locked with SKIP LOCKED and rebuilt in its own
+        transaction, so concurrent drainers never rebuild the same root
+        and an enqueue of that root waits for the rebuild to finish. Only
+        rows up to pk ``until`` (default: the last one queued now) are
+        served. Returns ``(processed, failed)``. A root that fails is
+        logged and moved to the back of the queue.
+        """
+        if until is None:
+            until = cls.last_pk()
+        if until is None:
+            return 0, 0
+
+        processed = failed = 0
+        while processed < batch_size:
+            with transaction.atomic():
+                item = (
+                    cls.objects.select_for_update(skip_locked=True, of=("self",))
+                    .select_related("owner")
+                    .filter(pk__lte=until)
+                    .order_by("pk")
+                    .first()
+                )
+                if item is None:
+                    break
+                processed += 1
+                try:
+                    with transaction.atomic():
+                        ProductCache.refresh(item.owner, item.root)
+                except Exception as err:
+                    failed += 1
+                    logger.error(
+                        "Could not rebuild product cache of %s: %s", item.root, err)
+                    item.delete()
+                    cls.enqueue(item.owner, [item.root])
+                    continue
+                # kept if it was enqueued again by the rebuild itself
+                cls.objects.filter(
+                    pk=item.pk, enqueued_at=item.enqueued_at
+                ).delete()
+        return processed, failed
+
+
+def _rebuild_chunk(owner, roots):
+    """Rebuild ``roots`` of one institution; returns (processed, failed).
+
+    Module level so the process pool can pickle it; workers receive the
+    institution id and load it on their own connection.
+    """
+    if not isinstance(owner, Institution):
+        owner = Institution.objects.get(pk=owner)
+
+    failed = 0
+    for root in roots:
+        try:
+            ProductCache.rebuild(owner, root)
+        except Exception as err:
+            failed += 1
+            logger.error("Could not rebuild product cache of %s: %s", root, err)
+    return len(roots), failed
+
+
+def _root_key(owner, root):
+    return "{}:{}".format(owner.pk, root)
+
+
+def _read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f).get("done", []))
+
+
+def _write_checkpoint(path, finished):
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "w") as f:
+        json.dump({"done": sorted(finished)}, f)
+    os.replace(tmp, path)
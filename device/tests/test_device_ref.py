@@ -0,0 +1,79 @@
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from action.models import State, StateDefinition, DeviceLog
+from device.models import DeviceRef
+from evidence.models import SystemProperty, RootAlias
+from user.models import Institution, User
+
+
+class DeviceRefTests(TestCase):
+    """DeviceRef.resolve_many turns selected ids into (root, latest uuid)
+    pairs in a fixed number of queries and without Xapian."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        self.user = User.objects.create_user(
+            email="admin@example.com", institution=self.institution,
+            password="testpass123",
+        )
+        self.uuids = {}
+        now = timezone.now()
+        with patch("evidence.models.ProductCache.schedule"):
+            for n, value in enumerate(["ereuse24:a1", "ereuse24:a2", "ereuse24:b1"]):
+                self.uuids[value] = uuid.uuid4()
+                prop = SystemProperty.objects.create(
+                    owner=self.institution, uuid=self.uuids[value],
+                    key="ereuse24", value=value)
+                SystemProperty.objects.filter(pk=prop.pk).update(
+                    created=now + timedelta(minutes=n))
+        # a1 and a2 are the same device, known by its custom id
+        for alias in ("ereuse24:a1", "ereuse24:a2"):
+            RootAlias.objects.update_or_create(
+                owner=self.institution, alias=alias,
+                defaults={"root": "custom_id:a", "updated": now})
+
+    def test_resolves_roots_and_latest_uuid(self):
+        with self.assertNumQueries(3):
+            refs = DeviceRef.resolve_many(self.institution, [
+                "ereuse24:b1", "ereuse24:a1", "custom_id:a", "ereuse24:zz",
+            ])
+
+        self.assertEqual(
+            [(r.root, r.latest_uuid) for r in refs],
+            [("ereuse24:b1", self.uuids["ereuse24:b1"]),
+             ("custom_id:a", self.uuids["ereuse24:a2"])],
+        )
+        self.assertEqual(refs[1].id, "custom_id:a")
+        self.assertEqual(refs[0].shortid, "B1")
+
+    def test_other_institution_devices_are_dropped(self):
+        other = Institution.objects.create(name="Other")
+        self.assertEqual(DeviceRef.resolve_many(other, ["ereuse24:b1"]), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(DeviceRef.resolve_many(self.institution, []), [])
+
+    def test_bulk_state_change_uses_latest_uuid(self):
+        definition = StateDefinition.objects.create(
+            institution=self.institution, state="Repaired")
+        self.client.force_login(self.user)
+        session = self.client.session
+        session["devices"] = ["ereuse24:a1", "ereuse24:b1"]
+        session.save()
+
+        with patch("device.models.Device.get_last_evidence") as last_evidence:
+            self.client.get(reverse("action:bulk_change_state",
+                                    args=[definition.pk]),
+                            HTTP_REFERER="/dashboard/")
+        last_evidence.assert_not_called()
+
+        expected = {self.uuids["ereuse24:a2"], self.uuids["ereuse24:b1"]}
+        self.assertEqual(
+            set(State.objects.values_list("snapshot_uuid", flat=True)), expected)
+        self.assertEqual(
+            set(DeviceLog.objects.values_list("snapshot_uuid", flat=True)), expected)
@@ -21,6 +21,20 @@ def _base_fields(**over):
     return f
 
 
+def _load_many(factory):
+    """Stand-in for ``Evidence.load_many`` building each evidence with
+    ``factory(uuid)`` and leaving out the ones that fail, like the real one."""
+    def load_many(owner, uuids):
+        evidences = []
+        for u in uuids:
+            try:
+                evidences.append(factory(u))
+            except Exception:
+                continue
+        return evidences
+    return load_many
+
+
 def _device_with_evidences(per_uuid, shortid="ABC123"):
     """Build a Device that yields ``per_uuid[uuid]`` for each evidence.
 
@@ -32,6 +46,8 @@ def _device_with_evidences(per_uuid, shortid="ABC123"):
     d = Device.__new__(Device)
     d.uuids = list(per_uuid.keys())
     d.shortid = shortid
+    d.owner = None
+    d.evidences = []
     d.last_evidence = None
     d.get_uuids = MagicMock()
 
@@ -50,7 +66,8 @@ class MergedExportFieldsTests(TestCase):
 
     def _merge(self, device):
         # Evidence(uuid) -> uuid identity, so last_evidence is the uuid key.
-        with patch("device.models.Evidence", side_effect=lambda u: u):
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(lambda u: u)):
             return device.merged_export_fields()
 
     def test_newest_wins_over_older(self):
@@ -140,10 +157,15 @@ class MergedExportFieldsTests(TestCase):
                                  ID="X", last_updated="2021"),
             "old": _base_fields(manufacturer="HP"),
         })
-        with patch("device.models.Evidence", side_effect=lambda u: u) as ev:
+        export = MagicMock(side_effect=d.evidence_export_fields)
+        d.evidence_export_fields = export
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(lambda u: u)) as load_many:
             d.merged_export_fields()
-        # Newest already complete -> older evidence never constructed.
-        self.assertEqual(ev.call_count, 1)
+        # All evidences come from one bulk load...
+        load_many.assert_called_once_with(None, ["new", "old"])
+        # ...but newest already complete -> older evidence never read.
+        self.assertEqual(export.call_count, 1)
 
 
 class RebuildTests(TestCase):
@@ -154,7 +176,8 @@ class RebuildTests(TestCase):
 
     def _patch_device(self, uuids, fields, storage=None):
         fake = MagicMock()
-        fake.uuids = list(uuids)
+        # rebuild keeps the newest uuid in a UUIDField
+        fake.uuids = [uuidlib.uuid5(uuidlib.NAMESPACE_URL, u) for u in uuids]
         fake.merged_export_fields.return_value = fields
         fake.storage_readings.return_value = storage if storage is not None else {}
         return patch("device.models.Device", return_value=fake)
@@ -285,6 +308,97 @@ class RebuildTests(TestCase):
         self.assertEqual(set(seen), {"ereuse24:A", "ereuse24:B"})
 
 
+class RebuildAllTests(TestCase):
+    """Chunking, resume, --since and the process pool of rebuild_all."""
+
+    def setUp(self):
+        self.inst = Institution.objects.create(name="Inst")
+        with patch.object(ProductCache, "rebuild"):
+            for v in ("ereuse24:A", "ereuse24:B", "ereuse24:C"):
+                SystemProperty.objects.create(
+                    owner=self.inst, uuid=uuidlib.uuid4(), value=v)
+        self.seen = []
+        patcher = patch.object(
+            ProductCache, "rebuild",
+            side_effect=lambda owner, root: self.seen.append(root))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_progress_reported_per_chunk(self):
+        progress = MagicMock()
+        total = ProductCache.rebuild_all(
+            owner=self.inst, chunk_size=2, progress=progress)
+        self.assertEqual(total, 3)
+        self.assertEqual(
+            [c.args[:3] for c in progress.call_args_list],
+            [(2, 3, 0), (3, 3, 0)])
+
+    def test_failed_root_is_counted_not_fatal(self):
+        def rebuild(owner, root):
+            if root == "ereuse24:B":
+                raise KeyError("corrupt")
+        ProductCache.rebuild.side_effect = rebuild
+        progress = MagicMock()
+        ProductCache.rebuild_all(owner=self.inst, progress=progress)
+        self.assertEqual(progress.call_args.args[:3], (3, 3, 1))
+
+    def test_checkpoint_resumes_after_finished_roots(self):
+        import json
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), "checkpoint.json")
+        with open(path, "w") as f:
+            json.dump({"done": [
+                "{}:ereuse24:A".format(self.inst.pk),
+                "{}:ereuse24:B".format(self.inst.pk)]}, f)
+
+        # resumed with another chunk size: finished roots are still skipped
+        total = ProductCache.rebuild_all(
+            owner=self.inst, chunk_size=1, checkpoint=path)
+        self.assertEqual(total, 1)
+        self.assertEqual(self.seen, ["ereuse24:C"])
+        self.assertFalse(os.path.exists(path))
+
+    def test_since_skips_rows_newer_than_rootalias(self):
+        from evidence.models import RootAlias
+        later = timezone.now() + timezone.timedelta(hours=1)
+        ProductCache.objects.create(owner=self.inst, root="ereuse24:A")
+        ProductCache.objects.create(owner=self.inst, root="ereuse24:B")
+        ProductCache.objects.filter(root="ereuse24:A").update(updated=later)
+        RootAlias.objects.filter(alias="ereuse24:B").update(
+            updated=later + timezone.timedelta(hours=1))
+
+        ProductCache.rebuild_all(owner=self.inst, since=True)
+        self.assertEqual(self.seen, ["ereuse24:B", "ereuse24:C"])
+
+    def test_workers_run_chunks_in_pool(self):
+        from concurrent.futures import Future
+
+        class InlinePool:
+            def __init__(self, max_workers, mp_context):
+                self.max_workers = max_workers
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def submit(self, fn, *args):
+                future = Future()
+                future.set_result(fn(*args))
+                return future
+
+        with patch("device.product_cache.ProcessPoolExecutor", InlinePool), \
+                patch("device.product_cache.connections") as conns:
+            total = ProductCache.rebuild_all(
+                owner=self.inst, workers=2, chunk_size=1)
+        conns.close_all.assert_called_once_with()
+        self.assertEqual(total, 3)
+        self.assertEqual(sorted(self.seen),
+                         ["ereuse24:A", "ereuse24:B", "ereuse24:C"])
+
+
 class StorageReadingsTests(TestCase):
     """Unit tests for Device.storage_readings (per-disk PoH history, no Xapian
     beyond the patched Evidence)."""
@@ -292,6 +406,8 @@ class StorageReadingsTests(TestCase):
     def _device(self, uuids):
         d = Device.__new__(Device)
         d.uuids = list(uuids)
+        d.owner = None
+        d.evidences = []
         d.get_uuids = MagicMock()
         return d
 
@@ -317,7 +433,8 @@ class StorageReadingsTests(TestCase):
             ]),
         }
         d = self._device(["new", "old"])  # newest first
-        with patch("device.models.Evidence", side_effect=lambda u: evs[u]):
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(lambda u: evs[u])):
             disks = d.storage_readings()
         self.assertEqual(list(disks.keys()), ["S1"])
         readings = disks["S1"]["readings"]
@@ -339,7 +456,8 @@ class StorageReadingsTests(TestCase):
             ]),
         }
         d = self._device(["new", "old"])
-        with patch("device.models.Evidence", side_effect=lambda u: evs[u]):
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(lambda u: evs[u])):
             disks = d.storage_readings()
         self.assertEqual(set(disks.keys()), {"OLD", "NEW"})
         self.assertEqual(len(disks["OLD"]["readings"]), 1)
@@ -352,7 +470,8 @@ class StorageReadingsTests(TestCase):
             {"type": "Storage", "serialNumber": "S2", "time of used": "5d 0h"},
         ])
         d = self._device(["u1"])
-        with patch("device.models.Evidence", side_effect=lambda u: ev):
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(lambda u: ev)):
             disks = d.storage_readings()
         self.assertEqual(list(disks.keys()), ["S2"])
 
@@ -361,7 +480,8 @@ class StorageReadingsTests(TestCase):
             {"type": "Storage", "serialNumber": "S3", "model": "X"},
         ])
         d = self._device(["u1"])
-        with patch("device.models.Evidence", side_effect=lambda u: ev):
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(lambda u: ev)):
             disks = d.storage_readings()
         self.assertEqual(disks["S3"]["readings"], [])
         self.assertEqual(disks["S3"]["model"], "X")
@@ -373,7 +493,8 @@ class StorageReadingsTests(TestCase):
             {"type": "Storage", "serialNumber": "S5", "time of used": "1d 0h"},
         ])
         d = self._device([u])
-        with patch("device.models.Evidence", side_effect=lambda x: ev):
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(lambda x: ev)):
             disks = d.storage_readings()
         reading = disks["S5"]["readings"][0]
         self.assertEqual(reading["uuid"], str(u))
@@ -390,6 +511,7 @@ class StorageReadingsTests(TestCase):
             return good
 
         d = self._device(["bad", "good"])
-        with patch("device.models.Evidence", side_effect=factory):
+        with patch("device.models.Evidence.load_many",
+                   side_effect=_load_many(factory)):
             disks = d.storage_readings()
         self.assertEqual(list(disks.keys()), ["S4"])
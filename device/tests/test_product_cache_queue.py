@@ -0,0 +1,118 @@
+import uuid as uuidlib
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from user.models import Institution
+from evidence.models import SystemProperty, RootAlias
+from device.models import ProductCache, ProductCacheQueue
+
+
+@override_settings(PRODUCT_CACHE_DEFERRED=True)
+class DeferredRebuildTests(TestCase):
+    """With PRODUCT_CACHE_DEFERRED, writes only enqueue their roots once the
+    transaction commits and the worker rebuilds them later."""
+
+    def setUp(self):
+        self.inst = Institution.objects.create(name="Inst")
+        patcher = patch.object(ProductCache, "rebuild")
+        self.rebuild = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sp(self, value):
+        return SystemProperty.objects.create(
+            owner=self.inst, uuid=uuidlib.uuid4(), value=value)
+
+    def test_evidences_enqueue_on_commit_coalesced(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self._sp("ereuse24:A")
+            self._sp("ereuse24:A")
+            self.assertFalse(ProductCacheQueue.objects.exists())
+
+        self.assertEqual(len(callbacks), 2)
+        self.rebuild.assert_not_called()
+        self.assertEqual(
+            list(ProductCacheQueue.objects.values_list("root", flat=True)),
+            ["ereuse24:A"])
+
+    def test_drain_rebuilds_canonical_and_drops_orphaned_roots(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._sp("ereuse24:A")
+        ProductCache.objects.create(owner=self.inst, root="custom_id:GONE")
+        ProductCacheQueue.enqueue(self.inst, ["custom_id:GONE"])
+
+        self.assertEqual(ProductCacheQueue.drain(), (2, 0))
+        self.rebuild.assert_called_once_with(self.inst, "ereuse24:A")
+        self.assertFalse(ProductCache.objects.filter(root="custom_id:GONE").exists())
+        self.assertFalse(ProductCacheQueue.objects.exists())
+
+    def test_root_enqueued_again_while_rebuilding_stays_queued(self):
+        RootAlias.objects.create(
+            owner=self.inst, alias="ereuse24:A", root="ereuse24:A",
+            updated=timezone.now())
+        ProductCacheQueue.enqueue(self.inst, ["ereuse24:A"])
+
+        def enqueue_again(owner, root):
+            # a new evidence for the same root arrives mid-rebuild
+            ProductCacheQueue.objects.filter(root=root).update(
+                enqueued_at=timezone.now() + timezone.timedelta(seconds=1))
+        self.rebuild.side_effect = enqueue_again
+
+        ProductCacheQueue.drain()
+        self.assertTrue(ProductCacheQueue.objects.filter(root="ereuse24:A").exists())
+
+    def test_failed_root_moves_to_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._sp("ereuse24:A")
+            self._sp("ereuse24:B")
+        first = ProductCacheQueue.objects.get(root="ereuse24:A")
+
+        def rebuild(owner, root):
+            if root == "ereuse24:A":
+                raise KeyError(root)
+        self.rebuild.side_effect = rebuild
+
+        self.assertEqual(ProductCacheQueue.drain(), (2, 1))
+        again = ProductCacheQueue.objects.get(root="ereuse24:A")
+        self.assertGreater(again.pk, first.pk)
+        self.assertFalse(ProductCacheQueue.objects.filter(root="ereuse24:B").exists())
+
+    def test_command_drains_queue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._sp("ereuse24:A")
+            self._sp("ereuse24:B")
+        out = StringIO()
+        call_command("process_product_cache_queue", "--batch-size", "1", stdout=out)
+        self.assertFalse(ProductCacheQueue.objects.exists())
+        self.assertIn("Rebuilt 2", out.getvalue())
+
+    def test_command_continues_past_failing_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._sp("ereuse24:A")
+            self._sp("ereuse24:B")
+
+        def rebuild(owner, root):
+            if root == "ereuse24:A":
+                raise KeyError(root)
+        self.rebuild.side_effect = rebuild
+
+        out = StringIO()
+        call_command("process_product_cache_queue", "--batch-size", "1", stdout=out)
+        self.assertEqual(
+            list(ProductCacheQueue.objects.values_list("root", flat=True)),
+            ["ereuse24:A"])
+        self.assertIn("Rebuilt 1 queued product cache(s), 1 failed", out.getvalue())
+
+
+class SynchronousRebuildTests(TestCase):
+
+    def test_default_rebuilds_inline_without_queue(self):
+        inst = Institution.objects.create(name="Inst")
+        with patch.object(ProductCache, "rebuild") as rebuild:
+            SystemProperty.objects.create(
+                owner=inst, uuid=uuidlib.uuid4(), value="ereuse24:A")
+        rebuild.assert_called_once_with(inst, "ereuse24:A")
+        self.assertFalse(ProductCacheQueue.objects.exists())
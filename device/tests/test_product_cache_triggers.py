@@ -3,6 +3,7 @@ import uuid as uuidlib
 from django.test import TestCase
 from django.utils import timezone
 
+from action.models import State, StateDefinition
 from user.models import Institution
 from evidence.models import SystemProperty, RootAlias
 from device.models import ProductCache
@@ -102,3 +103,45 @@ class ProductCacheSetAliasTests(TestCase):
             owner=self.inst, root="ereuse24:cccccc").exists())
         self.assertTrue(ProductCache.objects.filter(
             owner=self.inst, root="ereuse24:eeeeee").exists())
+
+
+class ProductCacheStateTests(TestCase):
+    """Creating a State copies it onto the projection of the device whose
+    latest evidence it is; a new evidence starts with the state of its own."""
+
+    def setUp(self):
+        self.inst = Institution.objects.create(name="Inst")
+        for state in ("Received", "Repaired"):
+            StateDefinition.objects.create(institution=self.inst, state=state)
+
+    def _sp(self, value):
+        return SystemProperty.objects.create(
+            owner=self.inst, uuid=uuidlib.uuid4(), value=value)
+
+    def _row(self):
+        return ProductCache.objects.get(owner=self.inst, root="ereuse24:aaaaaa")
+
+    def test_state_is_copied_to_the_projection(self):
+        old = self._sp("ereuse24:aaaaaa")
+        latest = self._sp("ereuse24:aaaaaa")
+        self.assertEqual(self._row().latest_uuid, latest.uuid)
+        self.assertIsNone(self._row().current_state)
+
+        state = State.objects.create(
+            institution=self.inst, state="Received", snapshot_uuid=latest.uuid)
+        State.objects.create(
+            institution=self.inst, state="Repaired", snapshot_uuid=old.uuid)
+        self.assertEqual(
+            (self._row().current_state, self._row().state_date),
+            ("Received", state.date))
+
+        State.bulk_change(self.inst, None, "Repaired", [latest.uuid])
+        self.assertEqual(self._row().current_state, "Repaired")
+
+    def test_new_evidence_resets_the_state(self):
+        sp = self._sp("ereuse24:aaaaaa")
+        State.objects.create(
+            institution=self.inst, state="Received", snapshot_uuid=sp.uuid)
+        self._sp("ereuse24:aaaaaa")
+        self.assertIsNone(self._row().current_state)
+        self.assertIsNone(self._row().state_date)
@@ -24,12 +24,29 @@ class RebuildCommandTests(TestCase):
         with patch.object(ProductCache, "rebuild_all", return_value=3) as m:
             call_command("rebuild_product_cache", "--owner",
                          str(self.inst.id), stdout=StringIO())
-        m.assert_called_once_with(owner=self.inst)
+        m.assert_called_once()
+        self.assertEqual(m.call_args.kwargs["owner"], self.inst)
 
     def test_default_scope_is_all(self):
         with patch.object(ProductCache, "rebuild_all", return_value=0) as m:
             call_command("rebuild_product_cache", stdout=StringIO())
-        m.assert_called_once_with(owner=None)
+        m.assert_called_once()
+        self.assertIsNone(m.call_args.kwargs["owner"])
+
+    def test_passes_parallel_and_resume_options(self):
+        with patch.object(ProductCache, "rebuild_all", return_value=0) as m:
+            call_command("rebuild_product_cache", "--workers", "4",
+                         "--chunk-size", "50", "--since",
+                         "--checkpoint", "/tmp/pc.json", stdout=StringIO())
+        kwargs = m.call_args.kwargs
+        self.assertEqual(kwargs["workers"], 4)
+        self.assertEqual(kwargs["chunk_size"], 50)
+        self.assertTrue(kwargs["since"])
+        self.assertEqual(kwargs["checkpoint"], "/tmp/pc.json")
+
+    def test_invalid_workers_raises(self):
+        with self.assertRaises(CommandError):
+            call_command("rebuild_product_cache", "--workers", "0")
 
     def test_command_never_writes_to_xapian(self):
         # Real rebuild path over a couple of devices; assert the only Xapian
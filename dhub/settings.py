@@ -46,6 +46,35 @@ INITIAL_ADMIN_EMAIL = config("DEVICEHUB_INIT_ADMIN_EMAIL", default='admin@exampl
 INITIAL_ADMIN_PASSWORD = config("DEVICEHUB_INIT_ADMIN_PASSWORD_SECRET", default='1234')
 
 EVIDENCES_DIR = config("DEVICEHUB_EVIDENCES_DIR", default=os.path.join(BASE_DIR, "db"))
+# Xapian index; defaults to EVIDENCES_DIR. Point it at a symlink (e.g.
+# EVIDENCES_DIR/index) to let `rebuild_index` swap in a rebuilt index
+EVIDENCES_INDEX_DIR = config("DEVICEHUB_EVIDENCES_INDEX_DIR", default="")
+# one Xapian database per institution under this directory (see the
+# split_index command); empty keeps the single shared index
+EVIDENCES_SHARDS_DIR = config("DEVICEHUB_EVIDENCES_SHARDS_DIR", default="")
+# documents written per Xapian transaction when indexing in bulk
+EVIDENCES_INDEX_BATCH_SIZE = config("DEVICEHUB_EVIDENCES_INDEX_BATCH_SIZE", default=500, cast=int)
+# search result counts are exact up to this many matches, estimated beyond
+SEARCH_EXACT_COUNT = config("DEVICEHUB_SEARCH_EXACT_COUNT", default=1000, cast=int)
+# largest page the API list endpoints serve when a client asks for one
+API_MAX_PAGE_SIZE = config("DEVICEHUB_API_MAX_PAGE_SIZE", default=1000, cast=int)
+# threads per process extracting OCR text and barcodes of uploaded photos;
+# 0 runs the extraction inline, within the upload request
+PHOTO_PROCESSING_WORKERS = config("DEVICEHUB_PHOTO_PROCESSING_WORKERS", default=2, cast=int)
+# photo jobs untouched for this long are assumed lost with their process
+# and run again (see evidence.photo_queue.requeue_stale)
+PHOTO_PROCESSING_STALE_SECONDS = config("DEVICEHUB_PHOTO_PROCESSING_STALE_SECONDS", default=900, cast=int)
+# a photo job that hit a locked index or database is run again after
+# RETRY_SECONDS, doubled on each attempt, and fails after MAX_ATTEMPTS
+PHOTO_PROCESSING_RETRY_SECONDS = config("DEVICEHUB_PHOTO_PROCESSING_RETRY_SECONDS", default=30, cast=int)
+PHOTO_PROCESSING_MAX_ATTEMPTS = config("DEVICEHUB_PHOTO_PROCESSING_MAX_ATTEMPTS", default=5, cast=int)
+# snapshots stored per batch (one DB transaction) by the bulk upload API
+SNAPSHOT_BULK_BATCH_SIZE = config("DEVICEHUB_SNAPSHOT_BULK_BATCH_SIZE", default=100, cast=int)
+# in-process LRU of parsed evidences (entries and approx. bytes they hold);
+# EVIDENCE_CACHE_BACKEND optionally names a CACHES alias shared by workers
+EVIDENCE_CACHE_ENTRIES = config("DEVICEHUB_EVIDENCE_CACHE_ENTRIES", default=2000, cast=int)
+EVIDENCE_CACHE_MAX_BYTES = config("DEVICEHUB_EVIDENCE_CACHE_MAX_BYTES", default=64 * 1024 * 1024, cast=int)
+EVIDENCE_CACHE_BACKEND = config("DEVICEHUB_EVIDENCE_CACHE_BACKEND", default="")
 
 
 # Application definition
@@ -81,6 +110,10 @@ INSTALLED_APPS = [
 
 DPP = config("DEVICEHUB_DPP", default=False, cast=bool)
 
+# Queue ProductCache rebuilds for the process_product_cache_queue worker
+# instead of running them inside the request that stored the evidence.
+PRODUCT_CACHE_DEFERRED = config("DEVICEHUB_PRODUCT_CACHE_DEFERRED", default=False, cast=bool)
+
 if DPP:
     INSTALLED_APPS.extend(["dpp", "did"])
 
@@ -0,0 +1,191 @@
+import sys
+import threading
+import types
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class EvidenceCache:
+    """Bounded LRU of parsed evidences keyed by uuid.
+
+    An indexed evidence never changes, so once its document has been
+    fetched and parsed the result (doc, DMI/inxi parse, device fields and
+    components) can be handed to every later ``Evidence(uuid)`` of this
+    process. Entries are shared between Evidence objects and must be
+    treated as read only.
+
+    The memory cap is approximate: each entry is charged the deep
+    ``sys.getsizeof`` of the objects it holds (see entry_size), again
+    whenever it grows after being parsed. When ``EVIDENCE_CACHE_BACKEND``
+    names a Django cache, the raw JSON is also stored there so other
+    workers skip the Xapian fetch.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, backend=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0, "misses": 0, "evictions": 0, "backend_hits": 0,
+        }
+
+    def _limits(self):
+        max_entries = self.max_entries
+        if max_entries is None:
+            max_entries = settings.EVIDENCE_CACHE_ENTRIES
+        max_bytes = self.max_bytes
+        if max_bytes is None:
+            max_bytes = settings.EVIDENCE_CACHE_MAX_BYTES
+        return max_entries, max_bytes
+
+    def _backend(self):
+        alias = self.backend
+        if alias is None:
+            alias = settings.EVIDENCE_CACHE_BACKEND
+        if alias:
+            return caches[alias]
+
+    @staticmethod
+    def backend_key(uuid):
+        return "evidence:{}".format(uuid)
+
+    def get(self, uuid):
+        """Parsed entry of ``uuid`` or None, counting the hit or miss."""
+        key = str(uuid)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.counters["misses"] += 1
+                return
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return item[0]
+
+    def __contains__(self, uuid):
+        with self._lock:
+            return str(uuid) in self._entries
+
+    def put(self, uuid, entry, data, share=True):
+        """Keep ``entry`` (parsed from the raw JSON ``data``) for ``uuid``.
+
+        With ``share`` the raw JSON is also written to the Django cache
+        backend, if one is configured.
+        """
+        max_entries, max_bytes = self._limits()
+        size = entry_size(entry)
+        if max_entries <= 0 or size > max_bytes:
+            return
+
+        key = str(uuid)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (entry, size)
+            self._bytes += size
+            self._evict(max_entries, max_bytes)
+
+        backend = self._backend() if share else None
+        if backend is not None:
+            backend.set(self.backend_key(key), data, timeout=None)
+
+    def resize(self, uuid):
+        """Charge the entry of ``uuid`` again, after it grew in place."""
+        max_entries, max_bytes = self._limits()
+        key = str(uuid)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return
+            size = entry_size(item[0])
+            self._entries[key] = (item[0], size)
+            self._bytes += size - item[1]
+            self._evict(max_entries, max_bytes)
+
+    def _evict(self, max_entries, max_bytes):
+        while self._entries and (
+                len(self._entries) > max_entries or self._bytes > max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.counters["evictions"] += 1
+
+    def get_data(self, uuid):
+        """Raw JSON of ``uuid`` from the Django cache backend, or None."""
+        return self.get_many_data([uuid]).get(str(uuid))
+
+    def get_many_data(self, uuids):
+        backend = self._backend()
+        if backend is None:
+            return {}
+        keys = {self.backend_key(u): str(u) for u in uuids}
+        found = backend.get_many(list(keys))
+        with self._lock:
+            self.counters["backend_hits"] += len(found)
+        return {keys[k]: v for k, v in found.items()}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        return stats
+
+
+# shared code rather than data of an entry: never charged nor followed
+SHARED_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+    types.MethodType,
+)
+
+
+def entry_size(obj):
+    """Approximate bytes held by ``obj`` and everything nested in it.
+
+    Follows containers and the attributes of instances (a DMIParse keeps
+    its whole parse in ``data``), counting each object once. Proxies and
+    mocks make attributes up as they are read, so objects with a
+    ``__getattr__`` are only charged their own size.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not hasattr(type(obj), "__getattr__"):
+            attrs = getattr(obj, "__dict__", None)
+            if isinstance(attrs, dict):
+                stack.append(attrs)
+            stack.extend(slot_values(obj))
+    return size
+
+
+def slot_values(obj):
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ("__dict__", "__weakref__") and hasattr(obj, name):
+                yield getattr(obj, name)
+
+
+evidence_cache = EvidenceCache()
@@ -1,16 +1,23 @@
 """
 Image processing utilities for OCR and barcode scanning.
 """
+import os
+import re
+import json
 import uuid
 import shutil
 import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from utils.constants import ALGOS
 from evidence.mixin_parse import BuildMix
 from utils.save_snapshots import move_json, save_in_disk
-from evidence.models import SystemProperty
-from utils.photo_evidence import save_photo_in_disk
+from evidence.models import SystemProperty, PhotoProcessing
+from utils.photo_evidence import save_photo_in_disk, get_photos_dir
 from utils.device import create_property, create_doc, create_index
 
 logger = logging.getLogger(__name__)
@@ -34,9 +41,13 @@ class Build(BuildMix):
         return self.hash
 
 
-def build_json(photo_data, image_path):
-    processing_result = process_image(image_path)
+def build_json(photo_data, image_path, processing_result=None):
+    """Photo evidence document.
 
+    Without ``processing_result`` the document is a placeholder marked as
+    ``processing: pending``; evidence.photo_queue fills in the OCR and
+    barcodes later with ``apply_processing``.
+    """
     photo_data.pop('content', None)
     photo_data.pop('file', None)
     _uuid = str(uuid.uuid4())
@@ -49,14 +60,66 @@ def build_json(photo_data, image_path):
         'photo': photo_data,
         'data': {
             'snapshot_type': "Image",
-            'ocr': {
-                'text': processing_result.get('ocr_text'),
-                'error': processing_result.get('ocr_error')
-            },
-        'barcodes': processing_result.get('barcodes', []),
-        'barcode_error': processing_result.get('barcode_error')
+            'processing': "pending",
         }
     }
+    if processing_result is not None:
+        apply_processing(doc, processing_result)
+    return doc
+
+
+def complete_photo_doc(doc, institution_name):
+    """Fill in a placeholder photo ``doc`` from its image on disk.
+
+    Used when re-indexing the stored JSON, which keeps the placeholder
+    written at upload time. Other documents are returned untouched.
+    """
+    if doc.get("type") != "photo25":
+        return doc
+    if doc.get("data", {}).get("processing") != "pending":
+        return doc
+
+    photo = doc.get("photo", {})
+    image_path = os.path.join(get_photos_dir(institution_name), photo.get("name", ""))
+    if not os.path.isfile(image_path):
+        return doc
+    result = process_image(image_path, photo.get("hash"))
+    apply_processing(doc, result)
+
+    # the document is complete: its background job has nothing left to do
+    if doc.get("uuid"):
+        PhotoProcessing.objects.filter(uuid=doc["uuid"]).exclude(
+            status=PhotoProcessing.Status.DONE,
+        ).update(
+            status=PhotoProcessing.Status.DONE,
+            error=processing_error(result),
+            updated=timezone.now(),
+        )
+    return doc
+
+
+def processing_error(processing_result):
+    """Errors of the extractors of ``process_image``, joined."""
+    return "; ".join(
+        error for error in (
+            processing_result.get("ocr_error"),
+            processing_result.get("barcode_error"),
+        )
+        if error
+    )
+
+
+def apply_processing(doc, processing_result):
+    """Store the result of ``process_image`` in the photo ``doc``."""
+    doc['data'].update({
+        'processing': "done",
+        'ocr': {
+            'text': processing_result.get('ocr_text'),
+            'error': processing_result.get('ocr_error')
+        },
+        'barcodes': processing_result.get('barcodes', []),
+        'barcode_error': processing_result.get('barcode_error')
+    })
     return doc
 
 
@@ -67,7 +130,7 @@ def process_photo_upload(photo_data, user=None, algo_key='photo25'):
     if not user:
         raise ValueError("User instance required for processing photo.")
 
-    # Save image file
+    # Save image file; OCR and barcodes are extracted in the background
     file_path = save_photo_in_disk(photo_data, user.institution.name)
     doc = build_json(photo_data, file_path)
 
@@ -86,6 +149,15 @@ def process_photo_upload(photo_data, user=None, algo_key='photo25'):
         user=user
     )
 
+    from evidence import photo_queue
+    job = PhotoProcessing.objects.create(
+        uuid=doc["uuid"],
+        owner=user.institution,
+        user=user,
+        path=file_path,
+    )
+    transaction.on_commit(lambda: photo_queue.submit(job.pk))
+
     return doc
 
 
@@ -246,12 +318,45 @@ def extract_barcodes(image_path):
         }
 
 
-def process_image(image_path):
+PHOTO_HASH = re.compile(r"[0-9a-f]{64}")
+
+
+def get_results_path(photo_hash):
+    """Cached extraction results of the photo with sha256 ``photo_hash``."""
+    return os.path.join(
+        settings.EVIDENCES_DIR, "photo_results", photo_hash[:2],
+        "{}.json".format(photo_hash)
+    )
+
+
+def load_results(photo_hash):
+    try:
+        with open(get_results_path(photo_hash)) as results_file:
+            return json.load(results_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_results(photo_hash, results):
+    path = get_results_path(photo_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    with open(tmp_path, 'w') as results_file:
+        json.dump(results, results_file)
+    os.replace(tmp_path, path)
+
+
+def process_image(image_path, photo_hash=None):
     """
     Process an image to extract text (OCR) and barcodes/QR codes.
 
+    Both extractors run at the same time. With the photo's sha256 as
+    ``photo_hash`` their successful results are kept in a content-addressed
+    cache, so processing the same photo again never re-runs them.
+
     Args:
         image_path (str): Path to the image file to process
+        photo_hash (str|None): sha256 of the image file
 
     Returns:
         dict: Dictionary containing:
@@ -260,11 +365,35 @@ def process_image(image_path):
             - barcodes (list): List of detected barcode/QR code data
             - barcode_error (str|None): Barcode scanning error message if any
     """
-    # Extract text with OCR
-    ocr_result = extract_text_with_ocr(image_path)
+    if photo_hash and not PHOTO_HASH.fullmatch(photo_hash):
+        photo_hash = None
+
+    results = load_results(photo_hash) if photo_hash else {}
+    extractors = {"ocr": extract_text_with_ocr, "barcodes": extract_barcodes}
+    missing = [name for name in extractors if name not in results]
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            futures = {
+                name: pool.submit(extractors[name], image_path)
+                for name in missing
+            }
+        fresh = {name: future.result() for name, future in futures.items()}
+        results.update(fresh)
 
-    # Extract barcodes
-    barcode_result = extract_barcodes(image_path)
+        # failures (missing tools, timeouts) are retried next time
+        cacheable = {
+            name: result for name, result in results.items()
+            if result['error'] is None
+        }
+        if photo_hash and any(name in cacheable for name in fresh):
+            try:
+                save_results(photo_hash, cacheable)
+            except OSError as err:
+                logger.warning("Could not cache results of photo %s: %s", photo_hash, err)
+
+    ocr_result = results["ocr"]
+    barcode_result = results["barcodes"]
 
     return {
         'ocr_text': ocr_result['text'],
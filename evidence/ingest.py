@@ -0,0 +1,172 @@
+import json
+import logging
+import uuid as uuidlib
+
+from django.conf import settings
+
+from device.models import Device
+from evidence.models import RootAlias, SystemProperty
+from evidence.parse import Build
+from evidence.xapian import Writer
+from utils.save_snapshots import move_json, save_in_disk
+
+
+logger = logging.getLogger('django')
+
+
+class SnapshotStream:
+    """Validate and store a stream of snapshots in batches.
+
+    Every snapshot is parsed once and validated on arrival; the valid ones
+    are stored ``batch_size`` at a time, each batch in one Xapian commit
+    and one DB transaction. The index write lock is only held while a
+    batch is indexed, never while the stream is read. ``results`` holds
+    one status per snapshot, in input order.
+    """
+
+    CREATED = "created"
+    DUPLICATE = "duplicate"
+    INVALID = "invalid"
+    FAILED = "error"
+
+    def __init__(self, user, batch_size=None):
+        self.user = user
+        self.batch_size = batch_size or settings.SNAPSHOT_BULK_BATCH_SIZE
+        self.results = []
+        self.pending = []
+        self.seen = set()
+
+    def ingest_lines(self, lines):
+        """Store the NDJSON ``lines`` (str or bytes) and return ``results``."""
+        for number, line in enumerate(lines, 1):
+            self.add_line(number, line)
+        self.flush()
+        return self.results
+
+    def _report(self, line, uuid, status, details=None):
+        result = {"line": line, "uuid": uuid, "status": status, "details": details}
+        self.results.append(result)
+        return result
+
+    def add_line(self, number, line):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            return
+
+        try:
+            data = json.loads(line)
+        except ValueError as err:
+            self._report(number, None, self.INVALID, "Invalid JSON format: {}".format(err))
+            return
+        self.add(data, number)
+
+    def add(self, data, line=None):
+        if not isinstance(data, dict):
+            self._report(line, None, self.INVALID, "Snapshot must be a JSON object")
+            return
+
+        ev_uuid = data.get("uuid")
+        if data.get("credentialSubject"):
+            ev_uuid = data["credentialSubject"].get("uuid")
+        try:
+            key = str(uuidlib.UUID(str(ev_uuid)))
+        except ValueError:
+            self._report(line, ev_uuid, self.INVALID, "Snapshot must contain a valid UUID")
+            return
+
+        if key in self.seen:
+            self._report(line, ev_uuid, self.DUPLICATE, "UUID repeated in this upload")
+            return
+        self.seen.add(key)
+
+        try:
+            build = Build(data, self.user, check=True)
+        except Exception as err:
+            logger.warning("Snapshot %s validation failed: %s", ev_uuid, err)
+            self._report(line, ev_uuid, self.INVALID, str(err))
+            return
+
+        if not build.build.uuid:
+            self._report(line, ev_uuid, self.INVALID, "Snapshot could not be parsed")
+            return
+
+        result = self._report(line, ev_uuid, None)
+        self.pending.append((result, key, build, data))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Store the pending snapshots: one Xapian commit, one transaction."""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+
+        existing = {
+            str(u) for u in SystemProperty.objects.filter(
+                uuid__in=[key for _, key, _, _ in pending],
+            ).values_list("uuid", flat=True).distinct()
+        }
+
+        batch = []
+        for result, key, build, data in pending:
+            if key in existing:
+                result.update(status=self.DUPLICATE,
+                              details="UUID {} is already registered".format(result["uuid"]))
+                continue
+            try:
+                path_name = save_in_disk(data, self.user.institution.name)
+            except Exception as err:
+                logger.error("Failed to save snapshot to disk: %s", err)
+                result.update(status=self.FAILED, details="Could not save snapshot file")
+                continue
+            batch.append((result, build, path_name))
+
+        if not batch:
+            return
+
+        try:
+            with Writer() as writer:
+                for _, build, _ in batch:
+                    build.writer = writer
+                    build.index()
+            props = SystemProperty.bulk_ingest(
+                [prop for _, build, _ in batch for prop in build.annotations()]
+            )
+        except Exception as err:
+            logger.exception("Bulk snapshot batch failed: %s", err)
+            for result, _, _ in batch:
+                result.update(status=self.FAILED, details="Snapshot processing failed")
+            return
+
+        values = {
+            str(uuidlib.UUID(str(prop.uuid))): prop.value for prop in props
+            # TODO this is hardcoded, it should select the user preferred algorithm
+            if prop.key == "ereuse24"
+        }
+        roots = dict(RootAlias.objects.filter(
+            owner=self.user.institution, alias__in=list(values.values()),
+        ).values_list("alias", "root"))
+
+        for result, build, path_name in batch:
+            if settings.DPP:
+                try:
+                    build.register_device_dlt()
+                except Exception as err:
+                    logger.error("DLT registration of %s failed: %s", build.uuid, err)
+            move_json(path_name, self.user.institution.name)
+
+            value = values.get(str(uuidlib.UUID(str(build.uuid))))
+            result["status"] = self.CREATED
+            if value:
+                result["dhid"] = Device.get_shortid_for(roots.get(value, value))
+
+    def summary(self):
+        counts = {
+            status: 0 for status in
+            (self.CREATED, self.DUPLICATE, self.INVALID, self.FAILED)
+        }
+        for result in self.results:
+            counts[result["status"]] += 1
+        return counts
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from evidence.models import PhotoProcessing
+from evidence import photo_queue
+
+logger = logging.getLogger('django')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the OCR and barcode extraction of photo evidences still "
+        "pending, e.g. jobs queued by a web worker that was restarted "
+        "before running them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Photos processed in parallel (default: 1).',
+        )
+        parser.add_argument(
+            '--requeue-running',
+            action='store_true',
+            help='Also run jobs still running, however recently started '
+                 '(stale ones are always run again).',
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Also retry jobs that failed.',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+
+        # jobs dropped by a restarted web worker, pending or half run
+        photo_queue.requeue_stale()
+
+        requeue = []
+        if options['requeue_running']:
+            requeue.append(PhotoProcessing.Status.RUNNING)
+        if options['retry_failed']:
+            requeue.append(PhotoProcessing.Status.FAILED)
+        if requeue:
+            PhotoProcessing.objects.filter(status__in=requeue).update(
+                status=PhotoProcessing.Status.PENDING, error="", attempts=0,
+            )
+
+        pending = list(PhotoProcessing.objects.filter(
+            status=PhotoProcessing.Status.PENDING,
+        ).order_by("pk").values_list("pk", flat=True))
+
+        if options['workers'] == 1:
+            done = sum(photo_queue.run(pk) for pk in pending)
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                done = sum(pool.map(photo_queue._run_in_thread, pending))
+
+        failed = PhotoProcessing.objects.filter(
+            pk__in=pending, status=PhotoProcessing.Status.FAILED,
+        ).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {done - failed} photo(s), {failed} failed.'
+        ))
@@ -0,0 +1,211 @@
+import os
+import shutil
+import logging
+from types import SimpleNamespace
+
+import xapian
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from utils.device import create_index
+from user.models import Institution
+from evidence.models import SystemProperty
+from evidence.parse import with_device_root
+from evidence.xapian import (
+    Writer, document_institution_term, document_uuid, document_uuid_term,
+    has_field_schema, has_term, has_uuid_terms, index_path, institution_term,
+    revision_marker, shards_dir, swap_index, uuid_term
+)
+from evidence.management.commands.reindex import (
+    Command as ReindexCommand, parse_snapshot
+)
+
+
+logger = logging.getLogger('django')
+
+
+class Command(ReindexCommand):
+    help = (
+        "Rebuild the evidence index offline from the JSON snapshots on "
+        "disk. The new index is written beside the live one, compacted, "
+        "checked against SystemProperty and swapped in by flipping the "
+        "DEVICEHUB_EVIDENCES_INDEX_DIR symlink; readers switch on their "
+        "next refresh. Only the index is written, never the database. "
+        "An index kept in the evidences dir itself (the default) must be "
+        "moved out once: run this with DEVICEHUB_EVIDENCES_INDEX_DIR set to "
+        "a new path, which is created as a symlink, and then restart the "
+        "web workers with it; until then their uploads are caught up from "
+        "the old index on every run. "
+        "This also migrates an index to the field-aware schema."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Swap the index in even if it has fewer documents than '
+                 'SystemProperty expects.',
+        )
+        parser.add_argument(
+            '--remove-old',
+            action='store_true',
+            help='Delete the previous index after the swap.',
+        )
+
+    def handle(self, *args, **options):
+        if shards_dir():
+            raise CommandError(
+                'The index is sharded per institution; rebuild_index only '
+                'rebuilds the shared index.'
+            )
+
+        path = os.path.abspath(index_path())
+        if not settings.EVIDENCES_INDEX_DIR:
+            raise CommandError(
+                f'The index is kept in the evidences dir {path} itself, which '
+                f'cannot be swapped. Move it out once: run rebuild_index with '
+                f'DEVICEHUB_EVIDENCES_INDEX_DIR set to a new path outside it '
+                f'(e.g. {path.rstrip(os.sep)}-index), then restart the web '
+                f'workers with that setting.'
+            )
+        if os.path.exists(path) and not os.path.islink(path):
+            raise CommandError(
+                f'{path} is a directory. Set DEVICEHUB_EVIDENCES_INDEX_DIR '
+                f'to a path that does not exist yet, or to a symlink.'
+            )
+
+        stamp = timezone.now().strftime("%Y%m%d%H%M%S")
+        build = f'{path}.build-{stamp}'
+        shadow = f'{path}.{stamp}'
+
+        self.failed = 0
+        with Writer(path=build) as self.writer:
+            if os.path.isdir(self.EVIDENCES):
+                for f_path, user in self.iter_files(self.EVIDENCES):
+                    self.add_file(f_path, user)
+
+        xapian.Database(build).compact(shadow)
+        shutil.rmtree(build, ignore_errors=True)
+
+        copied = sum(
+            self.catch_up(live, shadow) for live in self.live_indexes(path)
+        )
+        if copied:
+            self.stdout.write(
+                f'Copied {copied} document(s) indexed meanwhile or missing on disk.')
+
+        problems = self.verify(shadow)
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems and not options['force']:
+            raise CommandError(f'Rebuilt index left at {shadow}, not swapped in.')
+
+        previous = swap_index(path, shadow)
+        if previous and options['remove_old']:
+            shutil.rmtree(previous)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Index rebuilt at {shadow} with {self.writer.added} document(s), '
+            f'{self.failed} file(s) failed.'
+        ))
+
+    def add_file(self, f_path, user):
+        kind, payload = parse_snapshot(f_path, user.institution.name)
+        if kind == "snapshot":
+            ev_uuid, snap, _, fields = payload
+            fields = with_device_root(user.institution, fields)
+            self.writer.add(user.institution, ev_uuid, snap, fields)
+        elif kind == "placeholder":
+            create_index(payload, user, writer=self.writer)
+        else:
+            logger.warning("%s %s", payload, f_path)
+            self.failed += 1
+
+    def live_indexes(self, path):
+        """Indexes the rebuilt one must catch up with.
+
+        The live index and, once the index has been moved out of the
+        evidences dir, the old one still there: web workers not yet
+        restarted with DEVICEHUB_EVIDENCES_INDEX_DIR keep writing to it.
+        """
+        indexes = [path] if os.path.exists(path) else []
+        legacy = os.path.abspath(self.EVIDENCES)
+        if legacy != path and revision_marker(legacy) is not None:
+            indexes.append(legacy)
+        return indexes
+
+    def catch_up(self, path, shadow):
+        """Copy documents of the live index missing from the rebuilt one.
+
+        These are evidences uploaded while the rebuild ran, or whose JSON
+        is gone from disk. Documents of an index older than the field
+        schema are indexed anew from their data.
+        """
+        live = xapian.Database(path)
+        rebuilt = xapian.WritableDatabase(shadow, xapian.DB_OPEN)
+        migrate = not has_field_schema(live)
+        builder = Writer(shadow)
+        copied = 0
+        try:
+            for ev_uuid, doc in missing_documents(live, rebuilt):
+                institution = document_institution_term(doc)
+                if migrate and institution:
+                    doc = builder.document(
+                        SimpleNamespace(id=int(institution[1:])),
+                        ev_uuid, doc.get_data(),
+                    )
+                elif not has_term(doc, uuid_term(ev_uuid)):
+                    doc.add_boolean_term(uuid_term(ev_uuid))
+                rebuilt.add_document(doc)
+                copied += 1
+            rebuilt.commit()
+        finally:
+            rebuilt.close()
+            live.close()
+        return copied
+
+    def verify(self, shadow):
+        """Institutions with fewer documents than evidences in SystemProperty."""
+        database = xapian.Database(shadow)
+        problems = []
+        try:
+            expected = SystemProperty.objects.values("owner").annotate(
+                evidences=Count("uuid", distinct=True),
+            )
+            names = dict(Institution.objects.values_list("id", "name"))
+            for row in expected:
+                owner = Institution(id=row["owner"])
+                found = database.get_termfreq(institution_term(owner))
+                if found < row["evidences"]:
+                    problems.append(
+                        f'{names.get(row["owner"])}: {found} document(s) '
+                        f'indexed, {row["evidences"]} expected.'
+                    )
+        finally:
+            database.close()
+        return problems
+
+
+def missing_documents(live, rebuilt):
+    """(uuid, document) of each document of ``live`` whose uuid is not in
+    ``rebuilt``.
+
+    Documents are found by their Q<uuid> term. An index not backfilled by
+    xapian_uuid_terms yet may hold documents without one, so there every
+    document is read and its uuid taken from its data.
+    """
+    if has_uuid_terms(live):
+        for item in live.allterms("Q"):
+            if rebuilt.term_exists(item.term):
+                continue
+            for posting in live.postlist(item.term):
+                yield item.term.decode()[1:], live.get_document(posting.docid)
+        return
+
+    for posting in live.postlist(""):
+        doc = live.get_document(posting.docid)
+        ev_uuid = document_uuid_term(doc) or document_uuid(doc.get_data())
+        if ev_uuid and not rebuilt.term_exists(uuid_term(ev_uuid)):
+            yield ev_uuid, doc
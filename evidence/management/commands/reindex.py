@@ -1,27 +1,119 @@
 import os
 import json
+import time
+import uuid as uuidlib
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connections
 
 from utils.device import create_property, create_doc, create_index
 from user.models import Institution
-from evidence.parse import Build
+from evidence.models import SystemProperty
+from evidence.parse import Build, with_device_root
+from evidence.image_processing import complete_photo_doc
+from evidence.xapian import Writer
 
 
 logger = logging.getLogger('django')
 
 
+def parse_snapshot(filepath, institution_name):
+    """Read, parse and hash one stored evidence; returns (kind, payload).
+
+    Module level so the process pool can pickle it. ``kind`` is
+    "snapshot" with (uuid, JSON, algorithms, index fields), "placeholder"
+    with the document, or "error" with the reason.
+    """
+    try:
+        with open(filepath, 'r') as f:
+            content = json.loads(f.read())
+    except Exception:
+        return "error", "Not can open"
+
+    if content.get("type") == "Websnapshot":
+        return "placeholder", content
+
+    try:
+        content = complete_photo_doc(content, institution_name)
+        build = Build(content, None, check=True)
+    except Exception as err:
+        return "error", "Error: in Snapshot: {}".format(err)
+
+    if not build.build.uuid:
+        return "error", "Snapshot without uuid"
+    snap = json.dumps(build.evidence)
+    return "snapshot", (
+        build.uuid, snap, build.build.algorithms, build.index_fields()
+    )
+
+
 class Command(BaseCommand):
-    help = "Reindex snapshots"
+    help = (
+        "Reindex snapshots. With --workers, snapshots are parsed in a "
+        "process pool and indexed and annotated in batches; that mode does "
+        "not register devices in the DLT."
+    )
     EVIDENCES = settings.EVIDENCES_DIR
 
-    def handle(self, *args, **kwargs):
-        if os.path.isdir(self.EVIDENCES):
-            self.read_files(self.EVIDENCES)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Processes parsing snapshots in parallel (default: serial '
+                 'reindex, one Build per file).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Files indexed and annotated per batch with --workers '
+                 '(default: DEVICEHUB_EVIDENCES_INDEX_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=None,
+            help='File recording the files already reindexed with --workers '
+                 '(default: reindex.checkpoint in the evidences dir).',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the files recorded in the checkpoint by an '
+                 'interrupted run.',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(self.EVIDENCES):
+            return
+
+        self.done = self.failed = 0
+        self.start = time.monotonic()
+        if options.get('workers') is None:
+            with Writer() as self.writer:
+                self.pending = []
+                self.read_files(self.EVIDENCES)
+                self.annotate_pending()
+        else:
+            self.reindex_parallel(options)
+
+        elapsed = time.monotonic() - self.start
+        self.stdout.write(self.style.SUCCESS(
+            f'Reindexed {self.done - self.failed} file(s) in {elapsed:.0f}s '
+            f'({self.done / max(elapsed, 0.001):.1f} files/s), '
+            f'{self.failed} failed.'
+        ))
 
     def read_files(self, directory):
+        for f_path, user in self.iter_files(directory):
+            self.process(f_path, user)
+
+    def iter_files(self, directory):
+        """(path, admin user) of every stored evidence, per institution."""
         for filename in os.listdir(directory):
             filepath = os.path.join(directory, filename)
             if not os.path.isdir(filepath):
@@ -44,19 +136,21 @@ class Command(BaseCommand):
             for f in os.listdir(snapshots_path):
                 f_path = os.path.join(snapshots_path, f)
                 if f_path[-5:] == ".json" and os.path.isfile(f_path):
-                    self.process(f_path, user)
+                    yield f_path, user
 
             for f in os.listdir(placeholders_path):
                 f_path = os.path.join(placeholders_path, f)
                 if f_path[-5:] == ".json" and os.path.isfile(f_path):
-                    self.process(f_path, user)
+                    yield f_path, user
 
     def process(self, filepath, user):
+        self.done += 1
         try:
             with open(filepath, 'r') as f:
                 content = json.loads(f.read())
         except Exception:
             logger.warning("Not can open %s", filepath)
+            self.failed += 1
             return
 
         if content.get("type") == "Websnapshot":
@@ -66,13 +160,161 @@ class Command(BaseCommand):
 
     def build_placeholder(self, s, user, f_path):
         try:
-            create_index(s, user)
-            create_property(s, user, commit=True)
+            create_index(s, user, writer=self.writer)
         except Exception as err:
             logger.warning("In placeholder %s \n%s", f_path, err)
+            self.failed += 1
+            return
+        self.defer(f_path, lambda: create_property(s, user, commit=True))
 
     def build_snapshot(self, s, user, f_path):
         try:
-            Build(s, user)
+            s = complete_photo_doc(s, user.institution.name)
+            build = Build(s, user, check=True, writer=self.writer)
+            if not build.build.uuid:
+                self.failed += 1
+                return
+            build.index()
         except Exception:
             logger.error("Error: in Snapshot %s", f_path)
+            self.failed += 1
+            return
+        self.defer(f_path, build.annotate)
+
+    def defer(self, f_path, annotate):
+        self.pending.append((f_path, annotate))
+        if len(self.pending) >= self.writer.batch_size:
+            self.annotate_pending()
+
+    def annotate_pending(self):
+        """Annotate the indexed files once their documents are committed,
+        since annotating rebuilds the ProductCache from the index."""
+        pending, self.pending = self.pending, []
+        self.writer.commit()
+        for f_path, annotate in pending:
+            try:
+                annotate()
+            except Exception as err:
+                logger.error("Error: in Snapshot %s %s", f_path, err)
+
+    def reindex_parallel(self, options):
+        workers = options['workers']
+        batch_size = options.get('batch_size') or settings.EVIDENCES_INDEX_BATCH_SIZE
+        if workers < 1 or batch_size < 1:
+            raise CommandError('--workers and --batch-size must be positive')
+
+        checkpoint = options.get('checkpoint') or os.path.join(
+            self.EVIDENCES, "reindex.checkpoint")
+        if not options.get('resume') and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.finished = read_checkpoint(checkpoint)
+
+        files = [
+            (f_path, user) for f_path, user in self.iter_files(self.EVIDENCES)
+            if f_path not in self.finished
+        ]
+        batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+
+        if workers == 1:
+            with Writer(batch_size=batch_size) as self.writer:
+                for batch in batches:
+                    self.store_batch(batch, [
+                        parse_snapshot(f_path, user.institution.name)
+                        for f_path, user in batch
+                    ])
+                    self.batch_done(checkpoint, len(files))
+        else:
+            self.run_pool(workers, batch_size, batches, checkpoint, len(files))
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def run_pool(self, workers, batch_size, batches, checkpoint, total):
+        # children must not share the parent's database sockets
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # Not entered: the index is only opened by the first add of
+            # store_batch, after the first submit forked every worker, and
+            # it is closed again on each batch commit, so no worker ever
+            # inherits the write lock.
+            self.writer = Writer(batch_size=batch_size)
+
+            def submit(batch):
+                return [
+                    pool.submit(parse_snapshot, f_path, user.institution.name)
+                    for f_path, user in batch
+                ]
+
+            try:
+                # the next batch is parsed while the current one is stored
+                futures = submit(batches[0]) if batches else []
+                for n, batch in enumerate(batches):
+                    current = futures
+                    futures = submit(batches[n + 1]) if n + 1 < len(batches) else []
+                    self.store_batch(batch, [future.result() for future in current])
+                    self.batch_done(checkpoint, total)
+            finally:
+                self.writer.close()
+
+    def store_batch(self, batch, results):
+        """One Xapian commit and one bulk annotation per batch of files."""
+        props = []
+        for (f_path, user), (kind, payload) in zip(batch, results):
+            if kind == "snapshot":
+                ev_uuid, snap, algorithms, fields = payload
+                fields = with_device_root(user.institution, fields)
+                self.writer.add(user.institution, ev_uuid, snap, fields)
+                props.extend(
+                    SystemProperty(
+                        uuid=ev_uuid,
+                        owner=user.institution,
+                        user=user,
+                        key=k,
+                        value="{}:{}".format(k, v),
+                    )
+                    for k, v in algorithms.items()
+                )
+            elif kind == "placeholder":
+                create_index(payload, user, writer=self.writer)
+                prop = create_property(payload, user)
+                if prop:
+                    props.append(prop)
+            else:
+                logger.warning("%s %s", payload, f_path)
+                self.failed += 1
+        self.writer.commit()
+
+        # evidences already annotated are skipped, as Build does
+        existing = set(SystemProperty.objects.filter(
+            uuid__in={str(prop.uuid) for prop in props},
+        ).values_list("uuid", "owner"))
+        SystemProperty.bulk_ingest([
+            prop for prop in props
+            if (uuidlib.UUID(str(prop.uuid)), prop.owner.pk) not in existing
+        ])
+
+        self.done += len(batch)
+        self.finished.update(f_path for f_path, _ in batch)
+
+    def batch_done(self, checkpoint, total):
+        write_checkpoint(checkpoint, self.finished)
+        elapsed = time.monotonic() - self.start
+        self.stdout.write(
+            f'{self.done}/{total} files, '
+            f'{self.done / max(elapsed, 0.001):.1f} files/s'
+        )
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f).get("done", []))
+
+
+def write_checkpoint(path, finished):
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "w") as f:
+        json.dump({"done": sorted(finished)}, f)
+    os.replace(tmp, path)
@@ -0,0 +1,55 @@
+"""
+Split the shared evidence index into one Xapian database per institution.
+
+Usage:
+    manage.py split_index --shards-dir /srv/devicehub/shards
+
+Every document goes to the shard of its U<institution id> term. The shared
+index is only read; once the split is done, set
+DEVICEHUB_EVIDENCES_SHARDS_DIR to the same directory and restart the
+workers to serve the sharded layout. Running it again rewrites the shards.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from evidence.xapian import index_path, split_index
+
+
+class Command(BaseCommand):
+    help = "Split the shared evidence index into one shard per institution"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            default=None,
+            help="Shared index to split (default: the evidence index).",
+        )
+        parser.add_argument(
+            "--shards-dir",
+            default=settings.EVIDENCES_SHARDS_DIR,
+            help="Directory of the shards (default: DEVICEHUB_EVIDENCES_SHARDS_DIR).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.EVIDENCES_INDEX_BATCH_SIZE,
+            help="Documents copied per Xapian transaction.",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["shards_dir"]
+        if not directory:
+            raise CommandError("--shards-dir or DEVICEHUB_EVIDENCES_SHARDS_DIR is required")
+
+        copied, skipped = split_index(
+            options["source"] or index_path(), directory,
+            batch_size=options["batch_size"],
+        )
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"{skipped} documents without an institution were skipped."
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {copied} documents copied to {directory}."
+        ))
@@ -7,6 +7,7 @@ from django.contrib.auth import get_user_model
 
 from utils.save_snapshots import move_json, save_in_disk
 from evidence.parse import Build
+from evidence.xapian import Writer
 
 
 logger = logging.getLogger('django')
@@ -57,11 +58,36 @@ class Command(BaseCommand):
             logger.error("Could not open file %s: %s", filepath, e)
 
     def parsing(self):
-        for s, p in self.snapshots:
+        with Writer() as writer:
+            pending = []
+            for s, p in self.snapshots:
+                try:
+                    build = Build(s, self.user, check=True, writer=writer)
+                    if build.build.uuid:
+                        build.index()
+                    pending.append((s, p, build))
+                except Exception as e:
+                    self.parse_error(s, e)
+                    continue
+                if len(pending) >= writer.batch_size:
+                    self.annotate(writer, pending)
+                    pending = []
+            self.annotate(writer, pending)
+
+    def annotate(self, writer, pending):
+        # the annotations rebuild the ProductCache from the index, so
+        # the documents must be committed first
+        writer.commit()
+        for s, p, build in pending:
             try:
-                self.devices.append(Build(s, self.user))
+                if build.build.uuid:
+                    build.annotate()
+                self.devices.append(build)
                 move_json(p, self.user.institution.name)
             except Exception as e:
-                snapshot_id = s.get("uuid", "")
-                txt = "Could not parse snapshot %s: %s"
-                logger.error(txt, snapshot_id, e)
+                self.parse_error(s, e)
+
+    def parse_error(self, snapshot, error):
+        snapshot_id = snapshot.get("uuid", "")
+        txt = "Could not parse snapshot %s: %s"
+        logger.error(txt, snapshot_id, error)
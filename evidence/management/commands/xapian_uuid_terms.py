@@ -0,0 +1,36 @@
+"""
+Backfill the unique Q<uuid> term on evidence documents indexed before it
+existed, so Evidence.get_doc can resolve them with a direct postlist lookup.
+
+Usage:
+    manage.py xapian_uuid_terms
+
+Safe to run more than once: documents that already carry the term are left
+untouched.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from evidence.xapian import backfill_uuid_terms
+
+
+class Command(BaseCommand):
+    help = "Add the Q<uuid> lookup term to every document of the evidence index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.EVIDENCES_INDEX_BATCH_SIZE,
+            help="Documents rewritten per Xapian transaction.",
+        )
+
+    def handle(self, *args, **options):
+        updated, skipped = backfill_uuid_terms(batch_size=options["batch_size"])
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f"{skipped} documents without a uuid were skipped; "
+                "lookups keep using the parsed uuid query."
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Total: {updated} documents updated."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("evidence", "0013_photoprocessing"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="photoprocessing",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
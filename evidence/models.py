@@ -1,9 +1,10 @@
 import json
 import hashlib
+import logging
 import re
 
 from dmidecode import DMIParse
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
@@ -11,13 +12,16 @@ from django.conf import settings
 
 from django.db.models import Q
 from utils.constants import STR_EXTEND_SIZE, CHASSIS_DH
-from evidence.xapian import search
+from evidence.xapian import get_document_by_uuid, get_documents_by_uuids
+from evidence.cache import evidence_cache
 from evidence.parse_details import ParseSnapshot
 from evidence.normal_parse_details import get_inxi, get_inxi_key
 
 from device.product_cache import ProductCache
 
 
+logger = logging.getLogger('django')
+
 
 class Property(models.Model):
     created = models.DateTimeField(auto_now_add=True)
@@ -52,6 +56,35 @@ class SystemProperty(Property):
     def hid(self):
         return self.value.split(":")[1]
 
+    @classmethod
+    def bulk_ingest(cls, properties):
+        """Store the unsaved ``properties`` without per-row signal work.
+
+        One ``bulk_create`` of the properties (an existing ``(key, uuid)``
+        is skipped), one of their missing self-referential RootAlias rows
+        and one ``updated`` bump of the existing ones, all in a single
+        transaction; then one ProductCache refresh per affected root.
+        bulk_create sends no post_save, so this does in bulk what
+        ``ensure_root_alias_self_reference`` does per row.
+        """
+        properties = list(properties)
+        if not properties:
+            return []
+
+        by_owner = {}
+        for prop in properties:
+            by_owner.setdefault(prop.owner, []).append(prop)
+
+        roots = {}
+        with transaction.atomic():
+            cls.objects.bulk_create(properties, ignore_conflicts=True)
+            for owner, props in by_owner.items():
+                roots[owner] = RootAlias.ensure_self_references(owner, props)
+
+        for owner, owner_roots in roots.items():
+            ProductCache.schedule(owner, *sorted(owner_roots))
+        return properties
+
 
 class UserProperty(Property):
 
@@ -83,6 +116,42 @@ class UserProperty(Property):
         ]
 
 
+class PhotoProcessing(models.Model):
+    """OCR and barcode extraction of a photo evidence.
+
+    A photo is indexed at once with a placeholder document; a job row per
+    photo tracks the background extraction so the UI can poll it and
+    pending jobs survive a restart (see evidence.photo_queue).
+    """
+
+    class Status(models.IntegerChoices):
+        PENDING = 1, "Pending"
+        RUNNING = 2, "Running"
+        DONE = 3, "Done"
+        FAILED = 4, "Failed"
+
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+    owner = models.ForeignKey('user.Institution', on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    uuid = models.UUIDField(unique=True)
+    path = models.CharField(max_length=STR_EXTEND_SIZE)
+    status = models.SmallIntegerField(choices=Status, default=Status.PENDING)
+    error = models.TextField(blank=True, default="")
+    # runs postponed because the index or the database was locked
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status"], name="photoprocessing_status_idx"),
+        ]
+
+    @property
+    def finished(self):
+        return self.status in (self.Status.DONE, self.Status.FAILED)
+
+
 class RootAlias(models.Model):
     """All SystemProperty.value have one RootAlias.alias and no more than one
        RootAlias.root is editable but RootAlias.alias is not possible
@@ -125,6 +194,40 @@ class RootAlias(models.Model):
         row = cls.objects.filter(owner=owner, alias=v).values("root").first()
         return row["root"] if row else v
 
+    @classmethod
+    def ensure_self_references(cls, owner, properties):
+        """Self-referential rows for the values of ``properties``.
+
+        Every SystemProperty value of ``owner`` gets a RootAlias row
+        (``alias=root=value``) seeded from the property's ``created``;
+        existing rows only get ``updated`` bumped, never regressed.
+        Returns the canonical roots of those values.
+        """
+        latest = {}
+        for prop in properties:
+            seen = latest.get(prop.value)
+            if seen is None or prop.created > seen.created:
+                latest[prop.value] = prop
+
+        cls.objects.bulk_create([
+            cls(owner=owner, alias=value, root=value, user=prop.user,
+                created=prop.created, updated=prop.created)
+            for value, prop in latest.items()
+        ], ignore_conflicts=True)
+
+        by_time = {}
+        for value, prop in latest.items():
+            by_time.setdefault(prop.created, []).append(value)
+        for when, values in by_time.items():
+            cls.objects.filter(
+                owner=owner, alias__in=values, updated__lt=when,
+            ).update(updated=when)
+
+        return set(
+            cls.objects.filter(owner=owner, alias__in=list(latest))
+            .values_list("root", flat=True)
+        )
+
     @classmethod
     def physical_aliases(cls, owner, v):
         """All ids known to belong to the same canonical device as ``v``.
@@ -146,6 +249,30 @@ class RootAlias(models.Model):
         aliases.add(v)
         return list(aliases)
 
+    @classmethod
+    def physical_roots(cls, owner, ids):
+        """``physical_aliases`` for many ids in one query.
+
+        Returns a dict mapping every id known to belong to the same
+        canonical device as one of ``ids`` to that canonical root: the ids
+        themselves (falling back to themselves as in ``resolve_root``),
+        their roots and every sibling alias. Its keys are the
+        ``device_id__in=...`` filter, its values the canonical devices.
+        """
+        ids = set(ids)
+        roots = cls.objects.filter(owner=owner, alias__in=ids).values("root")
+        rows = cls.objects.filter(owner=owner).filter(
+            Q(alias__in=ids) | Q(root__in=ids) | Q(root__in=roots)
+        ).values_list("alias", "root")
+
+        to_root = {}
+        for alias, root in rows:
+            to_root[alias] = root
+            to_root.setdefault(root, root)
+        for v in ids:
+            to_root.setdefault(v, v)
+        return to_root
+
     # -- depth-1 invariant helpers -------------------------------------
 
     @classmethod
@@ -221,15 +348,7 @@ class RootAlias(models.Model):
             # The read model follows the canonical change: rebuild the gaining
             # root; rebuild the losing root if it still has aliases, else drop
             # it (``alias`` was its last child, mirroring _sync_memberships).
-            ProductCache.rebuild(owner, new_root)
-            if old_root is not None:
-                old_still_canonical = cls.objects.filter(
-                    owner=owner, root=old_root
-                ).exists()
-                if old_still_canonical:
-                    ProductCache.rebuild(owner, old_root)
-                else:
-                    ProductCache.drop(owner, old_root)
+            ProductCache.schedule(owner, new_root, old_root)
         return obj
 
     @classmethod
@@ -334,57 +453,181 @@ def ensure_root_alias_self_reference(sender, instance, created, **kwargs):
     """
     if not created:
         return
-    existing = RootAlias.objects.filter(
-        owner=instance.owner, alias=instance.value,
-    ).first()
-    if existing is None:
-        RootAlias.objects.create(
-            owner=instance.owner,
-            alias=instance.value,
-            root=instance.value,
-            user=instance.user,
-            created=instance.created,
-            updated=instance.created,
-        )
-    elif instance.created > existing.updated:
-        RootAlias.objects.filter(pk=existing.pk).update(
-            updated=instance.created,
-        )
+    roots = RootAlias.ensure_self_references(instance.owner, [instance])
 
     # A new evidence changes the device's latest state: refresh its read model.
-    root = RootAlias.resolve_root(instance.owner, instance.value)
-    ProductCache.rebuild(instance.owner, root)
+    ProductCache.schedule(instance.owner, *roots)
 
 
 class Evidence:
-    def __init__(self, uuid):
+    # attributes parse() derives from the document, kept in evidence_cache
+    PARSED_FIELDS = (
+        "_dmi", "_inxi", "device_manufacturer", "device_model",
+        "device_serial_number", "device_chassis", "device_version",
+    )
+
+    def __init__(self, uuid, properties=None, data=None):
+        """
+        Nothing is read here: the SystemProperty rows, the indexed document
+        and its DMI/inxi/components parse are each loaded the first time an
+        attribute or getter needs them.
+
+        ``properties`` (SystemProperty rows of this uuid, oldest first) and
+        ``data`` (the indexed JSON) may be handed in by load_many so nothing
+        is fetched per evidence.
+        """
         self.uuid = uuid
-        self.uploaded_by = None
-        self.owner = None
-        self.doc = None
-        self.created = None
-        self.dmi = None
-        self.inxi = None
-        self.properties = []
-        self.components = []
         self.default = "n/a"
+        self._properties = properties
+        self._owner = None
+        self._uploaded_by = None
+        self._owner_loaded = False
+        self._data = data
+        self._doc = None
+        self._created = None
+        self._parsed = False
+        self._dmi = None
+        self._inxi = None
+        self._components = []
+        self._cache_entry = None
+
+    @classmethod
+    def load_many(cls, owner, uuids):
+        """Evidences of ``uuids``, in the same order, in two round trips.
+
+        One SystemProperty query and one Xapian query cover every uuid not
+        already in evidence_cache. An evidence whose document is not valid
+        JSON is logged and left out.
+        """
+        uuids = list(uuids)
+        if not uuids:
+            return []
+
+        properties = {}
+        qs = SystemProperty.objects.filter(
+            uuid__in=uuids
+        ).select_related("owner", "user").order_by("created")
+        for prop in qs:
+            properties.setdefault(str(prop.uuid), []).append(prop)
+
+        missing = [u for u in uuids if u not in evidence_cache]
+        docs = evidence_cache.get_many_data(missing)
+        missing = [u for u in missing if str(u) not in docs]
+        if missing:
+            docs.update(get_documents_by_uuids(owner, missing))
+
+        evidences = []
+        for uuid in uuids:
+            key = str(uuid)
+            # cached evidences pass no data and are served by get_doc
+            data = None if uuid in evidence_cache else docs.get(key, "")
+            evidence = cls(
+                uuid,
+                properties=properties.get(key, []),
+                data=data,
+            )
+            try:
+                evidence.doc
+            except Exception as err:
+                logger.warning("Could not load evidence %s: %s", uuid, err)
+                continue
+            evidences.append(evidence)
+        return evidences
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            self.get_properties()
+        return self._properties
+
+    @properties.setter
+    def properties(self, value):
+        self._properties = value
+
+    @property
+    def owner(self):
+        if not self._owner_loaded:
+            self.get_owner()
+        return self._owner
 
-        self.get_owner()
-        self.get_time()
+    @owner.setter
+    def owner(self, value):
+        self._owner = value
+        self._owner_loaded = True
+
+    @property
+    def uploaded_by(self):
+        if not self._owner_loaded:
+            self.get_owner()
+        return self._uploaded_by
+
+    @uploaded_by.setter
+    def uploaded_by(self, value):
+        self._uploaded_by = value
+
+    @property
+    def doc(self):
+        if self._doc is None:
+            self.get_doc()
+        return self._doc
+
+    @doc.setter
+    def doc(self, value):
+        self._doc = value
+
+    @property
+    def created(self):
+        if self._created is None:
+            self.get_time()
+        return self._created
+
+    @created.setter
+    def created(self, value):
+        self._created = value
+
+    @property
+    def dmi(self):
+        self.parse()
+        return self._dmi
+
+    @dmi.setter
+    def dmi(self, value):
+        self._parsed = True
+        self._dmi = value
+
+    @property
+    def inxi(self):
+        self.parse()
+        return self._inxi
+
+    @inxi.setter
+    def inxi(self, value):
+        self._parsed = True
+        self._inxi = value
+
+    @property
+    def components(self):
+        # only beta and web snapshots get their components from parse()
+        if not self._parsed and (self.is_beta() or self.doc.get("WEB_ID")):
+            self.parse()
+        return self._components
+
+    @components.setter
+    def components(self, value):
+        self._components = value
 
     def get_properties(self):
         # TODO is good not filter by institution?
-        self.properties = SystemProperty.objects.filter(
+        self._properties = SystemProperty.objects.filter(
             uuid=self.uuid
         ).order_by("created")
 
     def get_owner(self):
-        if not self.properties:
-            self.get_properties()
-        a = self.properties.first()
+        self._owner_loaded = True
+        a = self.properties[0] if self.properties else None
         if a:
-            self.owner = a.owner
-            self.uploaded_by = a.user
+            self._owner = a.owner
+            self._uploaded_by = a.user
 
     def get_phid(self):
         if not self.doc:
@@ -393,22 +636,82 @@ class Evidence:
         return hashlib.sha3_256(json.dumps(self.doc)).hexdigest()
 
     def get_doc(self):
-        self.doc = {}
-        self.inxi = None
+        self._doc = {}
 
-        if not self.owner:
-            self.get_owner()
+        if self._data is not None:
+            data, self._data = self._data, None
+            self.load_doc(data)
+            return
+
+        entry = evidence_cache.get(self.uuid)
+        if entry is not None:
+            self._use_cache_entry(entry)
+            return
+
+        data = evidence_cache.get_data(self.uuid)
+        share = data is None
+        if data is None:
+            xdoc = get_document_by_uuid(self.owner, self.uuid)
+            if xdoc is None:
+                return
+            data = xdoc.get_data()
 
-        qry = 'uuid:"{}"'.format(self.uuid)
-        matches = search(self.owner, qry, limit=1)
-        if matches and matches.size() < 0:
+        self.load_doc(data, share=share)
+
+    def load_doc(self, data, share=True):
+        self._doc = json.loads(data) if data else {}
+        self._parsed = False
+        self._cache_entry = None
+        if not self._doc:
+            return
+        self._cache_entry = {"doc": self._doc}
+        if self.is_processing():
+            # the document is rewritten once the photo is processed
+            return
+        evidence_cache.put(self.uuid, self._cache_entry, data, share=share)
+
+    def _use_cache_entry(self, entry):
+        self._cache_entry = entry
+        self._doc = entry["doc"]
+        self._parsed = False
+        if entry.get("components") is not None:
+            self._components = entry["components"]
+        if entry.get("parsed"):
+            for name in self.PARSED_FIELDS:
+                if name in entry:
+                    setattr(self, name, entry[name])
+            self._parsed = True
+
+    def parse(self):
+        """Parse the DMI/inxi data (and beta components) of the document.
+
+        Runs at most once per document; the result is shared through
+        evidence_cache with later Evidence objects of the same uuid.
+        """
+        if self._parsed:
             return
+        self._parsed = True
+        self._parse_doc()
 
-        for xa in matches:
-            self.doc = json.loads(xa.document.get_data())
+        entry = self._cache_entry
+        if entry is None:
+            return
+        for name in self.PARSED_FIELDS:
+            if name in self.__dict__:
+                entry[name] = self.__dict__[name]
+        if self.is_beta():
+            entry["components"] = self._components
+        entry["parsed"] = True
+        evidence_cache.resize(self.uuid)
+
+    def _parse_doc(self):
+        doc = self.doc
+        self._inxi = None
+        if not doc:
+            return
 
         if self.is_beta():
-            parse = ParseSnapshot(self.doc)
+            parse = ParseSnapshot(doc)
             device = parse.device
             if not device:
                 return
@@ -417,63 +720,64 @@ class Evidence:
             self.device_serial_number = device.get("serialNumber") or ''
             self.device_chassis = device.get("chassis") or ''
             self.device_version = device.get("version") or ''
-            self.components = parse.components
-
-        dmidecode_raw = self.doc.get("data", {}).get("dmidecode", "")
-        self.dmi = DMIParse(dmidecode_raw)
-
-        if self.is_legacy():
-            return
-
-        if self.doc.get("credentialSubject"):
-            for ev in self.doc["evidence"]:
-                if "dmidecode" == ev.get("operation"):
+            self._components = parse.components
+
+        # pick the dmidecode output first so it is parsed only once
+        dmidecode_raw = doc.get("data", {}).get("dmidecode", "")
+        inxi = None
+        legacy = self.is_legacy()
+
+        if legacy:
+            pass
+        elif doc.get("credentialSubject"):
+            for ev in doc["evidence"]:
+                if "dmidecode" == ev.get("operation") and ev["output"]:
                     dmidecode_raw = ev["output"]
-                    if dmidecode_raw:
-                        self.dmi = DMIParse(dmidecode_raw)
                 if "inxi" == ev.get("operation"):
-                    self.inxi = ev["output"]
+                    inxi = ev["output"]
                     if isinstance(ev["output"], str):
-                        self.inxi = json.loads(ev["output"])
-        elif self.doc.get("WEB_ID"):
+                        inxi = json.loads(ev["output"])
+        elif doc.get("WEB_ID"):
             self.get_components()
         else:
-            dmidecode_raw = self.doc["data"]["dmidecode"]
-            inxi_raw = self.doc.get("data", {}).get("inxi")
-            self.dmi = DMIParse(dmidecode_raw)
+            dmidecode_raw = doc["data"]["dmidecode"]
+            inxi_raw = doc.get("data", {}).get("inxi")
             try:
-                self.inxi = json.loads(inxi_raw)
+                inxi = json.loads(inxi_raw)
             except Exception:
                 pass
-        if self.inxi:
-            try:
-                if isinstance(self.inxi, str):
-                    self.inxi = json.loads(self.inxi)
-                machine = get_inxi_key(self.inxi, 'Machine')
-                for m in machine:
-                    system = get_inxi(m, "System")
-                    if system:
-                        self.device_manufacturer = system
-                        self.device_model = get_inxi(m, "product")
-                        self.device_serial_number = get_inxi(m, "serial")
-                        self.device_version = get_inxi(m, "v")
-                    else:
-                        self.device_manufacturer = getattr(self, 'device_manufacturer', '') or get_inxi(m, "Mobo")
-                        self.device_model = getattr(self, 'device_model', '') or get_inxi(m, "model")
-                        self.device_serial_number = getattr(self, 'device_serial_number', '') or get_inxi(m, "serial")
-                    self.device_chassis = getattr(self, 'device_chassis', '') or get_inxi(m, "Type")
-            except Exception:
-                return
+
+        self._dmi = DMIParse(dmidecode_raw)
+        self._inxi = inxi
+        if legacy or not inxi:
+            return
+
+        try:
+            if isinstance(self._inxi, str):
+                self._inxi = json.loads(self._inxi)
+            machine = get_inxi_key(self._inxi, 'Machine')
+            for m in machine:
+                system = get_inxi(m, "System")
+                if system:
+                    self.device_manufacturer = system
+                    self.device_model = get_inxi(m, "product")
+                    self.device_serial_number = get_inxi(m, "serial")
+                    self.device_version = get_inxi(m, "v")
+                else:
+                    self.device_manufacturer = getattr(self, 'device_manufacturer', '') or get_inxi(m, "Mobo")
+                    self.device_model = getattr(self, 'device_model', '') or get_inxi(m, "model")
+                    self.device_serial_number = getattr(self, 'device_serial_number', '') or get_inxi(m, "serial")
+                self.device_chassis = getattr(self, 'device_chassis', '') or get_inxi(m, "Type")
+        except Exception:
+            return
 
     def get_time(self):
-        if not self.doc:
-            self.get_doc()
-        self.created = self.doc.get("endTime")
-        if not self.created:
-            self.created = self.get_time_created()
+        self._created = self.doc.get("endTime")
+        if not self._created:
+            self._created = self.get_time_created()
 
     def get_time_created(self):
-        return self.properties.last().created.isoformat()
+        return list(self.properties)[-1].created.isoformat()
 
     def get_components(self):
         if self.is_beta():
@@ -744,7 +1048,13 @@ class Evidence:
         if self.is_web_snapshot():
             self.components = self.doc.get("kv", {})
             return
+        entry = self._cache_entry
+        if entry is not None and entry.get("components") is not None:
+            self.components = entry["components"]
+            return
         self.components = ParseSnapshot(self.doc).components
+        if entry is not None:
+            entry["components"] = self.components
 
     def is_beta(self):
         return self.doc.get("version") == '2022.12.2-beta'
@@ -784,6 +1094,10 @@ class Evidence:
     def is_photo_evidence(self):
         return self.doc.get("type") == "photo25"
 
+    def is_processing(self):
+        """Photo whose OCR and barcodes are still being extracted."""
+        return (self.doc.get("data") or {}).get("processing") == "pending"
+
     def did_document(self):
         if not self.doc.get("credentialSubject"):
             return ''
@@ -7,8 +7,10 @@ from evidence import old_parse
 from evidence import normal_parse, image_processing
 from evidence.parse_details import ParseSnapshot
 
-from evidence.models import SystemProperty
-from evidence.xapian import index
+from evidence.models import RootAlias, SystemProperty
+from evidence.xapian import (
+    add_component_fields, add_field, document_fields, index
+)
 from evidence.normal_parse_details import get_inxi_key, get_inxi
 from django.conf import settings
 
@@ -18,6 +20,20 @@ if settings.DPP:
 logger = logging.getLogger('django')
 
 
+def with_device_root(owner, fields):
+    """``fields`` with the canonical RootAlias root of the device first in
+    "device", the value search results are collapsed on.
+
+    Resolved when the evidence is indexed: a device merged afterwards keeps
+    its previous root in the index until the index is rebuilt.
+    """
+    devices = fields.get("device")
+    if devices:
+        root = RootAlias.resolve_root(owner, devices[0])
+        fields["device"] = [root] + [d for d in devices if d != root]
+    return fields
+
+
 def get_mac(inxi):
     nets = get_inxi_key(inxi, "Network")
     networks = [(nets[i], nets[i + 1]) for i in range(0, len(nets) - 1, 2)]
@@ -27,7 +43,7 @@ def get_mac(inxi):
             return get_inxi(iface, 'mac')
 
 class Build:
-    def __init__(self, evidence_json, user, check=False):
+    def __init__(self, evidence_json, user, check=False, writer=None):
         """
         This Build do the save in xapian as document, in Annotations and do
         register in dlt if is configured for that.
@@ -37,10 +53,14 @@ class Build:
         2) legacy is the worbench-script when create a snapshot for devicehub-teal
         3) some snapshots come as a credential. In this case is parsed as normal_parse
         4) normal snapshot from worbench-script is the most basic and is parsed as normal_parse
+
+        Bulk importers pass an open evidence.xapian.Writer as ``writer`` so
+        every snapshot shares one batched Xapian transaction.
         """
         self.evidence = evidence_json.copy()
         self.uuid = self.evidence.get('uuid')
         self.user = user
+        self.writer = writer
 
         if evidence_json.get("credentialSubject"):
             self.build = normal_parse.Build(evidence_json)
@@ -57,17 +77,65 @@ class Build:
         if check:
             return
 
+        self.save()
+
+    def save(self):
+        """Index and annotate the evidence; a checked Build can call this
+        afterwards instead of being parsed a second time."""
         if not self.build.uuid:
             return
 
         self.index()
+        if self.writer:
+            # annotating rebuilds the ProductCache from the index
+            self.writer.commit()
+        self.annotate()
+
+    def annotate(self):
+        """Annotate the evidence once its document is committed to the
+        index; bulk importers call it after each batch commit."""
         self.create_annotations()
         if settings.DPP:
             self.register_device_dlt()
 
     def index(self):
         snap = json.dumps(self.evidence)
-        index(self.user.institution, self.uuid, snap)
+        fields = with_device_root(self.user.institution, self.index_fields())
+        if self.writer:
+            self.writer.add(self.user.institution, self.uuid, snap, fields)
+            return
+        index(self.user.institution, self.uuid, snap, fields)
+
+    def index_fields(self):
+        """Searchable fields of the evidence, as parsed by its builder."""
+        fields = document_fields(self.evidence)
+        build = self.build
+        # the physical ids it is annotated with, to collapse by device
+        fields["device"] = [
+            "{}:{}".format(k, v) for k, v in build.algorithms.items()
+        ]
+        for name, value in (
+            ("manufacturer", build.manufacturer),
+            ("model", build.model),
+            ("serial", build.serial_number),
+            ("type", build.type or build.chassis),
+            ("mac", build.mac),
+            ("text", build.sku),
+            ("text", build.version),
+        ):
+            if value not in fields.get(name, []):
+                add_field(fields, name, value)
+
+        if fields.get("component"):
+            return fields
+        try:
+            build._get_components()
+        except Exception:
+            logger.warning("Components of snapshot %s not indexed", self.uuid)
+            return fields
+        for component in getattr(build, "components", None) or []:
+            add_component_fields(fields, component)
+        return fields
 
     def create_annotations(self):
         prop = SystemProperty.objects.filter(
@@ -80,15 +148,20 @@ class Build:
             logger.warning(txt, self.uuid)
             return
 
-        for k, v in self.build.algorithms.items():
-            value = "{}:{}".format(k, v)
-            SystemProperty.objects.create(
+        SystemProperty.bulk_ingest(self.annotations())
+
+    def annotations(self):
+        """Unsaved SystemProperty rows of the evidence, one per algorithm."""
+        return [
+            SystemProperty(
                 uuid=self.uuid,
                 owner=self.user.institution,
                 user=self.user,
                 key=k,
-                value=value
+                value="{}:{}".format(k, v),
             )
+            for k, v in self.build.algorithms.items()
+        ]
 
 
     def register_device_dlt(self):
@@ -0,0 +1,157 @@
+"""
+Background OCR and barcode extraction of photo evidences.
+
+Uploads only store the image and a placeholder document; the job is run
+by a local thread pool of PHOTO_PROCESSING_WORKERS workers (inline when 0).
+Jobs a restart left behind are queued again by the first upload of the
+next process, and by the process_photo_queue command. A job that found
+the index or the database locked is postponed rather than failed.
+"""
+import json
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import xapian
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.utils import timezone
+
+from evidence.image_processing import (
+    apply_processing, process_image, processing_error
+)
+from evidence.models import PhotoProcessing, RootAlias, SystemProperty
+from evidence.xapian import Writer, get_document_by_uuid
+from device.product_cache import ProductCache
+
+logger = logging.getLogger('django')
+
+_executor = None
+_lock = threading.Lock()
+
+# another writer or transaction held a lock: worth running the job again
+TRANSIENT_ERRORS = (
+    xapian.DatabaseLockError, xapian.DatabaseModifiedError, OperationalError,
+)
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            return _executor
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PHOTO_PROCESSING_WORKERS,
+            thread_name_prefix="photo-processing",
+        )
+    # jobs queued in a pool that died with its process
+    for job_id in requeue_stale():
+        _executor.submit(_run_in_thread, job_id)
+    return _executor
+
+
+def requeue_stale():
+    """Put back to pending the jobs left pending or running for longer
+    than PHOTO_PROCESSING_STALE_SECONDS and return their ids.
+
+    A job is only run by whoever claims it in ``run``, so queuing one
+    that is still waiting in another process is harmless.
+    """
+    limit = timezone.now() - timedelta(
+        seconds=settings.PHOTO_PROCESSING_STALE_SECONDS)
+    stale = PhotoProcessing.objects.filter(
+        status__in=(PhotoProcessing.Status.PENDING,
+                    PhotoProcessing.Status.RUNNING),
+        updated__lt=limit,
+    )
+    job_ids = list(stale.order_by("pk").values_list("pk", flat=True))
+    PhotoProcessing.objects.filter(
+        pk__in=job_ids, status=PhotoProcessing.Status.RUNNING,
+    ).update(status=PhotoProcessing.Status.PENDING, updated=timezone.now())
+    return job_ids
+
+
+def submit(job_id):
+    """Queue the PhotoProcessing ``job_id`` on the local worker pool."""
+    if settings.PHOTO_PROCESSING_WORKERS <= 0:
+        return run(job_id)
+    return get_executor().submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    try:
+        return run(job_id)
+    finally:
+        # every pool thread opens its own DB connection
+        connection.close()
+
+
+def run(job_id):
+    """Process ``job_id`` if still pending; returns True when it was run."""
+    claimed = PhotoProcessing.objects.filter(
+        pk=job_id, status=PhotoProcessing.Status.PENDING,
+    ).update(status=PhotoProcessing.Status.RUNNING)
+    if not claimed:
+        return False
+
+    job = PhotoProcessing.objects.select_related("owner").get(pk=job_id)
+    try:
+        process(job)
+    except TRANSIENT_ERRORS as err:
+        job.attempts += 1
+        job.error = str(err)
+        if job.attempts < settings.PHOTO_PROCESSING_MAX_ATTEMPTS:
+            logger.warning("Photo processing of %s postponed: %s", job.uuid, err)
+            job.status = PhotoProcessing.Status.PENDING
+            job.save(update_fields=["status", "error", "attempts", "updated"])
+            retry_later(job)
+            return True
+        logger.exception("Photo processing of %s failed", job.uuid)
+        job.status = PhotoProcessing.Status.FAILED
+    except Exception as err:
+        logger.exception("Photo processing of %s failed", job.uuid)
+        job.status = PhotoProcessing.Status.FAILED
+        job.error = str(err)
+    else:
+        job.status = PhotoProcessing.Status.DONE
+    job.save(update_fields=["status", "error", "attempts", "updated"])
+    return True
+
+
+def retry_later(job):
+    """Queue the postponed ``job`` again once its backoff has passed.
+
+    Inline (no workers) it waits for process_photo_queue or requeue_stale.
+    """
+    if settings.PHOTO_PROCESSING_WORKERS <= 0:
+        return
+    delay = settings.PHOTO_PROCESSING_RETRY_SECONDS * 2 ** (job.attempts - 1)
+    timer = threading.Timer(delay, submit, args=(job.pk,))
+    timer.daemon = True
+    timer.start()
+
+
+def process(job):
+    """Extract OCR text and barcodes and rewrite the placeholder document."""
+    uuid = str(job.uuid)
+    xdoc = get_document_by_uuid(job.owner, uuid)
+    if xdoc is None:
+        raise ValueError("Document {} not found in the index".format(uuid))
+    doc = json.loads(xdoc.get_data())
+
+    result = process_image(job.path, doc.get("photo", {}).get("hash"))
+    apply_processing(doc, result)
+
+    with Writer() as writer:
+        writer.replace(job.owner, uuid, json.dumps(doc))
+
+    job.error = processing_error(result)
+
+    # the device page shows the extracted data: refresh its read model
+    values = SystemProperty.objects.filter(
+        owner=job.owner, uuid=job.uuid,
+    ).values_list("value", flat=True)
+    ProductCache.schedule(job.owner, *{
+        RootAlias.resolve_root(job.owner, value) for value in values
+    })
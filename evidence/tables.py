@@ -53,10 +53,11 @@ class EvidenceTable(tables.Table):
         if self.page:
             if hasattr(self.page.object_list, 'data'):
                 paginated_ids = [item.uuid for item in self.page.object_list.data]
-                # Lazy instantiate paginated devices by uuid and map them for did document
+                # Load the paginated evidences in one go and map them for did document
+                owner = getattr(request.user, "institution", None)
                 self.evidence_map = {
-                    uuid: Evidence(uuid)
-                    for uuid in paginated_ids
+                    ev.uuid: ev
+                    for ev in Evidence.load_many(owner, paginated_ids)
                 }
             else:
                 self.evidence_map = {}
@@ -0,0 +1,76 @@
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from user.models import Institution
+from evidence.models import SystemProperty, RootAlias
+
+
+class SystemPropertyBulkIngestTests(TestCase):
+    """``SystemProperty.bulk_ingest`` stores all the properties of an
+    evidence and their self-referential aliases at once and refreshes the
+    ProductCache once per affected root."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Test")
+        patcher = patch("evidence.models.ProductCache.schedule")
+        self.schedule = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _props(self, snapshot, *values):
+        return [
+            SystemProperty(
+                owner=self.institution, uuid=snapshot,
+                key=value.split(":")[0], value=value,
+            )
+            for value in values
+        ]
+
+    def test_creates_properties_and_self_aliases(self):
+        snapshot = uuid.uuid4()
+        SystemProperty.bulk_ingest(
+            self._props(snapshot, "ereuse24:a1", "ereuse22:b1"))
+
+        props = SystemProperty.objects.filter(uuid=snapshot)
+        self.assertEqual(props.count(), 2)
+        for sp in props:
+            ra = RootAlias.objects.get(owner=self.institution, alias=sp.value)
+            self.assertEqual(ra.root, sp.value)
+            self.assertEqual((ra.created, ra.updated), (sp.created, sp.created))
+
+    def test_one_refresh_for_all_roots(self):
+        RootAlias.objects.create(
+            owner=self.institution, alias="ereuse22:b1", root="ereuse24:a1",
+            updated=timezone.now())
+        SystemProperty.bulk_ingest(
+            self._props(uuid.uuid4(), "ereuse24:a1", "ereuse22:b1"))
+
+        self.schedule.assert_called_once_with(self.institution, "ereuse24:a1")
+
+    def test_bumps_updated_of_existing_alias(self):
+        SystemProperty.bulk_ingest(self._props(uuid.uuid4(), "ereuse24:a1"))
+        ra = RootAlias.objects.get(alias="ereuse24:a1")
+        RootAlias.objects.filter(pk=ra.pk).update(
+            updated=ra.updated - timedelta(days=1))
+
+        sp, = SystemProperty.bulk_ingest(
+            self._props(uuid.uuid4(), "ereuse24:a1"))
+        ra.refresh_from_db()
+        self.assertEqual(ra.updated, sp.created)
+        self.assertLess(ra.created, ra.updated)
+
+    def test_existing_property_is_skipped(self):
+        snapshot = uuid.uuid4()
+        SystemProperty.bulk_ingest(self._props(snapshot, "ereuse24:a1"))
+        SystemProperty.bulk_ingest(self._props(snapshot, "ereuse24:a1"))
+
+        self.assertEqual(SystemProperty.objects.filter(uuid=snapshot).count(), 1)
+        self.assertEqual(RootAlias.objects.filter(alias="ereuse24:a1").count(), 1)
+
+    def test_empty_input_does_nothing(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(SystemProperty.bulk_ingest([]), [])
+        self.schedule.assert_not_called()
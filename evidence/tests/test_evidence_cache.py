@@ -0,0 +1,146 @@
+import json
+import uuid
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from evidence.cache import EvidenceCache, entry_size
+from evidence.models import Evidence
+
+
+class EvidenceCacheTests(SimpleTestCase):
+
+    def test_lru_evicts_oldest_entry(self):
+        cache = EvidenceCache(max_entries=2, max_bytes=1000, backend="")
+        cache.put("a", {"doc": 1}, "x")
+        cache.put("b", {"doc": 2}, "x")
+        cache.get("a")  # a becomes most recent
+        cache.put("c", {"doc": 3}, "x")
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_memory_cap_counts_parsed_entry_size(self):
+        entry = {"doc": {"components": ["x" * 100, "y" * 100]}}
+        size = entry_size(entry)
+        self.assertGreater(size, 200)
+
+        cache = EvidenceCache(max_entries=10, max_bytes=size + 10, backend="")
+        cache.put("a", entry, "{}")
+        self.assertEqual(cache.stats()["bytes"], size)
+        cache.put("b", {"doc": {"components": ["z" * 100, "w" * 100]}}, "{}")
+        self.assertEqual(cache.stats()["entries"], 1)
+
+        cache.put("huge", {"doc": "x" * (size + 10)}, "{}")
+        self.assertNotIn("huge", cache)
+
+    def test_entry_is_charged_again_when_it_grows(self):
+        cache = EvidenceCache(max_entries=10, max_bytes=10000, backend="")
+        entry = {"doc": {}}
+        cache.put("a", entry, "{}")
+        entry["components"] = ["x" * 1000]
+        cache.resize("a")
+        self.assertEqual(cache.stats()["bytes"], entry_size(entry))
+
+    def test_hit_and_miss_counters(self):
+        cache = EvidenceCache(max_entries=10, max_bytes=10000, backend="")
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", {"doc": 1}, "x")
+        self.assertEqual(cache.get("a"), {"doc": 1})
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    @override_settings(CACHES={
+        "evidences": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "evidence-cache-tests",
+        },
+    })
+    def test_raw_json_shared_through_django_cache(self):
+        writer = EvidenceCache(max_entries=10, max_bytes=10000, backend="evidences")
+        reader = EvidenceCache(max_entries=10, max_bytes=10000, backend="evidences")
+        writer.put("a", {}, '{"uuid": "a"}')
+
+        self.assertNotIn("a", reader)
+        self.assertEqual(reader.get_data("a"), '{"uuid": "a"}')
+        self.assertEqual(reader.stats()["backend_hits"], 1)
+
+
+@override_settings(EVIDENCE_CACHE_BACKEND="")
+class EvidenceUsesCacheTests(TestCase):
+
+    def test_second_evidence_is_served_from_cache(self):
+        pk = uuid.uuid4()
+        xdoc = MagicMock()
+        xdoc.get_data.return_value = json.dumps({
+            "software": "workbench-legacy", "endTime": "2024-01-01",
+        })
+        with patch("evidence.models.get_document_by_uuid",
+                   return_value=xdoc) as fetch, \
+                patch("evidence.models.DMIParse") as dmi:
+            first = Evidence(pk, properties=[])
+            first.get_manufacturer()
+            second = Evidence(pk, properties=[])
+            second.get_manufacturer()
+
+        fetch.assert_called_once()
+        dmi.assert_called_once()
+        self.assertEqual(second.created, "2024-01-01")
+        self.assertIs(second.doc, first.doc)
+        self.assertIs(second.dmi, first.dmi)
+
+
+@override_settings(EVIDENCE_CACHE_BACKEND="")
+class EvidenceLazyLoadingTests(TestCase):
+    """Evidence reads nothing until asked and only parses DMI/inxi when a
+    hardware getter needs it."""
+
+    def _xdoc(self, **doc):
+        xdoc = MagicMock()
+        xdoc.get_data.return_value = json.dumps(doc)
+        return xdoc
+
+    def test_constructor_reads_nothing(self):
+        with patch("evidence.models.get_document_by_uuid") as fetch, \
+                self.assertNumQueries(0):
+            Evidence(uuid.uuid4())
+        fetch.assert_not_called()
+
+    def test_type_checks_do_not_parse_hardware(self):
+        xdoc = self._xdoc(type="photo25", software="workbench-script",
+                          endTime="2024-01-01")
+        with patch("evidence.models.get_document_by_uuid", return_value=xdoc), \
+                patch("evidence.models.DMIParse") as dmi:
+            ev = Evidence(uuid.uuid4(), properties=[])
+            self.assertTrue(ev.is_photo_evidence())
+            self.assertEqual(ev.created, "2024-01-01")
+        dmi.assert_not_called()
+
+    def test_dmidecode_parsed_once_per_document(self):
+        xdoc = self._xdoc(software="workbench-script",
+                          data={"dmidecode": "raw", "inxi": "[]"})
+        with patch("evidence.models.get_document_by_uuid", return_value=xdoc), \
+                patch("evidence.models.DMIParse") as dmi:
+            ev = Evidence(uuid.uuid4(), properties=[])
+            ev.get_manufacturer()
+            ev.get_model()
+        dmi.assert_called_once_with("raw")
+
+
+@override_settings(EVIDENCE_CACHE_BACKEND="")
+class EvidenceEntrySizeTests(SimpleTestCase):
+
+    def test_parsed_snapshot_is_charged_at_least_its_json(self):
+        with open("example/snapshots/snapshot_workbench-script.json") as f:
+            data = f.read()
+        xdoc = MagicMock()
+        xdoc.get_data.return_value = data
+        pk = uuid.uuid4()
+        with patch("evidence.models.get_document_by_uuid", return_value=xdoc):
+            ev = Evidence(pk, properties=[])
+            ev.get_manufacturer()
+
+        # the DMIParse is charged for the parse it holds, not its shell
+        self.assertGreater(entry_size(ev.dmi), entry_size(ev.dmi.data))
+        self.assertGreaterEqual(entry_size(ev._cache_entry), len(data))
@@ -0,0 +1,63 @@
+import json
+import uuid
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from user.models import Institution
+from evidence.models import Evidence, SystemProperty
+
+
+class EvidenceLoadManyTests(TestCase):
+    """Evidence.load_many fetches every document in one Xapian call and the
+    properties in one query, instead of a round trip per uuid."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        self.uuids = [uuid.uuid4() for _ in range(3)]
+        # the projection rebuild would read the evidences through Xapian
+        with patch("evidence.models.ProductCache.rebuild"):
+            for n, u in enumerate(self.uuids):
+                SystemProperty.objects.create(
+                    owner=self.institution, uuid=u,
+                    value="ereuse24:x{}".format(n),
+                )
+
+    def _doc(self, n):
+        return json.dumps({
+            "software": "workbench-legacy",
+            "endTime": "2024-01-0{}T00:00:00".format(n + 1),
+        })
+
+    def test_one_xapian_call_for_all_uuids(self):
+        docs = {str(u): self._doc(n) for n, u in enumerate(self.uuids)}
+        with patch("evidence.models.get_documents_by_uuids",
+                   return_value=docs) as many, \
+                patch("evidence.models.get_document_by_uuid") as one:
+            evidences = Evidence.load_many(self.institution, self.uuids)
+
+        many.assert_called_once_with(self.institution, self.uuids)
+        one.assert_not_called()
+        self.assertEqual([ev.uuid for ev in evidences], self.uuids)
+        self.assertEqual(evidences[2].created, "2024-01-03T00:00:00")
+        self.assertEqual(evidences[0].owner, self.institution)
+        self.assertEqual(evidences[1].get_alias(), "ereuse24:x1")
+
+    def test_missing_document_is_not_fetched_again(self):
+        docs = {str(self.uuids[0]): self._doc(0)}
+        with patch("evidence.models.get_documents_by_uuids", return_value=docs), \
+                patch("evidence.models.get_document_by_uuid") as one:
+            evidences = Evidence.load_many(self.institution, self.uuids)
+
+        one.assert_not_called()
+        self.assertEqual(len(evidences), 3)
+        self.assertEqual(evidences[1].doc, {})
+
+    def test_unparseable_document_is_left_out(self):
+        docs = {str(u): self._doc(n) for n, u in enumerate(self.uuids)}
+        docs[str(self.uuids[1])] = "{not json"
+        with patch("evidence.models.get_documents_by_uuids", return_value=docs):
+            evidences = Evidence.load_many(self.institution, self.uuids)
+
+        self.assertEqual([ev.uuid for ev in evidences],
+                         [self.uuids[0], self.uuids[2]])
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import tempfile
+import threading
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+
+from evidence.image_processing import (
+    complete_photo_doc, get_results_path, process_image
+)
+
+
+OCR = {"text": "S/N 1234", "error": None}
+BARCODES = {"barcodes": [{"type": "QR-Code", "data": "1234"}], "error": None}
+PHOTO_HASH = hashlib.sha256(b"jpg").hexdigest()
+
+
+class ProcessImageTests(SimpleTestCase):
+    """process_image runs both extractors at once and caches their results
+    by the photo's sha256."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.evidences_dir = tmp.name
+        settings = override_settings(EVIDENCES_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _patch(self, ocr=OCR, barcodes=BARCODES):
+        ocr_patch = patch("evidence.image_processing.extract_text_with_ocr",
+                          return_value=ocr)
+        barcodes_patch = patch("evidence.image_processing.extract_barcodes",
+                               return_value=barcodes)
+        return ocr_patch, barcodes_patch
+
+    def test_extractors_run_concurrently(self):
+        both_started = threading.Barrier(2, timeout=5)
+
+        def extractor(result):
+            def run(path):
+                both_started.wait()
+                return result
+            return run
+
+        with patch("evidence.image_processing.extract_text_with_ocr",
+                   side_effect=extractor(OCR)), \
+                patch("evidence.image_processing.extract_barcodes",
+                      side_effect=extractor(BARCODES)):
+            result = process_image("/tmp/p.jpg")
+
+        self.assertEqual(result["ocr_text"], "S/N 1234")
+        self.assertEqual(result["barcodes"], BARCODES["barcodes"])
+
+    def test_second_run_is_served_from_cache(self):
+        ocr_patch, barcodes_patch = self._patch()
+        with ocr_patch, barcodes_patch:
+            first = process_image("/tmp/p.jpg", PHOTO_HASH)
+        self.assertTrue(os.path.isfile(get_results_path(PHOTO_HASH)))
+
+        ocr_patch, barcodes_patch = self._patch()
+        with ocr_patch as ocr, barcodes_patch as barcodes:
+            second = process_image("/tmp/other-name.jpg", PHOTO_HASH)
+        ocr.assert_not_called()
+        barcodes.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_failed_extraction_is_retried(self):
+        missing = {"barcodes": [], "error": "zbarimg command not found"}
+        ocr_patch, barcodes_patch = self._patch(barcodes=missing)
+        with ocr_patch, barcodes_patch:
+            process_image("/tmp/p.jpg", PHOTO_HASH)
+
+        ocr_patch, barcodes_patch = self._patch()
+        with ocr_patch as ocr, barcodes_patch as barcodes:
+            result = process_image("/tmp/p.jpg", PHOTO_HASH)
+        ocr.assert_not_called()
+        barcodes.assert_called_once()
+        self.assertIsNone(result["barcode_error"])
+
+    def test_invalid_hash_is_not_used_as_a_path(self):
+        ocr_patch, barcodes_patch = self._patch()
+        with ocr_patch, barcodes_patch:
+            process_image("/tmp/p.jpg", "../../etc/passwd")
+        self.assertEqual(os.listdir(self.evidences_dir), [])
+
+    def test_reindexed_placeholder_is_completed(self):
+        photos_dir = os.path.join(self.evidences_dir, "Inst", "photos")
+        os.makedirs(photos_dir)
+        with open(os.path.join(photos_dir, "p.jpg"), "wb") as image:
+            image.write(b"jpg")
+        doc = {
+            "type": "photo25",
+            "photo": {"name": "p.jpg", "hash": PHOTO_HASH},
+            "data": {"snapshot_type": "Image", "processing": "pending"},
+        }
+
+        ocr_patch, barcodes_patch = self._patch()
+        with ocr_patch, barcodes_patch:
+            doc = complete_photo_doc(doc, "Inst")
+        self.assertEqual(doc["data"]["processing"], "done")
+        self.assertEqual(doc["data"]["ocr"]["text"], "S/N 1234")
+
+        snapshot = {"type": "Snapshot", "data": {}}
+        self.assertIs(complete_photo_doc(snapshot, "Inst"), snapshot)
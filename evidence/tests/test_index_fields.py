@@ -0,0 +1,199 @@
+import json
+import os
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from user.models import Institution
+from evidence import xapian as xapian_module
+from evidence.models import RootAlias
+from evidence.parse import Build, with_device_root
+from evidence.xapian import (
+    VALUE_SLOTS, EndTimeRangeProcessor, Writer, build_query_parser,
+    document_fields, search, search_devices,
+)
+from evidence.tests.test_xapian_writer import FakeDocument
+
+
+SNAPSHOT = os.path.join("example", "snapshots", "snapshot_workbench-script.json")
+
+PLACEHOLDER = {
+    "uuid": "2d0c3c1a-0000-4000-8000-000000000001",
+    "type": "WebSnapshot",
+    "device": {
+        "manufacturer": "Dell", "model": "Latitude 7490",
+        "serial_number": "ABC-123", "type": "Laptop", "amount": 1,
+    },
+    "kv": {"color": "black"},
+    "endTime": "2024-03-05T10:20:30",
+    "WEB_ID": "web25:abc",
+}
+
+
+class DocumentFieldsTests(SimpleTestCase):
+    """Only the meaningful fields of an evidence are indexed, each under
+    its prefix; the raw JSON is kept as the document data."""
+
+    def test_placeholder_fields(self):
+        fields = document_fields(json.dumps(PLACEHOLDER))
+        self.assertEqual(fields["manufacturer"], ["Dell"])
+        self.assertEqual(fields["model"], ["Latitude 7490"])
+        self.assertEqual(fields["serial"], ["ABC-123"])
+        self.assertEqual(fields["type"], ["Laptop"])
+        self.assertEqual(fields["text"], ["color", "black"])
+
+    def test_photo_text_and_barcodes(self):
+        photo = {
+            "type": "photo25",
+            "photo": {"original_name": "label.jpg"},
+            "data": {"ocr": {"text": "S/N 1234"},
+                     "barcodes": [{"type": "QR-Code", "data": "XYZ"}]},
+        }
+        self.assertEqual(document_fields(photo)["text"],
+                         ["S/N 1234", "XYZ", "label.jpg"])
+        self.assertEqual(document_fields("not json"), {})
+
+    def test_parsed_snapshot_fields(self):
+        with open(SNAPSHOT) as f:
+            build = Build(json.load(f), None, check=True)
+        fields = build.index_fields()
+
+        self.assertEqual(fields["manufacturer"], [build.build.manufacturer])
+        self.assertEqual(fields["serial"][0], build.build.serial_number)
+        self.assertTrue(fields["component"])
+        self.assertEqual(fields["device"], [
+            "{}:{}".format(k, v) for k, v in build.build.algorithms.items()])
+        self.assertNotIn("inxi", fields)
+
+    def test_document_indexes_fields_not_json(self):
+        indexer = MagicMock()
+        with patch.object(xapian_module.xapian, "Document", FakeDocument), \
+                patch.object(xapian_module.xapian, "TermGenerator",
+                             return_value=indexer):
+            snap = json.dumps(PLACEHOLDER)
+            doc = Writer("/tmp/unused").document(
+                SimpleNamespace(id=7), PLACEHOLDER["uuid"], snap)
+
+        self.assertEqual(doc.data, snap)
+        indexed = [c.args for c in indexer.index_text.call_args_list]
+        self.assertIn(("Dell", 1, "XMANUFACTURER"), indexed)
+        self.assertIn(("Dell",), indexed)
+        self.assertNotIn((snap,), indexed)
+        self.assertIn("XSERIALabc123", doc.terms)
+
+    def test_query_parser_prefixes(self):
+        with patch.object(xapian_module.xapian, "QueryParser") as parser:
+            build_query_parser(MagicMock())
+        qp = parser.return_value
+        qp.add_prefix.assert_any_call("model", "XMODEL")
+        name, processor = qp.add_boolean_prefix.call_args_list[0].args
+        self.assertIn(name, xapian_module.EXACT_FIELDS)
+        with patch.object(xapian_module.xapian, "Query") as query:
+            processor("AA:BB:CC")
+        query.assert_called_once_with(
+            xapian_module.FIELD_PREFIXES[name] + "aabbcc")
+
+
+class DeviceRootTests(TestCase):
+
+    def test_collapse_value_is_the_canonical_root(self):
+        institution = Institution.objects.create(name="Inst")
+        RootAlias.objects.create(
+            owner=institution, alias="ereuse24:abc", root="ereuse24:merged",
+            updated=timezone.now())
+
+        fields = with_device_root(
+            institution, {"device": ["ereuse24:abc", "ereuse22:def"]})
+        self.assertEqual(fields["device"],
+                         ["ereuse24:merged", "ereuse24:abc", "ereuse22:def"])
+
+        # not annotated yet: the device is its own root
+        fields = with_device_root(institution, {"device": ["ereuse24:new"]})
+        self.assertEqual(fields["device"], ["ereuse24:new"])
+
+
+class ValueSlotTests(SimpleTestCase):
+    """endTime, type, manufacturer and institution are value slots, so the
+    index itself filters by date range and sorts by value."""
+
+    def test_document_values(self):
+        with patch.object(xapian_module.xapian, "Document", FakeDocument), \
+                patch.object(xapian_module.xapian, "TermGenerator"), \
+                patch.object(xapian_module.xapian, "sortable_serialise",
+                             return_value=b"7"):
+            doc = Writer("/tmp/unused").document(
+                SimpleNamespace(id=7), PLACEHOLDER["uuid"],
+                json.dumps(PLACEHOLDER))
+
+        self.assertEqual(doc.values, {
+            VALUE_SLOTS["date"]: "20240305102030",
+            VALUE_SLOTS["type"]: "laptop",
+            VALUE_SLOTS["manufacturer"]: "dell",
+            VALUE_SLOTS["institution"]: b"7",
+            VALUE_SLOTS["device"]: "web25:abc",
+        })
+        self.assertIn("XTYPElaptop", doc.terms)
+
+    def test_date_range_by_year_and_open_ends(self):
+        processor = EndTimeRangeProcessor()
+        slot = VALUE_SLOTS["date"]
+        Query = xapian_module.xapian.Query
+        with patch.object(xapian_module.xapian, "Query") as query:
+            query.OP_VALUE_RANGE = Query.OP_VALUE_RANGE
+            query.OP_VALUE_GE = Query.OP_VALUE_GE
+            processor("2024", "2025-06")
+            query.assert_called_with(
+                Query.OP_VALUE_RANGE, slot, "20240000000000", "20250699999999")
+            processor("2024", "")
+            query.assert_called_with(Query.OP_VALUE_GE, slot, "20240000000000")
+
+    def test_search_sorts_by_value_slot(self):
+        reader = MagicMock(path="/tmp/unused")
+        with patch.object(xapian_module, "get_reader", return_value=reader), \
+                patch.object(xapian_module.xapian, "Query"):
+            search(SimpleNamespace(id=7), "laptop", sort="-date")
+            reader.enquire.set_sort_by_value_then_relevance.assert_called_once_with(
+                VALUE_SLOTS["date"], True)
+
+            search(SimpleNamespace(id=7), "laptop", sort="nonsense")
+            reader.enquire.set_sort_by_relevance.assert_called_once_with()
+
+    def test_search_collapses_by_device(self):
+        reader = MagicMock(path="/tmp/unused")
+        with patch.object(xapian_module, "get_reader", return_value=reader), \
+                patch.object(xapian_module.xapian, "Query"):
+            search(SimpleNamespace(id=7), "laptop", collapse=True)
+            reader.enquire.set_collapse_key.assert_called_with(
+                VALUE_SLOTS["device"])
+            # the shared enquire does not keep collapsing afterwards
+            search(SimpleNamespace(id=7), "laptop")
+            reader.enquire.set_collapse_key.assert_called_with(
+                xapian_module.xapian.BAD_VALUENO)
+
+    def test_search_devices_reads_the_device_slot_only(self):
+        reader = MagicMock(path="/tmp/unused")
+        doc = MagicMock()
+        doc.get_value.return_value = b"ereuse24:abc"
+        reader.enquire.get_mset.return_value = [MagicMock(document=doc)]
+        with patch.object(xapian_module, "get_reader", return_value=reader), \
+                patch.object(xapian_module.xapian, "Query"):
+            devices = search_devices(SimpleNamespace(id=7), "s3r1al", limit=50)
+
+        self.assertEqual(devices, ["ereuse24:abc"])
+        reader.enquire.get_mset.assert_called_once_with(0, 50, 0)
+        reader.enquire.set_collapse_key.assert_called_with(VALUE_SLOTS["device"])
+        doc.get_value.assert_called_once_with(VALUE_SLOTS["device"])
+        doc.get_data.assert_not_called()
+
+    @override_settings(SEARCH_EXACT_COUNT=250)
+    def test_one_mset_serves_page_and_count(self):
+        reader = MagicMock(path="/tmp/unused")
+        with patch.object(xapian_module, "get_reader", return_value=reader), \
+                patch.object(xapian_module.xapian, "Query"):
+            search(SimpleNamespace(id=7), "laptop", 20, 10)
+            search(SimpleNamespace(id=7), "laptop", 0, 0, check_at_least=0)
+        self.assertEqual(
+            [c.args for c in reader.enquire.get_mset.call_args_list],
+            [(20, 10, 250), (0, 0, 0)])
@@ -0,0 +1,191 @@
+import json
+import os
+import tempfile
+import uuid
+from datetime import timedelta
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from user.models import User, Institution
+from evidence import photo_queue
+from evidence.cache import evidence_cache
+from evidence.image_processing import complete_photo_doc, process_photo_upload
+from evidence.models import Evidence, PhotoProcessing, SystemProperty
+
+
+RESULT = {
+    "ocr_text": "S/N 1234",
+    "ocr_error": None,
+    "barcodes": [{"type": "QR-Code", "data": "1234"}],
+    "barcode_error": "zbarimg command not found",
+}
+
+
+@override_settings(PHOTO_PROCESSING_WORKERS=0, EVIDENCE_CACHE_BACKEND="")
+class PhotoQueueTests(TestCase):
+    """Photo uploads are indexed with a placeholder document at once; the
+    OCR and barcode extraction runs afterwards as a PhotoProcessing job."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        self.user = User.objects.create_user(
+            email="photo@example.com", institution=self.institution,
+            password="testpass123",
+        )
+        for target in ("evidence.models.ProductCache.rebuild",
+                       "evidence.photo_queue.ProductCache.schedule"):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _upload(self):
+        photo = {"name": "p.jpg", "hash": "abc", "content": b"jpg"}
+        with patch("evidence.image_processing.save_photo_in_disk",
+                   return_value="/tmp/p.jpg"), \
+                patch("evidence.image_processing.save_in_disk"), \
+                patch("evidence.image_processing.move_json"), \
+                patch("evidence.image_processing.create_index") as index, \
+                patch("evidence.photo_queue.submit") as submit, \
+                patch("evidence.image_processing.process_image") as ocr, \
+                self.captureOnCommitCallbacks(execute=True):
+            doc = process_photo_upload(photo, user=self.user)
+        ocr.assert_not_called()
+        index.assert_called_once()
+        return doc, submit
+
+    def test_upload_indexes_placeholder_and_queues_job(self):
+        doc, submit = self._upload()
+
+        self.assertEqual(doc["data"]["processing"], "pending")
+        self.assertNotIn("ocr", doc["data"])
+        job = PhotoProcessing.objects.get(uuid=doc["uuid"])
+        self.assertEqual(job.status, PhotoProcessing.Status.PENDING)
+        self.assertEqual(job.path, "/tmp/p.jpg")
+        submit.assert_called_once_with(job.pk)
+        self.assertTrue(SystemProperty.objects.filter(
+            uuid=doc["uuid"], value="photo25:abc").exists())
+
+    def _run(self, doc, job, **kwargs):
+        xdoc = MagicMock()
+        xdoc.get_data.return_value = json.dumps(doc)
+        with patch("evidence.photo_queue.process_image", **kwargs), \
+                patch("evidence.photo_queue.get_document_by_uuid",
+                      return_value=xdoc), \
+                patch("evidence.photo_queue.Writer") as writer:
+            ran = photo_queue.run(job.pk)
+        job.refresh_from_db()
+        return ran, writer.return_value.__enter__.return_value
+
+    def test_job_rewrites_document(self):
+        doc, _ = self._upload()
+        job = PhotoProcessing.objects.get(uuid=doc["uuid"])
+
+        ran, writer = self._run(doc, job, return_value=RESULT)
+
+        self.assertTrue(ran)
+        self.assertEqual(job.status, PhotoProcessing.Status.DONE)
+        self.assertEqual(job.error, "zbarimg command not found")
+        _, uuid_, snap = writer.replace.call_args.args
+        self.assertEqual(uuid_, doc["uuid"])
+        data = json.loads(snap)["data"]
+        self.assertEqual(data["processing"], "done")
+        self.assertEqual(data["ocr"]["text"], "S/N 1234")
+
+        # a finished job is not run twice
+        self.assertFalse(self._run(doc, job, return_value=RESULT)[0])
+
+    def test_failed_job_is_recorded(self):
+        doc, _ = self._upload()
+        job = PhotoProcessing.objects.get(uuid=doc["uuid"])
+
+        ran, writer = self._run(doc, job, side_effect=OSError("disk"))
+
+        self.assertTrue(ran)
+        self.assertEqual(job.status, PhotoProcessing.Status.FAILED)
+        self.assertEqual(job.error, "disk")
+        writer.replace.assert_not_called()
+
+    @override_settings(PHOTO_PROCESSING_MAX_ATTEMPTS=2)
+    def test_locked_index_postpones_the_job(self):
+        doc, _ = self._upload()
+        job = PhotoProcessing.objects.get(uuid=doc["uuid"])
+        locked = photo_queue.xapian.DatabaseLockError("locked")
+
+        with patch("evidence.photo_queue.retry_later") as retry:
+            ran, _ = self._run(doc, job, side_effect=locked)
+        self.assertTrue(ran)
+        self.assertEqual(job.status, PhotoProcessing.Status.PENDING)
+        self.assertEqual(job.attempts, 1)
+        retry.assert_called_once()
+
+        # out of attempts: a lock that never goes away fails the job
+        with patch("evidence.photo_queue.retry_later") as retry:
+            self._run(doc, job, side_effect=locked)
+        self.assertEqual(job.status, PhotoProcessing.Status.FAILED)
+        self.assertEqual(job.attempts, 2)
+        retry.assert_not_called()
+
+    def test_placeholder_document_is_not_cached(self):
+        pk = uuid.uuid4()
+        xdoc = MagicMock()
+        xdoc.get_data.return_value = json.dumps({
+            "type": "photo25", "data": {"processing": "pending"},
+        })
+        with patch("evidence.models.get_document_by_uuid", return_value=xdoc):
+            ev = Evidence(pk, properties=[])
+            self.assertTrue(ev.is_processing())
+        self.assertNotIn(pk, evidence_cache)
+
+    def test_status_view(self):
+        doc, _ = self._upload()
+        self.client.force_login(self.user)
+        url = reverse("evidence:photo_status", args=(doc["uuid"],))
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()["status"], "pending")
+        self.assertFalse(response.json()["finished"])
+
+    def test_reindex_completion_finishes_the_job(self):
+        doc, _ = self._upload()
+        photos = tempfile.TemporaryDirectory()
+        self.addCleanup(photos.cleanup)
+        with open(os.path.join(photos.name, "p.jpg"), "wb") as image:
+            image.write(b"jpg")
+
+        with patch("evidence.image_processing.get_photos_dir",
+                   return_value=photos.name), \
+                patch("evidence.image_processing.process_image",
+                      return_value=RESULT):
+            complete_photo_doc(doc, "Inst")
+
+        job = PhotoProcessing.objects.get(uuid=doc["uuid"])
+        self.assertEqual(job.status, PhotoProcessing.Status.DONE)
+        self.assertEqual(job.error, "zbarimg command not found")
+
+    def _job(self, status, age):
+        job = PhotoProcessing.objects.create(
+            owner=self.institution, uuid=uuid.uuid4(), path="/tmp/p.jpg",
+            status=status)
+        PhotoProcessing.objects.filter(pk=job.pk).update(
+            updated=timezone.now() - timedelta(seconds=age))
+        return job
+
+    @override_settings(PHOTO_PROCESSING_STALE_SECONDS=60)
+    def test_stale_jobs_are_queued_again_by_a_new_pool(self):
+        pending = self._job(PhotoProcessing.Status.PENDING, 120)
+        running = self._job(PhotoProcessing.Status.RUNNING, 120)
+        self._job(PhotoProcessing.Status.RUNNING, 10)
+        self._job(PhotoProcessing.Status.FAILED, 120)
+
+        with patch.object(photo_queue, "_executor", None), \
+                patch("evidence.photo_queue.ThreadPoolExecutor") as pool:
+            photo_queue.get_executor()
+            photo_queue.get_executor()
+
+        submitted = [c.args[1] for c in pool.return_value.submit.call_args_list]
+        self.assertEqual(submitted, [pending.pk, running.pk])
+        running.refresh_from_db()
+        self.assertEqual(running.status, PhotoProcessing.Status.PENDING)
@@ -0,0 +1,154 @@
+import os
+import json
+import shutil
+import tempfile
+import uuid
+from io import StringIO
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from user.models import User, Institution
+from evidence import xapian as xapian_module
+from evidence.models import SystemProperty
+from evidence.xapian import Reader, swap_index
+from evidence.management.commands import rebuild_index
+
+
+SNAPSHOT = os.path.join("example", "snapshots", "snapshot_workbench-script.json")
+
+
+class SwapIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.link = os.path.join(tmp.name, "index")
+        for name in ("index.1", "index.2"):
+            os.mkdir(os.path.join(tmp.name, name))
+
+    def test_flips_symlink_to_new_target(self):
+        self.assertIsNone(swap_index(self.link, os.path.join(self.dir, "index.1")))
+        previous = swap_index(self.link, os.path.join(self.dir, "index.2"))
+
+        self.assertEqual(previous, os.path.join(self.dir, "index.1"))
+        self.assertEqual(os.readlink(self.link), "index.2")
+
+    def test_refuses_to_replace_a_directory(self):
+        os.mkdir(self.link)
+        with self.assertRaises(ValueError):
+            swap_index(self.link, os.path.join(self.dir, "index.1"))
+
+    def test_reader_reopens_after_swap(self):
+        swap_index(self.link, os.path.join(self.dir, "index.1"))
+        with patch.object(xapian_module.xapian, "Database") as database, \
+                patch.object(xapian_module.xapian, "Enquire"):
+            reader = Reader(self.link)
+            self.assertFalse(reader.refresh())
+
+            swap_index(self.link, os.path.join(self.dir, "index.2"))
+            self.assertTrue(reader.refresh())
+        self.assertEqual(database.call_count, 2)
+        self.assertEqual(reader.target, os.path.join(self.dir, "index.2"))
+
+
+class RebuildIndexCommandTests(TestCase):
+    """rebuild_index writes a shadow index, checks it and flips the link."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        admin = User.objects.create_user(
+            email="admin@example.com", institution=self.institution,
+            password="testpass123",
+        )
+        admin.is_admin = True
+        admin.save()
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.evidences = tmp.name
+        snapshots = os.path.join(tmp.name, "Inst", "snapshots")
+        os.makedirs(snapshots)
+        os.makedirs(os.path.join(tmp.name, "Inst", "placeholders"))
+        shutil.copy(SNAPSHOT, os.path.join(snapshots, "a.json"))
+        self.link = os.path.join(tmp.name, "index")
+
+        settings = override_settings(EVIDENCES_INDEX_DIR=self.link)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for patcher in (
+            patch.object(rebuild_index.Command, "EVIDENCES", tmp.name),
+            patch.object(rebuild_index, "Writer"),
+            patch.object(rebuild_index, "xapian"),
+        ):
+            self.xapian = patcher.start()
+            self.addCleanup(patcher.stop)
+        # compaction writes the shadow index
+        self.xapian.Database.return_value.compact.side_effect = os.mkdir
+        self.xapian.Database.return_value.get_termfreq.return_value = 0
+
+        with patch("evidence.models.ProductCache.schedule"):
+            SystemProperty.objects.create(
+                owner=self.institution, uuid=uuid.uuid4(),
+                key="ereuse24", value="ereuse24:x")
+
+    def test_short_index_is_not_swapped_in(self):
+        with self.assertRaises(CommandError):
+            call_command("rebuild_index", stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(os.path.lexists(self.link))
+
+    def test_verified_index_is_swapped_in(self):
+        self.xapian.Database.return_value.get_termfreq.return_value = 1
+        out = StringIO()
+        call_command("rebuild_index", stdout=out)
+
+        self.assertTrue(os.path.islink(self.link))
+        self.assertTrue(os.path.isdir(os.path.realpath(self.link)))
+        self.assertIn("Index rebuilt", out.getvalue())
+
+    def test_refuses_index_kept_in_a_directory(self):
+        os.mkdir(self.link)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_index", stdout=StringIO())
+
+    @override_settings(EVIDENCES_INDEX_DIR="")
+    def test_stock_layout_asks_to_move_the_index_out(self):
+        with self.assertRaisesMessage(CommandError, "DEVICEHUB_EVIDENCES_INDEX_DIR"):
+            call_command("rebuild_index", stdout=StringIO())
+
+    def test_catches_up_with_the_index_left_in_the_evidences_dir(self):
+        command = rebuild_index.Command()
+        self.assertEqual(command.live_indexes(self.link), [])
+
+        open(os.path.join(self.evidences, "iamglass"), "w").close()
+        os.mkdir(self.link)
+        self.assertEqual(command.live_indexes(self.link),
+                         [self.link, self.evidences])
+
+
+class MissingDocumentsTests(SimpleTestCase):
+    """Documents of the live index missing from a rebuilt one."""
+
+    def _doc(self, ev_uuid):
+        doc = MagicMock()
+        doc.get_data.return_value = json.dumps({"uuid": ev_uuid})
+        return doc
+
+    def test_index_without_uuid_terms_is_read_document_by_document(self):
+        docs = {1: self._doc("a"), 2: self._doc("b")}
+        live = MagicMock()
+        live.get_metadata.return_value = b""
+        live.postlist.return_value = [MagicMock(docid=n) for n in docs]
+        live.get_document.side_effect = docs.get
+        rebuilt = MagicMock()
+        rebuilt.term_exists.side_effect = lambda term: term == "Qa"
+
+        with patch.object(rebuild_index, "document_uuid_term", return_value=None):
+            missing = list(rebuild_index.missing_documents(live, rebuilt))
+
+        live.postlist.assert_called_once_with("")
+        live.allterms.assert_not_called()
+        self.assertEqual(missing, [("b", docs[2])])
@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from user.models import User, Institution
+from evidence import xapian as xapian_module
+from evidence.models import SystemProperty
+from evidence.management.commands import reindex
+from evidence.tests.test_xapian_writer import FakeDocument, FakeWritableDatabase
+from evidence.xapian import Writer
+
+
+SNAPSHOT = os.path.join("example", "snapshots", "snapshot_workbench-script.json")
+
+
+class ParallelReindexTests(TestCase):
+    """``reindex --workers`` parses files apart and stores them in batches,
+    one Xapian commit and one bulk annotation each."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        admin = User.objects.create_user(
+            email="admin@example.com", institution=self.institution,
+            password="testpass123",
+        )
+        admin.is_admin = True
+        admin.save()
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.evidences = tmp.name
+        self.snapshots = os.path.join(tmp.name, "Inst", "snapshots")
+        os.makedirs(self.snapshots)
+        os.makedirs(os.path.join(tmp.name, "Inst", "placeholders"))
+        shutil.copy(SNAPSHOT, os.path.join(self.snapshots, "a.json"))
+        with open(os.path.join(self.snapshots, "broken.json"), "w") as f:
+            f.write("{not json")
+        self.checkpoint = os.path.join(tmp.name, "reindex.checkpoint")
+
+        for patcher in (
+            patch.object(reindex.Command, "EVIDENCES", tmp.name),
+            patch.object(reindex, "Writer"),
+            patch("evidence.models.ProductCache.schedule"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _reindex(self, *args):
+        out = StringIO()
+        call_command("reindex", "--workers", "1", *args, stdout=out)
+        return out.getvalue()
+
+    def test_annotates_snapshots_and_reports_rate(self):
+        with patch.object(SystemProperty, "bulk_ingest",
+                          wraps=SystemProperty.bulk_ingest) as bulk:
+            out = self._reindex("--batch-size", "10")
+
+        bulk.assert_called_once()
+        with open(SNAPSHOT) as f:
+            ev_uuid = json.load(f)["uuid"]
+        self.assertTrue(SystemProperty.objects.filter(
+            uuid=ev_uuid, owner=self.institution, key="ereuse24").exists())
+        self.assertIn("files/s", out)
+        self.assertIn("Reindexed 1 file(s)", out)
+        self.assertIn("1 failed", out)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        # already annotated evidences are not annotated twice
+        self._reindex()
+        self.assertEqual(SystemProperty.objects.filter(uuid=ev_uuid).count(),
+                         SystemProperty.objects.count())
+
+    def test_resume_skips_checkpointed_files(self):
+        done = os.path.join(self.snapshots, "a.json")
+        reindex.write_checkpoint(self.checkpoint, {done})
+
+        with patch.object(reindex, "parse_snapshot",
+                          wraps=reindex.parse_snapshot) as parse:
+            self._reindex("--resume")
+        self.assertEqual([c.args[0] for c in parse.call_args_list],
+                         [os.path.join(self.snapshots, "broken.json")])
+
+    def test_without_resume_checkpoint_is_discarded(self):
+        reindex.write_checkpoint(
+            self.checkpoint, {os.path.join(self.snapshots, "a.json")})
+
+        with patch.object(reindex, "parse_snapshot",
+                          wraps=reindex.parse_snapshot) as parse:
+            self._reindex()
+        self.assertEqual(parse.call_count, 2)
+
+    def test_serial_reindex_commits_before_annotating(self):
+        writer = reindex.Writer.return_value.__enter__.return_value
+        writer.batch_size = 10
+        calls = []
+        writer.commit.side_effect = lambda: calls.append("commit")
+
+        with patch.object(SystemProperty, "bulk_ingest",
+                          side_effect=lambda props: calls.append("annotate")):
+            call_command("reindex", stdout=StringIO())
+
+        writer.add.assert_called_once()
+        self.assertEqual(calls, ["commit", "annotate"])
+
+    def test_serial_reindex_reports_rate(self):
+        reindex.Writer.return_value.__enter__.return_value.batch_size = 10
+        out = StringIO()
+        call_command("reindex", stdout=out)
+        self.assertIn("Reindexed 1 file(s)", out.getvalue())
+        self.assertIn("files/s", out.getvalue())
+        self.assertIn("1 failed", out.getvalue())
+
+    def test_workers_fork_before_the_index_is_opened(self):
+        index = os.path.join(self.evidences, "index")
+        os.mkdir(index)
+        opened = []
+        forks = []
+        fork = os.fork
+
+        def open_db(path, flags):
+            opened.append(FakeWritableDatabase([], {}))
+            return opened[-1]
+
+        def forking():
+            # an open database here would hand its lock to the worker
+            forks.append([db for db in opened if not db.closed])
+            return fork()
+
+        with self.settings(EVIDENCES_INDEX_DIR=index, EVIDENCES_SHARDS_DIR=""), \
+                patch.object(reindex, "Writer", Writer), \
+                patch.object(xapian_module.xapian, "WritableDatabase",
+                             side_effect=open_db), \
+                patch.object(xapian_module.xapian, "Document", FakeDocument), \
+                patch.object(xapian_module, "has_term", return_value=False), \
+                patch("os.fork", side_effect=forking):
+            out = StringIO()
+            call_command("reindex", "--workers", "2", stdout=out)
+
+        self.assertEqual(len(forks), 2)
+        self.assertEqual(forks, [[], []])
+        self.assertEqual(sum(len(db.docs) for db in opened), 1)
+        self.assertTrue(all(db.closed for db in opened))
+        self.assertIn("Reindexed 1 file(s)", out.getvalue())
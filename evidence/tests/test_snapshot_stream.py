@@ -0,0 +1,130 @@
+import json
+import uuid
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from api.models import Token
+from user.models import User, Institution
+from evidence.ingest import SnapshotStream
+from evidence.models import SystemProperty
+
+
+class FakeBuild:
+    """Stands in for evidence.parse.Build: valid unless the snapshot says
+    otherwise, with one ereuse24 annotation derived from the uuid."""
+
+    instances = []
+
+    def __init__(self, data, user, check=False, writer=None):
+        if data.get("broken"):
+            raise ValueError("missing hardware section")
+        self.uuid = data["uuid"]
+        self.user = user
+        self.writer = writer
+        self.build = MagicMock(uuid=self.uuid)
+        self.indexed = False
+        FakeBuild.instances.append(self)
+
+    def index(self):
+        self.indexed = True
+
+    def annotations(self):
+        return [SystemProperty(
+            uuid=self.uuid, owner=self.user.institution, user=self.user,
+            key="ereuse24", value="ereuse24:{}".format(self.uuid.replace("-", "")),
+        )]
+
+
+@override_settings(DPP=False)
+class SnapshotStreamTests(TestCase):
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        self.user = User.objects.create_user(
+            email="bulk@example.com", institution=self.institution,
+            password="testpass123",
+        )
+        FakeBuild.instances = []
+        for target in ("evidence.ingest.Build", "evidence.ingest.Writer",
+                       "evidence.ingest.save_in_disk", "evidence.ingest.move_json",
+                       "evidence.models.ProductCache.schedule"):
+            patcher = patch(target, FakeBuild) if target.endswith("Build") else patch(target)
+            mock = patcher.start()
+            self.addCleanup(patcher.stop)
+            if target.endswith("Writer"):
+                self.writer = mock
+
+    def _line(self, **snapshot):
+        return json.dumps(snapshot)
+
+    def test_reports_a_status_per_snapshot(self):
+        a, b = str(uuid.uuid4()), str(uuid.uuid4())
+        lines = [
+            self._line(uuid=a),
+            "",
+            "{not json",
+            self._line(uuid=a),
+            self._line(uuid=b, broken=True),
+            self._line(software="workbench-script"),
+        ]
+        stream = SnapshotStream(self.user)
+        results = stream.ingest_lines(lines)
+
+        self.assertEqual(
+            [(r["line"], r["status"]) for r in results],
+            [(1, "created"), (3, "invalid"), (4, "duplicate"),
+             (5, "invalid"), (6, "invalid")],
+        )
+        self.assertEqual(results[0]["dhid"], a.replace("-", "")[:6].upper())
+        self.assertEqual(stream.summary(),
+                         {"created": 1, "duplicate": 1, "invalid": 3, "error": 0})
+        self.assertTrue(SystemProperty.objects.filter(uuid=a).exists())
+
+    def test_each_batch_opens_its_own_writer(self):
+        uuids = [str(uuid.uuid4()) for _ in range(5)]
+        stream = SnapshotStream(self.user, batch_size=2)
+        with patch.object(SystemProperty, "bulk_ingest",
+                          wraps=SystemProperty.bulk_ingest) as bulk:
+            stream.add_line(1, self._line(uuid=uuids[0]))
+            # reading the stream does not take the index write lock
+            self.writer.assert_not_called()
+            stream.ingest_lines(self._line(uuid=u) for u in uuids[1:])
+
+        self.assertEqual(bulk.call_count, 3)
+        self.assertEqual(self.writer.call_count, 3)
+        self.assertEqual(self.writer.return_value.__exit__.call_count, 3)
+        writer = self.writer.return_value.__enter__.return_value
+        self.assertTrue(all(b.indexed and b.writer is writer
+                            for b in FakeBuild.instances))
+        self.assertEqual(SystemProperty.objects.count(), 5)
+
+    def test_registered_snapshot_is_a_duplicate(self):
+        known = str(uuid.uuid4())
+        SystemProperty.objects.create(
+            owner=self.institution, uuid=known, key="ereuse24", value="ereuse24:x")
+
+        results = SnapshotStream(self.user).ingest_lines([self._line(uuid=known)])
+        self.assertEqual(results[0]["status"], "duplicate")
+        self.assertFalse(FakeBuild.instances[0].indexed)
+
+    def test_failed_batch_is_reported(self):
+        with patch.object(SystemProperty, "bulk_ingest", side_effect=RuntimeError):
+            results = SnapshotStream(self.user).ingest_lines(
+                [self._line(uuid=str(uuid.uuid4()))])
+        self.assertEqual(results[0]["status"], "error")
+
+    def test_api_endpoint_streams_ndjson(self):
+        token = Token.objects.create(tag="wb", token=uuid.uuid4(), owner=self.user)
+        url = reverse("api_v1:upload_snapshots_bulk")
+        auth = {"HTTP_AUTHORIZATION": "Bearer {}".format(token.token)}
+        body = "\n".join([self._line(uuid=str(uuid.uuid4())), "{not json"])
+
+        response = self.client.post(
+            url, body, content_type="application/x-ndjson", **auth)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()["summary"]["created"], 1)
+
+        response = self.client.post(url, body, content_type="application/json", **auth)
+        self.assertEqual(response.status_code, 415)
@@ -0,0 +1,108 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, override_settings
+
+from evidence import xapian as xapian_module
+from evidence.xapian import ReaderPool
+
+
+@override_settings(EVIDENCES_DIR="/tmp/evidences-reader-tests")
+class ReaderPoolTests(SimpleTestCase):
+    """The pool keeps one open reader per path and only reports a reopen
+    when the database revision moved (no real Xapian database involved)."""
+
+    def setUp(self):
+        self.pool = ReaderPool()
+        patcher_db = patch.object(xapian_module.xapian, "Database")
+        patcher_enquire = patch.object(xapian_module.xapian, "Enquire")
+        self.database = patcher_db.start()
+        self.database.return_value.get_revision.return_value = 1
+        patcher_enquire.start()
+        self.addCleanup(patch.stopall)
+
+    def test_second_get_reuses_open_reader(self):
+        first = self.pool.get("/idx")
+        second = self.pool.get("/idx")
+        self.assertIs(first, second)
+        self.assertEqual(self.database.call_count, 1)
+        self.assertEqual(self.pool.stats(), {"opens": 1, "hits": 1, "reopens": 0})
+
+    def test_reopen_only_when_revision_changes(self):
+        reader = self.pool.get("/idx")
+        self.pool.get("/idx")
+        self.assertEqual(self.pool.stats()["reopens"], 0)
+
+        # a second commit in the same clock tick still moves the revision
+        reader.database.get_revision.return_value = 2
+        self.pool.get("/idx")
+        self.assertEqual(self.pool.stats()["reopens"], 1)
+        self.pool.get("/idx")
+        self.assertEqual(self.pool.stats()["reopens"], 1)
+
+    def test_discard_forces_a_new_open(self):
+        self.pool.get("/idx")
+        self.pool.discard("/idx")
+        self.pool.get("/idx")
+        self.assertEqual(self.pool.stats()["opens"], 2)
+
+    def test_search_returns_none_without_database(self):
+        self.database.side_effect = xapian_module.xapian.DatabaseOpeningError("missing")
+        with patch.object(xapian_module, "readers", self.pool):
+            self.assertIsNone(xapian_module.search(None, "laptop"))
+
+
+class DocumentByUuidTests(SimpleTestCase):
+    """get_document_by_uuid resolves the Q<uuid> term directly and only
+    parses a query on indexes that were not backfilled yet."""
+
+    def setUp(self):
+        self.owner = SimpleNamespace(id=7)
+        self.doc = MagicMock()
+        self.reader = MagicMock(uuid_terms=True)
+        self.reader.database.postlist.return_value = [SimpleNamespace(docid=3)]
+        self.reader.database.get_document.return_value = self.doc
+        patch.object(xapian_module, "get_reader", return_value=self.reader).start()
+        self.search = patch.object(xapian_module, "search").start()
+        self.has_term = patch.object(xapian_module, "has_term", return_value=True).start()
+        self.addCleanup(patch.stopall)
+
+    def test_direct_lookup_uses_uuid_term(self):
+        self.assertIs(xapian_module.get_document_by_uuid(self.owner, "abc"), self.doc)
+        self.reader.database.postlist.assert_called_once_with("Qabc")
+        self.has_term.assert_called_once_with(self.doc, "U7")
+        self.search.assert_not_called()
+
+    def test_document_of_other_owner_is_ignored(self):
+        self.has_term.return_value = False
+        self.assertIsNone(xapian_module.get_document_by_uuid(self.owner, "abc"))
+
+    def test_modified_database_retries_the_document_fetch(self):
+        self.doc.get_data.side_effect = [
+            xapian_module.xapian.DatabaseModifiedError("recycled"), b"{}"]
+        with patch.object(xapian_module, "readers") as pool:
+            doc = xapian_module.get_document_by_uuid(self.owner, "abc")
+        self.assertIs(doc, self.doc)
+        pool.discard.assert_called_once_with(self.reader.path)
+        self.assertEqual(self.reader.database.postlist.call_count, 2)
+
+    def test_legacy_index_falls_back_to_query(self):
+        self.reader.uuid_terms = False
+        match = MagicMock()
+        self.search.return_value = [match]
+        doc = xapian_module.get_document_by_uuid(self.owner, "abc")
+        self.assertIs(doc, match.document)
+        self.search.assert_called_once_with(self.owner, 'uuid:"abc"', limit=1)
+        self.reader.database.postlist.assert_not_called()
+
+
+class DocumentUuidTests(SimpleTestCase):
+
+    def test_credential_uuid_wins(self):
+        data = json.dumps({"uuid": "outer", "credentialSubject": {"uuid": "inner"}})
+        self.assertEqual(xapian_module.document_uuid(data), "inner")
+
+    def test_plain_snapshot_and_garbage(self):
+        self.assertEqual(xapian_module.document_uuid('{"uuid": "u"}'), "u")
+        self.assertIsNone(xapian_module.document_uuid(b"not json"))
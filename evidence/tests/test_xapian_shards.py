@@ -0,0 +1,108 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, override_settings
+
+from evidence import xapian as xapian_module
+from evidence.xapian import CombinedReader, Writer, get_reader, search, split_index
+from evidence.tests.test_xapian_writer import FakeDocument, FakeWritableDatabase
+
+
+class ShardDocument(FakeDocument):
+
+    def skip_to(self, prefix):
+        terms = sorted(t for t in self.terms if t >= prefix)
+        if not terms:
+            raise StopIteration
+        return SimpleNamespace(term=terms[0].encode())
+
+
+class ShardedIndexTests(SimpleTestCase):
+    """With EVIDENCES_SHARDS_DIR every institution reads and writes its own
+    Xapian database; queries without an institution combine them all."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.shards = tmp.name
+        settings = override_settings(EVIDENCES_SHARDS_DIR=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.institution = SimpleNamespace(id=7)
+
+    def test_reader_of_institution_shard_or_combined(self):
+        with patch.object(xapian_module.readers, "get") as get:
+            get_reader(self.institution)
+            get.assert_called_with(os.path.join(self.shards, "7"))
+            get_reader()
+            get.assert_called_with(self.shards, CombinedReader)
+
+    def test_shard_queries_skip_institution_filter(self):
+        reader = MagicMock(path=os.path.join(self.shards, "7"))
+        with patch.object(xapian_module, "get_reader", return_value=reader) as get, \
+                patch.object(xapian_module.xapian, "Query") as query:
+            search(self.institution, "laptop")
+        get.assert_called_once_with(self.institution)
+        query.assert_called_once_with(reader.query_parser.parse_query.return_value)
+
+    def test_writer_routes_documents_to_their_shard(self):
+        opened = {}
+
+        def open_db(path, flags):
+            return opened.setdefault(path, FakeWritableDatabase([], {}))
+
+        with patch.object(xapian_module.xapian, "WritableDatabase", side_effect=open_db), \
+                patch.object(xapian_module.xapian, "Document", FakeDocument), \
+                patch.object(xapian_module.xapian, "TermGenerator"):
+            with Writer() as writer:
+                writer.add(self.institution, "uuid-1", "{}")
+                writer.add(SimpleNamespace(id=8), "uuid-2", "{}")
+                writer.add(self.institution, "uuid-3", "{}")
+
+        self.assertEqual(writer.added, 3)
+        self.assertEqual(
+            {os.path.basename(path): len(db.docs) for path, db in opened.items()},
+            {"7": 2, "8": 1},
+        )
+        self.assertTrue(all(db.closed for db in opened.values()))
+
+    def test_combined_reader_reopens_when_a_shard_appears(self):
+        for name in ("7", "8", "not-a-shard"):
+            os.mkdir(os.path.join(self.shards, name))
+
+        with patch.object(xapian_module.xapian, "Database") as database, \
+                patch.object(xapian_module.xapian, "Enquire"):
+            reader = CombinedReader(self.shards)
+            self.assertEqual(database.return_value.add_database.call_count, 2)
+            self.assertFalse(reader.refresh())
+
+            os.mkdir(os.path.join(self.shards, "9"))
+            self.assertTrue(reader.refresh())
+        self.assertEqual(len(reader.shards), 3)
+
+    def test_split_copies_documents_by_institution(self):
+        source_docs = []
+        for terms in ({"Qa", "U7"}, {"Qb", "U8"}, {"Qc", "U7"}, {"Qd"}):
+            doc = ShardDocument()
+            doc.terms = terms
+            source_docs.append(doc)
+        source = MagicMock()
+        source.postlist.return_value = [
+            SimpleNamespace(docid=i) for i in range(len(source_docs))]
+        source.get_document.side_effect = source_docs.__getitem__
+        source.get_metadata.return_value = b"1"
+        opened = {}
+
+        def open_db(path, flags):
+            return opened.setdefault(path, FakeWritableDatabase([], {}))
+
+        with patch.object(xapian_module.xapian, "Database", return_value=source), \
+                patch.object(xapian_module.xapian, "WritableDatabase", side_effect=open_db):
+            copied, skipped = split_index("/idx", self.shards)
+
+        self.assertEqual((copied, skipped), (3, 1))
+        shard = opened[os.path.join(self.shards, "7")]
+        self.assertEqual([d.terms for d in shard.docs], [{"Qa", "U7"}, {"Qc", "U7"}])
+        self.assertEqual(shard.metadata["uuid_terms"], "1")
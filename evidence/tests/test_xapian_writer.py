@@ -0,0 +1,191 @@
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from django.test import SimpleTestCase, override_settings
+
+from evidence import xapian as xapian_module
+from evidence.xapian import Writer
+
+
+class FakeWritableDatabase:
+    """Just enough of xapian.WritableDatabase to drive the Writer."""
+
+    def __init__(self, docs, metadata):
+        self.docs = docs
+        self.metadata = metadata
+        self.commits = 0
+        self.closed = False
+
+    def get_doccount(self):
+        return len(self.docs)
+
+    def get_metadata(self, key):
+        value = self.metadata.get(key, b"")
+        return value.encode() if isinstance(value, str) else value
+
+    def set_metadata(self, key, value):
+        self.metadata[key] = value
+
+    def begin_transaction(self):
+        pass
+
+    def commit_transaction(self):
+        self.commits += 1
+
+    def close(self):
+        self.closed = True
+
+    def postlist(self, term):
+        return [
+            SimpleNamespace(docid=i) for i, doc in enumerate(self.docs)
+            if term in doc.terms
+        ]
+
+    def get_document(self, docid):
+        return self.docs[docid]
+
+    def add_document(self, doc):
+        self.docs.append(doc)
+
+
+class FakeDocument:
+    def __init__(self):
+        self.terms = set()
+        self.values = {}
+
+    def set_data(self, data):
+        self.data = data
+
+    def add_term(self, term):
+        self.terms.add(term)
+
+    add_boolean_term = add_term
+
+    def add_value(self, slot, value):
+        self.values[slot] = value
+
+    def termlist(self):
+        return self
+
+
+@override_settings(EVIDENCES_DIR="/tmp/evidences-writer-tests",
+                   EVIDENCES_INDEX_BATCH_SIZE=2)
+class WriterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.institution = SimpleNamespace(id=7)
+        self.docs = []
+        self.opened = []
+
+        def open_db(path, flags):
+            db = FakeWritableDatabase(self.docs, self.metadata)
+            self.opened.append(db)
+            return db
+
+        self.metadata = {}
+        patch.object(xapian_module.xapian, "WritableDatabase",
+                     side_effect=open_db).start()
+        patch.object(xapian_module.xapian, "Document", FakeDocument).start()
+        patch.object(xapian_module.xapian, "TermGenerator").start()
+        patch.object(xapian_module, "has_term",
+                     side_effect=lambda doc, term: term in doc.terms).start()
+        self.addCleanup(patch.stopall)
+
+    def test_commits_every_batch_and_on_exit(self):
+        with Writer() as writer:
+            for n in range(5):
+                writer.add(self.institution, "uuid-{}".format(n), "{}")
+
+        self.assertEqual(len(self.docs), 5)
+        # batches of 2, 2 and a final one on exit, each releasing the lock
+        self.assertEqual(len(self.opened), 3)
+        self.assertTrue(all(db.commits == 1 and db.closed for db in self.opened))
+
+    def test_fresh_index_is_flagged_and_dedups_on_uuid_term(self):
+        with Writer() as writer:
+            self.assertTrue(writer.add(self.institution, "uuid-1", "{}"))
+            self.assertFalse(writer.add(self.institution, "uuid-1", "{}"))
+
+        self.assertEqual(self.metadata["uuid_terms"], "1")
+        self.assertEqual(self.docs[0].terms, {"Quuid-1", "U7"})
+
+    def test_same_uuid_in_another_institution_is_indexed(self):
+        with Writer() as writer:
+            writer.add(self.institution, "uuid-1", "{}")
+            writer.add(SimpleNamespace(id=8), "uuid-1", "{}")
+        self.assertEqual(len(self.docs), 2)
+
+    def test_legacy_index_falls_back_to_parsed_uuid_query(self):
+        legacy = FakeDocument()
+        legacy.add_term("U7")
+        self.docs.append(legacy)
+
+        enquire = MagicMock()
+        enquire.return_value.get_mset.return_value = [MagicMock(docid=1)]
+        with patch.object(xapian_module.xapian, "Enquire", enquire), \
+             patch.object(xapian_module, "build_query_parser"):
+            with Writer() as writer:
+                self.assertFalse(writer.add(self.institution, "old", "{}"))
+
+        enquire.return_value.get_mset.assert_called_once_with(0, 1)
+        self.assertEqual(len(self.docs), 1)
+
+
+class LockedDatabase(FakeWritableDatabase):
+    """FakeWritableDatabase holding the write lock of its path until closed,
+    as Xapian does: without DB_RETRY_LOCK a second writer fails at once."""
+
+    def __init__(self, lock, flags, docs, metadata):
+        if not lock.acquire(blocking=bool(flags & xapian_module.xapian.DB_RETRY_LOCK)):
+            raise xapian_module.xapian.DatabaseLockError("already locked")
+        super().__init__(docs, metadata)
+        self.lock = lock
+
+    def close(self):
+        super().close()
+        self.lock.release()
+
+
+@override_settings(EVIDENCES_DIR="/tmp/evidences-writer-tests")
+class WriterLockTests(SimpleTestCase):
+
+    def setUp(self):
+        self.institution = SimpleNamespace(id=7)
+        self.docs = []
+        self.errors = []
+        locks = {}
+
+        def open_db(path, flags):
+            lock = locks.setdefault(path, threading.Lock())
+            return LockedDatabase(lock, flags, self.docs, {})
+
+        patch.object(xapian_module.xapian, "WritableDatabase",
+                     side_effect=open_db).start()
+        patch.object(xapian_module.xapian, "Document", FakeDocument).start()
+        patch.object(xapian_module.xapian, "TermGenerator").start()
+        patch.object(xapian_module, "has_term",
+                     side_effect=lambda doc, term: term in doc.terms).start()
+        self.addCleanup(patch.stopall)
+
+    def write(self, uuid):
+        try:
+            with Writer("/tmp/evidences-writer-tests/index") as writer:
+                writer.add(self.institution, uuid, "{}")
+        except Exception as err:
+            self.errors.append(err)
+
+    def test_second_writer_on_the_same_path_waits_for_the_lock(self):
+        first = Writer("/tmp/evidences-writer-tests/index")
+        first.add(self.institution, "uuid-1", "{}")
+
+        second = threading.Thread(target=self.write, args=("uuid-2",))
+        second.start()
+        second.join(0.2)
+        self.assertTrue(second.is_alive())
+
+        first.close()
+        second.join(5)
+        self.assertFalse(second.is_alive())
+        self.assertEqual(self.errors, [])
+        self.assertEqual(len(self.docs), 2)
@@ -14,7 +14,9 @@ from django.views.generic.edit import (
 
 from action.models import DeviceLog
 from dashboard.mixins import  DashboardView, Http403
-from evidence.models import SystemProperty, RootAlias, Evidence, UserProperty
+from evidence.models import (
+    SystemProperty, RootAlias, Evidence, UserProperty, PhotoProcessing
+)
 from lot.models import DeviceLot, DeviceBeneficiary
 from evidence.forms import (
     UploadForm,
@@ -256,6 +258,23 @@ class PhotoEvidenceView(DashboardView, TemplateView):
         return response
 
 
+class PhotoStatusView(DashboardView, TemplateView):
+    """Processing status of a photo evidence, polled by its details page"""
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(
+            PhotoProcessing,
+            uuid=kwargs['pk'],
+            owner=self.request.user.institution,
+        )
+        return JsonResponse({
+            "uuid": str(job.uuid),
+            "status": job.get_status_display().lower(),
+            "finished": job.finished,
+            "error": job.error,
+        })
+
+
 class EraseServerView(DashboardView, FormView):
     template_name = "ev_details.html"
     section = "evidences"
@@ -1,3 +1,8 @@
+import os
+import re
+import json
+import threading
+
 import xapian
 from django.conf import settings
 
@@ -10,12 +15,164 @@ from django.conf import settings
 # stemmer = xapian.Stem("english")
 # indexer.set_stemmer(stemmer)
 
-def search(institution, qs, offset=0, limit=10):
-    try:
-        database = xapian.Database(settings.EVIDENCES_DIR)
-    except (xapian.DatabaseNotFoundError, xapian.DatabaseOpeningError):
-        return
 
+class Reader:
+    """An open Xapian reader plus the query objects bound to it.
+
+    Opening the database is by far the most expensive part of a search on a
+    large index, so a Reader is kept open for the life of the worker and
+    only ``reopen()``-ed when a writer committed a new revision. The
+    QueryParser and Enquire are built once per Reader and reused.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.open()
+
+    def open(self):
+        self.target = self._target()
+        self.database = self._open_database()
+        self.marker = self._marker()
+        self.uuid_terms = self._uuid_terms()
+        self.query_parser = build_query_parser(self.database)
+        self.enquire = xapian.Enquire(self.database)
+        # sort by weight first
+        self.enquire.set_weighting_scheme(xapian.BM25Weight())
+
+    def refresh(self):
+        """Reopen the database if a writer committed since the last call.
+
+        Returns True when the reader was actually reopened.
+        """
+        if self._target() != self.target:
+            # swapped for a rebuilt index: reopen() would keep the old files
+            self.database.close()
+            self.open()
+            return True
+
+        # reopen() is a no-op unless a writer committed; the revision tells
+        # whether it moved on, however close together the commits were
+        self._reopen()
+        marker = self._marker()
+        if marker == self.marker:
+            return False
+        self.marker = marker
+        self.uuid_terms = self._uuid_terms()
+        return True
+
+    def _target(self):
+        # the index may be a symlink flipped to a rebuilt database
+        return os.path.realpath(self.path)
+
+    def _open_database(self):
+        return xapian.Database(self.path)
+
+    def _reopen(self):
+        self.database.reopen()
+
+    def _marker(self):
+        return self.database.get_revision()
+
+    def _uuid_terms(self):
+        return has_uuid_terms(self.database)
+
+
+class CombinedReader(Reader):
+    """Reader over every institution shard under ``path`` at once.
+
+    Used for queries across institutions when the index is sharded. It
+    reopens when a shard is added as well as when any shard moves on.
+    """
+
+    def _target(self):
+        return tuple(shard_paths(self.path))
+
+    def _open_database(self):
+        self.shards = [xapian.Database(path) for path in self.target]
+        database = xapian.Database()
+        for shard in self.shards:
+            database.add_database(shard)
+        return database
+
+    def _reopen(self):
+        self.database.reopen()
+        for shard in self.shards:
+            shard.reopen()
+
+    def _marker(self):
+        # a combined database has no single revision
+        return tuple(shard.get_revision() for shard in self.shards)
+
+    def _uuid_terms(self):
+        return all(has_uuid_terms(shard) for shard in self.shards)
+
+
+class ReaderPool:
+    """Per-process (per gunicorn worker) pool of open Xapian readers.
+
+    Xapian database handles are not thread safe, so each thread gets its
+    own Reader; in the default sync gunicorn worker that is one Reader per
+    process. Counters are process-wide and exposed through ``stats()``.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self.counters = {"opens": 0, "hits": 0, "reopens": 0}
+
+    def get(self, path, reader_class=Reader):
+        readers = getattr(self._local, "readers", None)
+        if readers is None:
+            readers = self._local.readers = {}
+
+        reader = readers.get(path)
+        if reader is None:
+            reader = readers[path] = reader_class(path)
+            self.counters["opens"] += 1
+            return reader
+
+        if reader.refresh():
+            self.counters["reopens"] += 1
+        else:
+            self.counters["hits"] += 1
+        return reader
+
+    def discard(self, path):
+        readers = getattr(self._local, "readers", None)
+        if readers:
+            readers.pop(path, None)
+
+    def reset(self):
+        self._local = threading.local()
+
+    def stats(self):
+        return dict(self.counters)
+
+
+readers = ReaderPool()
+
+# A reader inherited through fork() would share file descriptors with the
+# parent (e.g. gunicorn --preload), so children always start with no reader.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=readers.reset)
+
+
+def revision_marker(path):
+    """Cheap token of the version file of the database at ``path``.
+
+    None when there is no database there. Glass rewrites its version file
+    on every commit, but commits within the same clock tick may keep the
+    same token: readers compare the database revision instead.
+    """
+    for name in ("iamglass", "iamhoney", "iamchert"):
+        try:
+            st = os.stat(os.path.join(path, name))
+        except OSError:
+            continue
+        return (st.st_mtime_ns, st.st_size)
+    return None
+
+
+def build_query_parser(database):
     qp = xapian.QueryParser()
     qp.set_database(database)
     qp.set_stemmer(xapian.Stem("english"))
@@ -25,52 +182,791 @@ def search(institution, qs, offset=0, limit=10):
     qp.set_default_op(xapian.Query.OP_AND)
 
     qp.add_prefix("uuid", "uuid")
+    for name, prefix in FIELD_PREFIXES.items():
+        if name in EXACT_FIELDS:
+            qp.add_boolean_prefix(name, field_processor(
+                prefix, lambda: ExactFieldProcessor(prefix)))
+        else:
+            qp.add_prefix(name, prefix)
+    qp.add_rangeprocessor(field_processor("date", EndTimeRangeProcessor))
+    return qp
+
+
+# query prefix -> term prefix of the evidence fields indexed by Writer
+FIELD_PREFIXES = {
+    "manufacturer": "XMANUFACTURER",
+    "model": "XMODEL",
+    "serial": "XSERIAL",
+    "component": "XCOMPONENT",
+    "mac": "XMAC",
+    "type": "XTYPE",
+}
+
+# identifiers matched as a whole, whatever their case and separators;
+# as boolean prefixes they filter (type:Laptop) rather than rank
+EXACT_FIELDS = {"serial", "mac", "type"}
+
+# value slots of every document, to sort and filter by range; "device"
+# holds the canonical root of the device of the evidence, to collapse
+VALUE_SLOTS = {
+    "date": 0, "type": 1, "manufacturer": 2, "institution": 3, "device": 4,
+}
+
+
+def exact_value(value):
+    """``value`` as an exact term: lowercase, letters and digits only."""
+    return re.sub(r"[^0-9a-z]", "", str(value).lower())[:200]
+
+
+class ExactFieldProcessor(xapian.FieldProcessor):
+    """Turns ``serial:ABC-123`` into the boolean term ``XSERIALabc123``."""
+
+    def __init__(self, prefix):
+        super().__init__()
+        self.prefix = prefix
+
+    def __call__(self, value):
+        return xapian.Query(self.prefix + exact_value(value))
+
+
+class EndTimeRangeProcessor(xapian.RangeProcessor):
+    """``date:2024..2025-06`` filters on endTime by year, month, day or
+    finer; both ends are included and either may be left out."""
+
+    def __init__(self):
+        super().__init__(VALUE_SLOTS["date"], "date:")
+
+    def __call__(self, begin, end):
+        slot = VALUE_SLOTS["date"]
+        begin = slot_value("date", begin).ljust(14, "0")
+        end = slot_value("date", end).ljust(14, "9")
+        if begin.strip("0") and end.strip("9"):
+            return xapian.Query(xapian.Query.OP_VALUE_RANGE, slot, begin, end)
+        if begin.strip("0"):
+            return xapian.Query(xapian.Query.OP_VALUE_GE, slot, begin)
+        if end.strip("9"):
+            return xapian.Query(xapian.Query.OP_VALUE_LE, slot, end)
+        return xapian.Query(xapian.Query.OP_INVALID)
+
+
+_processors = {}
+
+
+def field_processor(key, factory):
+    # the query parser does not keep a reference to its processors
+    processor = _processors.get(key)
+    if processor is None:
+        processor = _processors[key] = factory()
+    return processor
+
+
+def slot_value(name, value):
+    """``value`` of the field ``name`` as stored in its value slot.
+
+    Dates keep their digits only (YYYYMMDDhhmmss) so they sort as text.
+    """
+    if name == "date":
+        return re.sub(r"[^0-9]", "", str(value))[:14]
+    if name == "institution":
+        return xapian.sortable_serialise(int(value))
+    if name == "device":
+        return str(value)
+    return str(value).lower()[:200]
+
+
+def sort_slot(sort):
+    """(slot, reverse) of a ``sort`` key such as "date" or "-date"."""
+    if not sort:
+        return None, False
+    slot = VALUE_SLOTS.get(sort.lstrip("-"))
+    return slot, slot is not None and sort.startswith("-")
+
+
+def add_field(fields, name, value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if isinstance(value, str) and value.strip():
+        fields.setdefault(name, []).append(value.strip())
+
+
+def add_component_fields(fields, component):
+    if not isinstance(component, dict):
+        return
+    add_field(fields, "component", component.get("manufacturer"))
+    add_field(fields, "component", component.get("model"))
+    add_field(fields, "serial", component.get("serialNumber"))
+
+
+def document_fields(evidence):
+    """Searchable fields read from the JSON of ``evidence`` itself.
+
+    Covers the device and components of web and Workbench 11 snapshots,
+    the kv of placeholders and the OCR text and barcodes of photos. Other
+    snapshots need a parser: evidence.parse.Build passes their fields.
+    Returns ``{field: [values]}``; "text" holds free text with no prefix
+    and "date" and "device" are only kept in their value slots.
+    """
+    if isinstance(evidence, (str, bytes)):
+        try:
+            evidence = json.loads(evidence)
+        except ValueError:
+            return {}
+    if not isinstance(evidence, dict):
+        return {}
+
+    fields = {}
+    credential = evidence.get("credentialSubject")
+    add_field(fields, "date", evidence.get("endTime") or (
+        credential.get("endTime") if isinstance(credential, dict) else None))
+    add_field(fields, "device", evidence.get("WEB_ID"))
+    device = evidence.get("device")
+    if isinstance(device, dict):
+        add_field(fields, "manufacturer", device.get("manufacturer"))
+        add_field(fields, "model", device.get("model"))
+        add_field(
+            fields, "serial",
+            device.get("serialNumber") or device.get("serial_number"),
+        )
+        add_field(fields, "type", device.get("type"))
+    for component in evidence.get("components") or []:
+        add_component_fields(fields, component)
+
+    kv = evidence.get("kv")
+    if isinstance(kv, dict):
+        for key, value in kv.items():
+            add_field(fields, "text", key)
+            add_field(fields, "text", value)
+
+    data = evidence.get("data")
+    if isinstance(data, dict):
+        ocr = data.get("ocr")
+        if isinstance(ocr, dict):
+            add_field(fields, "text", ocr.get("text"))
+        for barcode in data.get("barcodes") or []:
+            if isinstance(barcode, dict):
+                add_field(fields, "text", barcode.get("data"))
+    photo = evidence.get("photo")
+    if isinstance(photo, dict):
+        add_field(fields, "text", photo.get("original_name"))
+        if photo.get("hash"):
+            add_field(fields, "device", "{}:{}".format(
+                evidence.get("type"), photo["hash"]))
+    return fields
+
+
+def reader_stats():
+    """Hit/open/reopen counters of this process' reader pool."""
+    return readers.stats()
+
+
+def index_path():
+    """Path of the evidence index.
+
+    DEVICEHUB_EVIDENCES_INDEX_DIR, or the evidences dir itself as before.
+    When it is a symlink, ``rebuild_index`` can swap in a rebuilt index.
+    """
+    return settings.EVIDENCES_INDEX_DIR or settings.EVIDENCES_DIR
+
+
+def split_index(source, directory, batch_size=None):
+    """Copy every document of the index ``source`` to its institution's
+    shard under ``directory``, by its ``U<id>`` term.
+
+    Returns ``(copied, skipped)``; documents without an institution term
+    are skipped and the source index is left untouched.
+    """
+    batch_size = batch_size or settings.EVIDENCES_INDEX_BATCH_SIZE
+    uuid_terms = schema = False
+    copied = skipped = 0
+    writers = {}
+
+    database = xapian.Database(source)
+    try:
+        uuid_terms = has_uuid_terms(database)
+        schema = has_field_schema(database)
+        for item in database.postlist(""):
+            doc = database.get_document(item.docid)
+            institution = document_institution_term(doc)
+            if not institution:
+                skipped += 1
+                continue
+
+            writer = writers.get(institution)
+            if writer is None:
+                os.makedirs(directory, exist_ok=True)
+                writer = writers[institution] = xapian.WritableDatabase(
+                    os.path.join(directory, institution[1:]),
+                    xapian.DB_CREATE_OR_OVERWRITE,
+                )
+                writer.begin_transaction()
+            writer.add_document(doc)
+            copied += 1
+            if copied % batch_size == 0:
+                for w in writers.values():
+                    w.commit_transaction()
+                    w.begin_transaction()
+    finally:
+        database.close()
+        for writer in writers.values():
+            if uuid_terms:
+                writer.set_metadata(Writer.UUID_TERMS_KEY, "1")
+            if schema:
+                writer.set_metadata(Writer.SCHEMA_KEY, Writer.SCHEMA)
+            writer.commit_transaction()
+            writer.close()
+
+    return copied, skipped
+
+
+def document_institution_term(doc):
+    """The ``U<id>`` term of ``doc``, if any."""
+    try:
+        item = doc.termlist().skip_to("U")
+    except StopIteration:
+        return
+    term = item.term.decode()
+    if term.startswith("U") and term[1:].isdigit():
+        return term
+
+
+def shards_dir():
+    """Directory of the per-institution shards, or "" if not sharded."""
+    return settings.EVIDENCES_SHARDS_DIR
+
+
+def shard_path(institution, directory=None):
+    return os.path.join(directory or shards_dir(), str(institution.id))
+
+
+def shard_paths(directory):
+    """Every shard database under ``directory``, in a stable order."""
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        return []
+    return [
+        os.path.realpath(os.path.join(directory, name)) for name in names
+        if name.isdigit() and os.path.isdir(os.path.join(directory, name))
+    ]
+
 
+def get_reader(institution=None):
+    """Reader of the index holding ``institution``'s evidences.
+
+    With a sharded index that is the institution's own shard, or all of
+    them combined when no institution is given.
+    """
+    try:
+        if not shards_dir():
+            return readers.get(index_path())
+        if institution:
+            return readers.get(shard_path(institution))
+        return readers.get(shards_dir(), CombinedReader)
+    except (xapian.DatabaseNotFoundError, xapian.DatabaseOpeningError):
+        return
+
+
+def read_index(institution, read):
+    """Run ``read(reader)`` on the reader of ``institution``'s index.
+
+    A writer may recycle the blocks of the revision a reader still holds,
+    and Xapian then raises DatabaseModifiedError at any step of the read:
+    the match, a postlist or a document fetch. The whole read runs once
+    more on a fresh reader. Returns None when there is no index.
+    """
+    for attempt in range(2):
+        reader = get_reader(institution)
+        if not reader:
+            return
+        try:
+            return read(reader)
+        except xapian.DatabaseModifiedError:
+            readers.discard(reader.path)
+            if attempt:
+                raise
+
+
+def fetch_documents(mset):
+    """Read the data of every document of ``mset`` now, while its revision
+    is still open, so callers never hit a recycled one."""
+    for match in mset:
+        match.document.get_data()
+    return mset
+
+
+def search(institution, qs, offset=0, limit=10, sort=None, check_at_least=None,
+           collapse=False):
+    """MSet of the documents of ``institution`` matching ``qs``.
+
+    Ranked by relevance, or by a value slot when ``sort`` is one of
+    VALUE_SLOTS ("-" in front for descending), relevance breaking ties.
+
+    The MSet also carries the size of the whole result set: its
+    ``get_matches_estimated()`` is exact while there are no more than
+    ``check_at_least`` matches (DEVICEHUB_SEARCH_EXACT_COUNT by default),
+    so one call serves a page and its total; ``limit`` may be 0 for the
+    total alone.
+
+    With ``collapse`` only the best evidence of each device is returned,
+    its ``collapse_count`` telling how many more matched, and the total
+    counts devices. Documents indexed before the device slot existed are
+    never collapsed.
+    """
+    if check_at_least is None:
+        check_at_least = settings.SEARCH_EXACT_COUNT
+
+    def read(reader):
+        return fetch_documents(match(
+            reader, institution, qs, offset, limit, sort, check_at_least,
+            collapse,
+        ))
+
+    return read_index(institution, read)
+
+
+def search_devices(institution, qs, limit=None):
+    """Device value slots of the devices of ``institution`` matching ``qs``.
+
+    At most ``limit`` (DEVICEHUB_SEARCH_EXACT_COUNT by default) devices,
+    best first. Only the values of the matches are read: no document data
+    is fetched, so a long result costs no JSON parsing.
+    """
+    if limit is None:
+        limit = settings.SEARCH_EXACT_COUNT
+    slot = VALUE_SLOTS["device"]
+
+    def read(reader):
+        devices = []
+        for item in match(reader, institution, qs, 0, limit, collapse=True):
+            value = item.document.get_value(slot)
+            if value:
+                devices.append(value.decode() if isinstance(value, bytes) else value)
+        return devices
+
+    return read_index(institution, read) or []
+
+
+def match(reader, institution, qs, offset, limit, sort=None, check_at_least=0,
+          collapse=False):
+    """Run ``qs`` on ``reader``; see search for the arguments."""
+    slot, reverse = sort_slot(sort)
     flags = (
         xapian.QueryParser.FLAG_BOOLEAN |
         xapian.QueryParser.FLAG_PHRASE |
         xapian.QueryParser.FLAG_PARTIAL |
         xapian.QueryParser.FLAG_LOVEHATE
     )
+    query = reader.query_parser.parse_query(qs, flags)
 
-    query = qp.parse_query(qs, flags)
-
-    if institution:
-        institution_term = "U{}".format(institution.id)
+    # a shard only holds the documents of its institution
+    if institution and not shards_dir():
         final_query = xapian.Query(
-            xapian.Query.OP_AND, query, xapian.Query(institution_term)
+            xapian.Query.OP_AND, query,
+            xapian.Query(institution_term(institution)),
         )
     else:
         final_query = xapian.Query(query)
 
-    enquire = xapian.Enquire(database)
+    reader.enquire.set_query(final_query)
+    # the enquire is shared by every search of this reader
+    if slot is None:
+        reader.enquire.set_sort_by_relevance()
+    else:
+        reader.enquire.set_sort_by_value_then_relevance(slot, reverse)
+    reader.enquire.set_collapse_key(
+        VALUE_SLOTS["device"] if collapse else xapian.BAD_VALUENO)
+    return reader.enquire.get_mset(offset, limit, check_at_least)
+
+
+def get_document_by_uuid(owner, uuid):
+    """Return the Xapian document of evidence ``uuid`` or None.
+
+    Resolved with a single postlist lookup of its ``Q<uuid>`` term, checking
+    the ``U<id>`` term when ``owner`` is given. Indexes that were not
+    backfilled yet (see the ``xapian_uuid_terms`` command) fall back to the
+    parsed ``uuid:"..."`` query.
+    """
+    def read(reader):
+        if not reader.uuid_terms:
+            matches = search(owner, 'uuid:"{}"'.format(uuid), limit=1)
+            for match in matches or []:
+                return match.document
+            return
+
+        database = reader.database
+        for item in database.postlist(uuid_term(uuid)):
+            doc = database.get_document(item.docid)
+            if not owner or has_term(doc, institution_term(owner)):
+                doc.get_data()
+                return doc
+
+    return read_index(owner, read)
+
+
+def get_documents_by_uuids(owner, uuids):
+    """Map each indexed uuid of ``uuids`` to its stored JSON data.
 
-    # sort by weight first
-    enquire.set_weighting_scheme(xapian.BM25Weight())
-    enquire.set_query(final_query)
+    All documents come from one boolean ``OP_OR`` query over their
+    ``Q<uuid>`` terms (filtered by ``U<id>`` when ``owner`` is given)
+    instead of one lookup per uuid.
+    """
+    uuids = list(dict.fromkeys(str(u) for u in uuids))
+    if not uuids:
+        return {}
 
-    matches = enquire.get_mset(offset, limit)
-    return matches
+    def read(reader):
+        found = {}
+        if not reader.uuid_terms:
+            for uuid in uuids:
+                doc = get_document_by_uuid(owner, uuid)
+                if doc is not None:
+                    found[uuid] = doc.get_data()
+            return found
 
-def index(institution, uuid, snap):
-    uuid = 'uuid:"{}"'.format(uuid)
-    matches = search(institution, uuid, limit=1)
-    if matches and matches.size() > 0:
+        query = xapian.Query(
+            xapian.Query.OP_OR, [xapian.Query(uuid_term(u)) for u in uuids]
+        )
+        if owner and not shards_dir():
+            query = xapian.Query(
+                xapian.Query.OP_FILTER, query,
+                xapian.Query(institution_term(owner)),
+            )
+        enquire = xapian.Enquire(reader.database)
+        enquire.set_weighting_scheme(xapian.BoolWeight())
+        enquire.set_query(query)
+
+        # one document per uuid, or one per shard across institutions
+        maxitems = len(uuids) * len(getattr(reader, "shards", None) or [reader])
+        for match in enquire.get_mset(0, maxitems):
+            uuid = document_uuid_term(match.document)
+            if uuid and uuid not in found:
+                found[uuid] = match.document.get_data()
+        return found
+
+    return read_index(owner, read) or {}
+
+
+def document_uuid_term(doc):
+    """uuid held by the ``Q<uuid>`` term of ``doc``, if any."""
+    try:
+        item = doc.termlist().skip_to("Q")
+    except StopIteration:
+        return
+    term = item.term.decode()
+    if term.startswith("Q"):
+        return term[1:]
+
+
+def uuid_term(uuid):
+    """Unique boolean term identifying the document of evidence ``uuid``."""
+    return "Q{}".format(uuid)
+
+
+def institution_term(institution):
+    return "U{}".format(institution.id)
+
+
+def has_field_schema(database):
+    """True if ``database`` was built with the field-aware schema."""
+    return database.get_metadata(Writer.SCHEMA_KEY) == Writer.SCHEMA.encode()
+
+
+def has_uuid_terms(database):
+    """True if every document of ``database`` carries its ``Q<uuid>`` term."""
+    return database.get_metadata(Writer.UUID_TERMS_KEY) == b"1"
+
+
+def document_uuid(data):
+    """UUID a stored snapshot was indexed under, from its JSON data."""
+    try:
+        snap = json.loads(data)
+    except (TypeError, ValueError):
         return
+    if not isinstance(snap, dict):
+        return
+    return snap.get("credentialSubject", {}).get("uuid") or snap.get("uuid")
+
+
+def has_term(doc, term):
+    terms = doc.termlist()
+    try:
+        item = terms.skip_to(term)
+    except StopIteration:
+        return False
+    return item.term == term.encode()
+
+
+class Writer:
+    """Context-managed, batched writer for the evidence index.
+
+    Documents are added inside a Xapian transaction that is committed every
+    ``batch_size`` documents (and on exit), so a bulk import pays one lock,
+    flush and fsync per batch instead of one per snapshot. The write lock
+    is released between batches so web uploads are not starved during a
+    long import.
+
+    Duplicates are detected with a postlist lookup of the document's
+    ``Q<uuid>`` term. Indexes created before that term existed are flagged
+    by the ``uuid_terms`` metadata key being unset; for those the writer
+    falls back to the old parsed ``uuid:"..."`` query.
+
+    With a sharded index and no explicit ``path`` the writer only routes
+    each document to a writer on the shard of its institution.
+
+    Documents only index the fields of their evidence and keep some in
+    value slots. Indexes built otherwise, flagged by the ``schema``
+    metadata key, are migrated by ``rebuild_index``.
+    """
+
+    UUID_TERMS_KEY = "uuid_terms"
+    # unset: every token of the JSON; 2: field terms and value slots
+    SCHEMA_KEY = "schema"
+    SCHEMA = "2"
+
+    def __init__(self, path=None, batch_size=None):
+        self.path = path or index_path()
+        self.shards = {} if path is None and shards_dir() else None
+        self.batch_size = batch_size or settings.EVIDENCES_INDEX_BATCH_SIZE
+        self.database = None
+        self.pending = 0
+        self.added = 0
+        self.indexer = xapian.TermGenerator()
+        self.indexer.set_stemmer(xapian.Stem("english"))
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Documents already added belong to evidences whose SystemProperty
+        # rows are committed by Build, so they are kept even on error.
+        self.close()
+        return False
+
+    def shard(self, institution):
+        writer = self.shards.get(institution.id)
+        if writer is None:
+            path = shard_path(institution)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = self.shards[institution.id] = Writer(path, self.batch_size)
+        return writer
+
+    def open(self):
+        if self.database is not None or self.shards is not None:
+            return
+        # wait for another writer's batch (a web upload, reindex, the photo
+        # pool) to commit instead of failing with DatabaseLockError
+        self.database = xapian.WritableDatabase(
+            self.path, xapian.DB_CREATE_OR_OPEN | xapian.DB_RETRY_LOCK
+        )
+        if self.database.get_doccount() == 0:
+            self.database.set_metadata(self.UUID_TERMS_KEY, "1")
+            self.database.set_metadata(self.SCHEMA_KEY, self.SCHEMA)
+        self.uuid_terms = has_uuid_terms(self.database)
+        self.database.begin_transaction()
+
+    def commit(self):
+        """Commit the current batch and release the write lock."""
+        if self.shards is not None:
+            for writer in self.shards.values():
+                writer.commit()
+            return
+        if self.database is None:
+            return
+        self.database.commit_transaction()
+        self.database.close()
+        self.database = None
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+
+    def exists(self, institution, uuid):
+        return self.find(institution, uuid) is not None
+
+    def find(self, institution, uuid):
+        """docid of the document indexed for ``uuid``, or None."""
+        if self.shards is not None:
+            return self.shard(institution).find(institution, uuid)
+        self.open()
+        for item in self.database.postlist(uuid_term(uuid)):
+            if not institution:
+                return item.docid
+            doc = self.database.get_document(item.docid)
+            if has_term(doc, institution_term(institution)):
+                return item.docid
+
+        if self.uuid_terms:
+            return
+
+        query = build_query_parser(self.database).parse_query(
+            'uuid:"{}"'.format(uuid),
+            xapian.QueryParser.FLAG_BOOLEAN | xapian.QueryParser.FLAG_PHRASE,
+        )
+        if institution:
+            query = xapian.Query(
+                xapian.Query.OP_AND, query,
+                xapian.Query(institution_term(institution)),
+            )
+        enquire = xapian.Enquire(self.database)
+        enquire.set_query(query)
+        for match in enquire.get_mset(0, 1):
+            return match.docid
+
+    def add(self, institution, uuid, snap, fields=None):
+        """Index ``snap`` (serialized JSON) unless ``uuid`` is already there.
+
+        Returns True if a document was added.
+        """
+        if self.shards is not None:
+            added = self.shard(institution).add(institution, uuid, snap, fields)
+            self.added += added
+            return added
+
+        if self.exists(institution, uuid):
+            return False
+
+        self.database.add_document(self.document(institution, uuid, snap, fields))
+        self._added()
+        return True
+
+    def replace(self, institution, uuid, snap, fields=None):
+        """Index ``snap`` in place of the document of ``uuid``, if any.
+
+        Only for documents that are rewritten by design, such as the
+        placeholder of a photo whose processing has finished.
+        """
+        if self.shards is not None:
+            self.shard(institution).replace(institution, uuid, snap, fields)
+            self.added += 1
+            return
+
+        docid = self.find(institution, uuid)
+        doc = self.document(institution, uuid, snap, fields)
+        if docid is None:
+            self.database.add_document(doc)
+        else:
+            self.database.replace_document(docid, doc)
+        self._added()
+
+    def document(self, institution, uuid, snap, fields=None):
+        """Xapian document of evidence ``uuid``.
+
+        Only ``fields`` (see document_fields) are indexed, each under its
+        prefix and as free text, and the VALUE_SLOTS ones are also stored
+        as values; the raw JSON ``snap`` is just the data.
+        """
+        if fields is None:
+            fields = document_fields(snap)
+
+        doc = xapian.Document()
+        doc.set_data(snap)
+
+        self.indexer.set_document(doc)
+        for name, values in fields.items():
+            prefix = FIELD_PREFIXES.get(name)
+            if not prefix and name != "text":
+                continue
+            for value in values:
+                if name in EXACT_FIELDS:
+                    doc.add_boolean_term(prefix + exact_value(value))
+                elif prefix:
+                    self.indexer.index_text(value, 1, prefix)
+                self.indexer.index_text(value)
+                # no phrase matches across two values
+                self.indexer.increase_termpos()
+        self.indexer.index_text('uuid:"{}"'.format(uuid), 10, "uuid")
+        self.indexer.index_text(uuid)
+
+        for name, slot in VALUE_SLOTS.items():
+            if fields.get(name):
+                doc.add_value(slot, slot_value(name, fields[name][0]))
+        doc.add_value(
+            VALUE_SLOTS["institution"],
+            slot_value("institution", institution.id),
+        )
+        doc.add_boolean_term(uuid_term(uuid))
+        doc.add_term(institution_term(institution))
+        return doc
+
+    def _added(self):
+        self.pending += 1
+        self.added += 1
+        if self.pending >= self.batch_size:
+            self.commit()
+
+
+def swap_index(path, target):
+    """Point the index symlink ``path`` at the database dir ``target``.
+
+    The new link is made beside ``path`` and renamed over it, so readers
+    see either the old or the new index, never a missing one; they switch
+    on their next refresh. Returns the previous target, if any.
+    """
+    if os.path.exists(path) and not os.path.islink(path):
+        raise ValueError("{} is not a symlink".format(path))
+
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    link = "{}.swap".format(path)
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.relpath(target, os.path.dirname(path)), link)
+    os.replace(link, path)
+    return previous
+
+
+def index(institution, uuid, snap, fields=None):
+    with Writer() as writer:
+        writer.add(institution, uuid, snap, fields)
+
+
+def backfill_uuid_terms(path=None, batch_size=None):
+    """Add the ``Q<uuid>`` term to documents indexed before it existed.
+
+    Returns ``(updated, skipped)``. The index is only flagged as fully
+    Q-termed, enabling the direct lookups, when no document was skipped.
+    """
+    if path is None and shards_dir():
+        updated = skipped = 0
+        for shard in shard_paths(shards_dir()):
+            shard_updated, shard_skipped = backfill_uuid_terms(shard, batch_size)
+            updated += shard_updated
+            skipped += shard_skipped
+        return updated, skipped
+
+    path = path or index_path()
+    batch_size = batch_size or settings.EVIDENCES_INDEX_BATCH_SIZE
+    updated = skipped = 0
+
+    database = xapian.WritableDatabase(
+        path, xapian.DB_CREATE_OR_OPEN | xapian.DB_RETRY_LOCK)
+    try:
+        # docids are collected first: replacing documents invalidates a
+        # postlist iterator on the same writable database
+        docids = [item.docid for item in database.postlist("")]
+        database.begin_transaction()
+        for docid in docids:
+            doc = database.get_document(docid)
+            uuid = document_uuid(doc.get_data())
+            if not uuid:
+                skipped += 1
+                continue
 
-    database = xapian.WritableDatabase(settings.EVIDENCES_DIR, xapian.DB_CREATE_OR_OPEN)
-    indexer = xapian.TermGenerator()
-    stemmer = xapian.Stem("english")
-    indexer.set_stemmer(stemmer)
+            term = uuid_term(uuid)
+            if has_term(doc, term):
+                continue
 
-    doc = xapian.Document()
-    doc.set_data(snap)
+            doc.add_boolean_term(term)
+            database.replace_document(docid, doc)
+            updated += 1
+            if updated % batch_size == 0:
+                database.commit_transaction()
+                database.begin_transaction()
 
-    indexer.set_document(doc)
-    indexer.index_text(snap)
-    indexer.index_text(uuid, 10, "uuid")
-    # indexer.index_text(snap, 1, "snapshot")
-    institution_term = "U{}".format(institution.id)
-    doc.add_term(institution_term)
+        if not skipped:
+            database.set_metadata(Writer.UUID_TERMS_KEY, "1")
+        database.commit_transaction()
+    finally:
+        database.close()
 
-    database.add_document(doc)
+    return updated, skipped
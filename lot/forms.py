@@ -42,15 +42,15 @@ class LotsForm(forms.Form):
         if not commit:
             return
 
-        for dev in self.devices:
-            for lot in self._lots:
-                lot.add(dev.id)
+        dev_ids = [dev.id for dev in self.devices]
+        for lot in self._lots:
+            lot.add_many(dev_ids)
         return
 
     def remove(self):
-        for dev in self.devices:
-            for lot in self._lots:
-                lot.remove(dev.id)
+        dev_ids = [dev.id for dev in self.devices]
+        for lot in self._lots:
+            lot.remove_many(dev_ids)
         return
 
 
@@ -85,13 +85,11 @@ class BeneficiaryForm(forms.Form):
                 shop=self.shop
             )
 
-            for dev in self.devices:
-                self.ben.add(dev.id)
+            self.ben.add_many([dev.id for dev in self.devices])
         return
 
     def remove(self):
-        for dev in self.devices:
-            self.ben.remove(dev.id)
+        self.ben.remove_many([dev.id for dev in self.devices])
         return
 
 
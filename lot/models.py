@@ -1,6 +1,6 @@
 import uuid
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Max
 from django.utils.translation import gettext_lazy as _
 from utils.constants import (
@@ -71,6 +71,27 @@ class Lot(models.Model):
         aliases = RootAlias.physical_aliases(self.owner, v)
         DeviceLot.objects.filter(lot=self, device_id__in=aliases).delete()
 
+    def add_many(self, ids):
+        """``add`` for many devices: the canonical roots of ``ids`` not yet
+        in the lot, under any alias, are inserted at once. Returns the
+        roots added."""
+        to_root = RootAlias.physical_roots(self.owner, ids)
+        with transaction.atomic():
+            present = {
+                to_root[d] for d in DeviceLot.objects.filter(
+                    lot=self, device_id__in=list(to_root)
+                ).values_list("device_id", flat=True)
+            }
+            new_roots = {to_root[v] for v in ids} - present
+            DeviceLot.objects.bulk_create(
+                [DeviceLot(lot=self, device_id=root) for root in new_roots]
+            )
+        return new_roots
+
+    def remove_many(self, ids):
+        to_root = RootAlias.physical_roots(self.owner, ids)
+        DeviceLot.objects.filter(lot=self, device_id__in=list(to_root)).delete()
+
     @property
     def devices(self):
         return DeviceLot.objects.filter(lot=self)
@@ -160,6 +181,33 @@ class Beneficiary(models.Model):
             beneficiary=self, device_id__in=aliases
         ).delete()
 
+    def add_many(self, ids):
+        """``add`` for many devices, skipping the ones already assigned to
+        any beneficiary of the lot. Returns the roots added."""
+        to_root = RootAlias.physical_roots(self.lot.owner, ids)
+        with transaction.atomic():
+            present = {
+                to_root[d] for d in DeviceBeneficiary.objects.filter(
+                    beneficiary__lot=self.lot, device_id__in=list(to_root)
+                ).values_list("device_id", flat=True)
+            }
+            new_roots = {to_root[v] for v in ids} - present
+            DeviceBeneficiary.objects.bulk_create([
+                DeviceBeneficiary(
+                    beneficiary=self,
+                    device_id=root,
+                    status=DeviceBeneficiary.Status.INTERESTED
+                )
+                for root in new_roots
+            ])
+        return new_roots
+
+    def remove_many(self, ids):
+        to_root = RootAlias.physical_roots(self.lot.owner, ids)
+        DeviceBeneficiary.objects.filter(
+            beneficiary=self, device_id__in=list(to_root)
+        ).delete()
+
 
 class DeviceBeneficiary(models.Model):
     class Status(models.IntegerChoices):
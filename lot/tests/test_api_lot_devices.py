@@ -0,0 +1,118 @@
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import Token
+from device.models import ProductCache
+from evidence.models import SystemProperty, UserProperty
+from lot.models import Lot, LotTag, DeviceLot
+from user.models import Institution, User
+
+
+class LotDevicesApiTests(TestCase):
+    """GET /api/v1/lots/<id>/devices/ filters, sorts and pages the lot in SQL
+    over the ProductCache read model."""
+
+    def setUp(self):
+        self.institution = Institution.objects.create(name="Inst")
+        self.user = User.objects.create_user(
+            email="admin@example.com", institution=self.institution,
+            password="testpass123",
+        )
+        tag = LotTag.objects.create(name="default", owner=self.institution)
+        self.lot = Lot.objects.create(
+            name="lot-a", owner=self.institution, type=tag)
+        token = Token.objects.create(tag="erp", token=uuid.uuid4(),
+                                     owner=self.user)
+        self.auth = {"HTTP_AUTHORIZATION": "Bearer {}".format(token.token)}
+        self.url = "/api/v1/lots/{}/devices/".format(self.lot.pk)
+
+        now = timezone.now()
+        self.roots = []
+        for n in range(5):
+            root = "ereuse24:d{}".format(n)
+            ProductCache.objects.create(
+                owner=self.institution, root=root, shortid="D{}".format(n),
+                type="Laptop" if n % 2 else "Desktop", manufacturer="Acme",
+                # two devices share a date, so paging must break the tie
+                last_updated=now - timedelta(days=min(n, 3)),
+            )
+            DeviceLot.objects.create(lot=self.lot, device_id=root)
+            self.roots.append(root)
+        # in the institution, but not in the lot
+        ProductCache.objects.create(
+            owner=self.institution, root="ereuse24:out", type="Laptop",
+            last_updated=now)
+
+    def _ids(self, response):
+        return [d["ID"].split(":d")[-1] for d in response.json()["devices"]]
+
+    def test_cursor_walks_the_lot_newest_first(self):
+        response = self.client.get(self.url, {"size": 2}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["pagination"]["total_items"], 5)
+        seen = self._ids(response)
+
+        while body["next_cursor"]:
+            response = self.client.get(
+                self.url, {"size": 2, "cursor": body["next_cursor"]}, **self.auth)
+            body = response.json()
+            self.assertIsNone(body["pagination"]["total_items"])
+            seen += self._ids(response)
+
+        self.assertEqual(seen, ["0", "1", "2", "4", "3"])
+
+    def test_page_numbers_match_cursor_order(self):
+        response = self.client.get(
+            self.url, {"size": 2, "page": 3}, **self.auth)
+        self.assertEqual(self._ids(response), ["3"])
+        self.assertIsNone(response.json()["next_cursor"])
+
+    def test_search_and_property_filters(self):
+        UserProperty.objects.create(
+            owner=self.institution, device_id="ereuse24:d3",
+            type=UserProperty.Type.USER, key="grade", value="A")
+
+        response = self.client.get(
+            self.url, {"q": "laptop acme", "sort": "type"}, **self.auth)
+        self.assertEqual(self._ids(response), ["1", "3"])
+
+        response = self.client.get(
+            self.url, {"prop_key": "grade", "prop_value": "A"}, **self.auth)
+        self.assertEqual(self._ids(response), ["3"])
+
+    def test_search_keeps_shortid_and_full_text_matches(self):
+        with patch("evidence.models.ProductCache.schedule"):
+            SystemProperty.objects.create(
+                owner=self.institution, uuid=uuid.uuid4(),
+                key="ereuse24", value="ereuse24:d2")
+
+        response = self.client.get(self.url, {"q": "d2"}, **self.auth)
+        self.assertEqual(self._ids(response), ["2"])
+
+        # e.g. a component serial only found in the evidence
+        with patch("api.v1.utils.search_devices",
+                   return_value=["ereuse24:out", "ereuse24:d4"]) as index:
+            response = self.client.get(self.url, {"q": "s3r1al"}, **self.auth)
+        self.assertEqual(self._ids(response), ["4"])
+        index.assert_called_once_with(self.institution, "s3r1al")
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "nope"}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_of_another_sort_is_rejected(self):
+        response = self.client.get(
+            self.url, {"size": 2, "sort": "type"}, **self.auth)
+        cursor = response.json()["next_cursor"]
+
+        response = self.client.get(
+            self.url, {"size": 2, "cursor": cursor}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            self.url, {"size": 2, "sort": "type", "cursor": cursor}, **self.auth)
+        self.assertEqual(response.status_code, 200)
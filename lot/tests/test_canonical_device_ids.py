@@ -216,6 +216,60 @@ class CanonicalDeviceIdsTests(TestCase):
             DeviceBeneficiary.objects.filter(beneficiary=b).exists()
         )
 
+    # --- add_many / remove_many -----------------------------------------
+
+    def test_physical_roots_maps_siblings_to_root(self):
+        self.assertEqual(
+            RootAlias.physical_roots(self.institution, ["ereuse24:b1", "unknown"]),
+            {
+                "ereuse24:b1": "ereuse24:b2",
+                "ereuse24:b2": "ereuse24:b2",
+                "ereuse24:b3": "ereuse24:b2",
+                "unknown": "unknown",
+            },
+        )
+
+    def test_lot_add_many_stores_missing_roots_once(self):
+        self._fresh_sp("ereuse24:z1")
+        self.lot.add("ereuse24:b1")
+        with self.assertNumQueries(5):
+            added = self.lot.add_many(
+                ["ereuse24:b3", "ereuse24:z1", "ereuse24:b2", "ereuse24:z1"]
+            )
+        self.assertEqual(added, {"ereuse24:z1"})
+        self.assertEqual(
+            set(DeviceLot.objects.filter(lot=self.lot).values_list(
+                "device_id", flat=True
+            )),
+            {"ereuse24:b2", "ereuse24:z1"},
+        )
+
+    def test_lot_remove_many_deletes_stale_rows(self):
+        self._fresh_sp("ereuse24:z1")
+        self.lot.add_many(["ereuse24:z1", "ereuse24:b1"])
+        RootAlias.objects.update_or_create(
+            owner=self.institution,
+            alias="ereuse24:z1",
+            defaults={"root": "custom_id:Z"},
+        )
+        self.lot.remove_many(["custom_id:Z", "ereuse24:b3"])
+        self.assertFalse(DeviceLot.objects.filter(lot=self.lot).exists())
+
+    def test_beneficiary_add_many_skips_devices_of_the_lot(self):
+        self._fresh_sp("ereuse24:w1")
+        b = self._make_beneficiary()
+        other = Beneficiary.objects.create(
+            lot=self.lot, shop=b.shop, email="other@test.local"
+        )
+        other.add("ereuse24:b3")
+        self.assertEqual(b.add_many(["ereuse24:b1", "ereuse24:w1"]),
+                         {"ereuse24:w1"})
+
+        b.remove_many(["ereuse24:w1"])
+        self.assertFalse(
+            DeviceBeneficiary.objects.filter(beneficiary=b).exists()
+        )
+
 
 class DataMigrationDedupTests(TestCase):
     """Simulate the Phase 2.1 migration on pre-existing DeviceLot/DeviceBeneficiary
@@ -212,7 +212,7 @@ class AddToLotView(DashboardView, FormView):
         return kwargs
 
     def form_valid(self, form):
-        form.devices = self.get_session_devices()
+        form.devices = self.get_session_device_refs()
         form.save()
         response = super().form_valid(form)
         messages.success(self.request, _("Devices assigned to Lot."))
@@ -226,7 +226,7 @@ class DelToLotView(DashboardView, View):
     #DashboardView will redirect to a GET method
     def get(self, request, *args, **kwargs):
         lot_id = self.kwargs.get('pk')
-        selected_devices = self.get_session_devices()
+        selected_devices = self.get_session_device_refs()
 
         if not selected_devices:
             messages.error(request, _("No devices selected"))
@@ -237,19 +237,21 @@ class DelToLotView(DashboardView, View):
                 owner=self.request.user.institution,
             ).first()
 
-            beneficiary = []
-            for dev in selected_devices:
-                # dev.id may be any physical alias or the root; the stored
-                # device_id may be a stale root captured at add time, so
-                # match against every alias of the canonical device.
-                aliases = RootAlias.physical_aliases(
-                    self.request.user.institution, dev.id
-                )
-                exist = DeviceBeneficiary.objects.filter(
-                    beneficiary__lot_id=lot_id, device_id__in=aliases
-                ).exists()
-                if exist:
-                    beneficiary.append(dev.shortid)
+            # the stored device_id may be a stale root captured at add
+            # time, so match against every alias of the canonical devices.
+            dev_ids = [dev.id for dev in selected_devices]
+            to_root = RootAlias.physical_roots(
+                self.request.user.institution, dev_ids
+            )
+            with_beneficiary = {
+                to_root[d] for d in DeviceBeneficiary.objects.filter(
+                    beneficiary__lot_id=lot_id, device_id__in=list(to_root)
+                ).values_list("device_id", flat=True)
+            }
+            beneficiary = [
+                dev.shortid for dev in selected_devices
+                if dev.id in with_beneficiary
+            ]
 
             if beneficiary:
                 for d in beneficiary:
@@ -257,8 +259,7 @@ class DelToLotView(DashboardView, View):
                     messages.error(request, msg % d)
                 return redirect(reverse_lazy('dashboard:lot', kwargs={'pk': lot_id}))
 
-            for dev in selected_devices:
-                lot.remove(dev.id)
+            lot.remove_many(dev_ids)
             msg = _("Successfully unassigned %d devices from the lot")
             messages.success(request, msg % len(selected_devices))
 
@@ -915,7 +916,7 @@ class BeneficiaryView(DashboardLotMixing, BeneficiaryInterestedEmail, FormView):
         )
 
     def form_valid(self, form):
-        form.devices = self.get_session_devices()
+        form.devices = self.get_session_device_refs()
         form.save()
         self.beneficiary = form.ben
         self.send_email(form.ben)
@@ -1182,15 +1183,20 @@ class AddDevicesBeneficiaryView(DashboardView, NotifyEmail, TemplateView):
 
         if subscriptor or self.request.user.is_admin:
             devices = self.request.session.get("devices", [])
+            # Match any alias of the canonical device to detect dups
+            # even when the stored device_id is a stale root.
+            to_root = RootAlias.physical_roots(
+                self.request.user.institution, devices
+            )
+            assigned = {}
+            for exist in DeviceBeneficiary.objects.filter(
+                device_id__in=list(to_root)
+            ).select_related("beneficiary"):
+                assigned.setdefault(to_root[exist.device_id], exist)
+
+            new_devices = []
             for dev in devices:
-                # Match any alias of the canonical device to detect dups
-                # even when the stored device_id is a stale root.
-                aliases = RootAlias.physical_aliases(
-                    self.request.user.institution, dev
-                )
-                exist = DeviceBeneficiary.objects.filter(
-                    device_id__in=aliases
-                ).first()
+                exist = assigned.get(to_root[dev])
                 if exist:
                     try:
                         short_id = dev.split(":")[1][:6].upper()
@@ -1201,7 +1207,8 @@ class AddDevicesBeneficiaryView(DashboardView, NotifyEmail, TemplateView):
                         short_id, exist.beneficiary.email
                     ))
                 else:
-                    self.beneficiary.add(dev)
+                    new_devices.append(dev)
+            self.beneficiary.add_many(new_devices)
 
             self.request.session["devices"] = []
             self.send_email_subscriptors()
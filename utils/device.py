@@ -87,10 +87,13 @@ def create_property(doc, user, commit=False):
     return SystemProperty(**data)
 
 
-def create_index(doc, user):
+def create_index(doc, user, writer=None):
     if not doc or not doc.get('uuid'):
         return []
 
     _uuid = doc['uuid']
     ev = json.dumps(doc)
+    if writer:
+        writer.add(user.institution, _uuid, ev)
+        return
     index(user.institution, _uuid, ev)